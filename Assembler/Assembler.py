@@ -2,9 +2,14 @@
 The main Python module implementing the Hack Assembler as outlined in chapter 6 of 'The Elements of Computing Systems' using the OOP API.
 
 Run using 'python Assembler.py <filename>' where <filename> is an .asm file or a folder containing .asm files  
+
+Options:
+	--profile [FILE]    report the time and memory of the preprocess, first_pass, second_pass and write phases
+	                    as JSON (see Tools/phaseprofile.py for --profile-top and --cprofile)
 """
 
-import os, sys
+import os, sys, argparse
+from contextlib import nullcontext
 from parser import Parser
 from symboltable import SymbolTable
 from codewriter import Code
@@ -12,23 +17,34 @@ from codewriter import Code
 class Assembler():
     '''
     Takes a single .asm file as input and outputs a .hack file with the same name.
+    The output is written to hack/<name>.hack unless another path is given.
     The assembling takes three passes.
         - Preprocess: Remove whitespace and comments
         - First Pass: Generate symbol table and remove symbolic labels
         - Second Pass: Translates the .asm file into a .hack file, line by line.
     '''
     
-    def __init__(self, filename):
-        self._input = self.preprocess(filename)
+    def __init__(self, filename, output = None, profiler = None):
+        self._profiler = profiler
+        with self.phase('preprocess'):
+            self._input = self.preprocess(filename)
         self._name = filename.split('/')[-1]
         self._name = self._name.split('.')[0]
+        self._hack = output if output is not None else 'hack/' + self._name + '.hack'
         self._table = SymbolTable()
-        self.first_pass()
-        self._parser = Parser(self._input)
-        self._output = []
-        self._code = Code()
-        self.second_pass()
-        self.write_output()
+        with self.phase('first_pass'):
+            self.first_pass()
+        with self.phase('second_pass'):
+            self._parser = Parser(self._input)
+            self._output = []
+            self._code = Code()
+            self.second_pass()
+        with self.phase('write'):
+            self.write_output()
+
+    def phase(self, name):
+        # times a phase of the assembly when a profiler is given
+        return self._profiler.phase(name) if self._profiler is not None else nullcontext()
 
     def preprocess(self, filename):
         with open(filename, 'r') as temp:
@@ -45,16 +61,21 @@ class Assembler():
     def first_pass(self):
         rom_addr = 0
         temp = []
+        # label -> ROM address, kept for tools that map addresses back to the code
+        self._labels = dict()
         for line in self._input:
             if '(' in line:
                 symbol = line[1:-1]
                 self._table.add_entry(symbol, rom_addr)
+                self._labels.setdefault(symbol, rom_addr)
             else:
                 temp += [line]
                 rom_addr += 1
         self._input = temp
     
     def second_pass(self):
+        # variable -> RAM address, in the order they were allocated
+        self._variables = dict()
         while self._parser.has_more_commands():
             self._parser.advance()
             if self._parser.command_type() == 'A':
@@ -69,7 +90,8 @@ class Assembler():
                 else:
                     # symbol is a variable
                     self._table.add_entry(value)
-                    value = self._table.get_address(value)
+                    self._variables[value] = self._table.get_address(value)
+                    value = self._variables[value]
                 self._output += ['0' + "{0:015b}".format(value) + '\n']
             elif self._parser.command_type() == 'C':
                 # C type command
@@ -78,25 +100,36 @@ class Assembler():
                                  + self._code.dest(self._parser.dest())
                                  + self._code.jump(self._parser.jump()) + '\n']
     
+    def labels(self):
+        # the (LABEL) table, label -> ROM address
+        return self._labels
+
+    def variables(self):
+        # the variables allocated from RAM[16], variable -> RAM address
+        return self._variables
+
     def write_output(self):
-        with open('hack/' + self._name + '.hack', 'w') as temp:
+        with open(self._hack, 'w') as temp:
             temp.writelines(self._output)
-        print(self._name + '.asm', 'translated to', 'hack/' + self._name + '.hack')
+        print(self._name + '.asm', 'translated to', self._hack)
     
        
 if __name__ == '__main__':
-    try:
-        filename = sys.argv[1]
-    except IndexError:
-        filename = ""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Tools'))
+    import phaseprofile
+    arguments = argparse.ArgumentParser(description='Assembles Hack .asm files into .hack files.')
+    arguments.add_argument('filename', nargs='?', default='', help='.asm file or directory of .asm files')
+    phaseprofile.add_arguments(arguments)
+    options = arguments.parse_args()
+    filename = options.filename
+    profiler = phaseprofile.from_options('assembler', options)
     if os.path.isdir(filename):
         # is a directory
         asmfiles = [filename + x for x in os.listdir(filename) if x.endswith(".asm")]
         for inputfile in asmfiles:
-            Assembler(inputfile)
+            Assembler(inputfile, profiler=profiler)
     elif filename and filename.endswith('.asm'):
         # is a single .asm file
-        Assembler(filename)
-    
-    
-        
\ No newline at end of file
+        Assembler(filename, profiler=profiler)
+    if profiler is not None:
+        profiler.finish()
@@ -0,0 +1,141 @@
+'''
+Defines the Disassembler, which turns Hack binary code back into assembly the Assembler accepts.
+
+The dest, comp and jump tables of Code are inverted once into a table of all 65536 words, giving the
+assembly of each A instruction and of each C instruction the Assembler can write (the ones starting with
+'111' and using a comp in the table), so disassembling is one lookup per word. Jumps are given labels: a
+jumping C instruction right after an '@n' jumps to n, so a label is put at n and the '@n' refers to it.
+Assembling the output gives the same binary code back.
+
+Reads .hack files (one 16 bit binary word per line) and packed ROM images (.bin or .rom, two bytes per
+word, most significant byte first).
+
+Run using 'python disassembler.py <filename> [-o OUTPUT] [--check]', the output is written next to the input
+as <name>.dis.asm unless another path is given. --check assembles the output again and compares it.
+'''
+
+import os, sys, argparse
+from array import array
+from codewriter import Code
+
+PACKED = ('.bin', '.rom')
+
+
+def decode_tables():
+    # (assembly of each 16 bit word or None, whether the word is a jumping C instruction)
+    code = Code()
+    dest = {int(bits, 2): name for name, bits in code._dest.items()}
+    comp = {int(bits, 2): name for name, bits in code._comp.items()}
+    jump = {int(bits, 2): name for name, bits in code._jump.items()}
+    table = ['@' + str(word) for word in range(0x8000)] + [None] * 0x8000
+    jumps = bytearray(0x10000)
+    for word in range(0xE000, 0x10000):
+        c = comp.get((word >> 6) & 0x7F)
+        if c is None:
+            continue
+        d, j = dest[(word >> 3) & 7], jump[word & 7]
+        table[word] = (d + '=' if d else '') + c + (';' + j if j else '')
+        jumps[word] = 1 if j else 0
+    return table, jumps
+
+
+_tables = None
+
+
+def tables():
+    # the decode tables, built on first use
+    global _tables
+    if _tables is None:
+        _tables = decode_tables()
+    return _tables
+
+
+def read_rom(filename):
+    # the words of a .hack file or a packed ROM image
+    if filename.endswith(PACKED):
+        words = array('H')
+        with open(filename, 'rb') as temp:
+            data = temp.read()
+        words.frombytes(data[:len(data) & ~1])
+        if sys.byteorder == 'little':
+            words.byteswap()
+        return words
+    with open(filename, 'r') as temp:
+        return array('H', [int(line, 2) for line in temp.read().split()])
+
+
+def write_packed(words, filename):
+    # write words as a packed ROM image
+    words = array('H', words)
+    if sys.byteorder == 'little':
+        words.byteswap()
+    with open(filename, 'wb') as temp:
+        temp.write(words.tobytes())
+
+
+class Disassembler():
+    '''
+    Takes a .hack file or packed ROM image and outputs the assembly, with labels at the jump targets.
+    '''
+
+    def __init__(self, filename, output = None):
+        self._words = read_rom(filename)
+        self._asm = output if output is not None else os.path.splitext(filename)[0] + '.dis.asm'
+        self._lines = self.disassemble(self._words)
+        self.write_output()
+
+    def disassemble(self, words):
+        table, jumps = tables()
+        lines = list(map(table.__getitem__, words))
+        if None in lines:
+            bad = [str(n) for n, line in enumerate(lines) if line is None]
+            raise ValueError('not an instruction the Assembler writes at ' + ', '.join(bad[:10])
+                             + (' and ' + str(len(bad) - 10) + ' more' if len(bad) > 10 else ''))
+        # jump targets -> label, from '@n' right before a jumping C instruction
+        self._labels = dict()
+        size = len(words)
+        for n in [n for n in range(1, size) if jumps[words[n]]]:
+            target = words[n - 1]
+            if target < 0x8000 and target <= size:
+                label = self._labels.setdefault(target, 'L' + str(target))
+                lines[n - 1] = '@' + label
+        output = []
+        start = 0
+        for address in sorted(self._labels):
+            output += lines[start:address]
+            output.append('(' + self._labels[address] + ')')
+            start = address
+        return output + lines[start:]
+
+    def labels(self):
+        # the reconstructed labels, ROM address -> label
+        return self._labels
+
+    def write_output(self):
+        with open(self._asm, 'w') as temp:
+            temp.write('\n'.join(self._lines) + '\n')
+        print(len(self._words), 'words disassembled to', self._asm + ',', len(self._labels), 'labels')
+
+    def check(self):
+        # assemble the output again, True if it gives the same words
+        from Assembler import Assembler
+        from contextlib import redirect_stdout
+        import io, tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            hack = os.path.join(directory, 'check.hack')
+            with redirect_stdout(io.StringIO()):
+                Assembler(self._asm, hack)
+            return read_rom(hack) == self._words
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Disassembles .hack files and packed ROM images.')
+    arguments.add_argument('filename', help='.hack file or packed ROM image (.bin, .rom)')
+    arguments.add_argument('-o', '--output', help='output .asm file (default <name>.dis.asm)')
+    arguments.add_argument('--check', action='store_true', help='assemble the output again and compare it')
+    options = arguments.parse_args()
+    disassembler = Disassembler(options.filename, options.output)
+    if options.check:
+        same = disassembler.check()
+        print('round trip:', 'same binary code' if same else 'DIFFERENT binary code')
+        sys.exit(0 if same else 1)
@@ -9,7 +9,7 @@ class SymbolTable():
     def __init__(self):
         self._varaddr = 16
         self._table = {'SP':0, 'LCL':1, 'ARG':2, 'THIS':3, 'THAT':4, 
-                      'SCREEN':16384, 'KEYBOARD':24576, 
+                      'SCREEN':16384, 'KEYBOARD':24576, 'KBD':24576,
                       'R0':0, 'R1':1, 'R2':2, 'R3':3, 
                       'R4':4, 'R5':5, 'R6':6, 'R7':7, 
                       'R8':8, 'R9':9, 'R10':10, 'R11':11, 
@@ -5,18 +5,30 @@ The JackAnalyzer class communicates between the tokenizer and compilation engine
 
 To use the compiler run  'python JackCompiler.py <filename>' where <filename> is a .jack file or a directory containing .jack files.
 
+Options:
+	--backend vm|hack   write a .vm file per class (default), or one Hack .asm file for the whole program,
+	                    in which case .vm files in the directory without a .jack source (e.g. the Jack OS)
+	                    are translated into the same .asm file
+	--xml               also write the parse tree of each class as a .xml file, from the same parse
+	--profile [FILE]    report the time and memory of the index, parse, compile and write phases as JSON
+	                    (see Tools/phaseprofile.py for --profile-top and --cprofile)
+
 """
 
-import os, sys
+import os, sys, argparse
+from contextlib import nullcontext
 from tokenizer import JackTokenizer
 from engine import CompilationEngine
+from hackwriter import HackWriter
+from classindex import ClassIndex
 
 class JackAnalyzer():
     '''
     Top-level driver that sets up and invokes the other modules.
     '''
 
-    def __init__(self, filename):
+    def __init__(self, filename, backend = 'vm', xml = False, profiler = None, **options):
+        self._profiler = profiler
         if os.path.isdir(filename):
             # directory input
             self._files = [filename + '/' + x for x in os.listdir(filename) if x.endswith(".jack")]
@@ -33,15 +45,57 @@ class JackAnalyzer():
             self._isdir = False
             return
         self._output = []
+        # signatures of every class in the directory, used to check and resolve calls
+        with self.phase('index'):
+            self._index = ClassIndex(filename if self._isdir else (os.path.dirname(filename) or '.'))
+        if backend == 'hack':
+            self.compile_hack(filename, xml, **options)
+            return
+        for file in self._files:
+            self._tokenizer = JackTokenizer(file)
+            self._code = CompilationEngine(self._tokenizer, index=self._index, xml=xml, profiler=self._profiler)
+
+    def phase(self, name):
+        # times a phase of the compilation when a profiler is given
+        return self._profiler.phase(name) if self._profiler is not None else nullcontext()
+
+    def compile_hack(self, filename, xml = False, **options):
+        # the VM Translator's CodeWriter writes the calling convention and translates the OS .vm files
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Virtual_Machine'))
+        from parser import Parser
+        from codewriter import CodeWriter
+        from linker import Linker
+        code = CodeWriter(self._name.replace('.vm','.asm'), **options)
+        if self._isdir:
+            code.write_init()
         for file in self._files:
             self._tokenizer = JackTokenizer(file)
-            self._code = CompilationEngine(self._tokenizer)
+            self._code = CompilationEngine(self._tokenizer, HackWriter(code, file.replace('.jack','').split('/')[-1]),
+                                           self._index, xml, self._profiler)
+        if self._isdir:
+            for file in os.listdir(filename):
+                if file.endswith('.vm') and file.replace('.vm','.jack') not in os.listdir(filename):
+                    code.filename(file.replace('.vm',''))
+                    with self.phase('translate'):
+                        code.write_commands(Parser(filename + '/' + file).commands())
+        with self.phase('write'):
+            code.close()
+        with self.phase('link'):
+            Linker(self._name.replace('.vm','.asm'))
 
 
 
 if __name__ == '__main__':
-    try:
-        filename = sys.argv[1]
-    except IndexError:
-        filename = ""
-    JackAnalyzer(filename)
+    arguments = argparse.ArgumentParser(description='Compiles .jack files into VM code or Hack assembly.')
+    arguments.add_argument('filename', nargs='?', default='', help='.jack file or directory of .jack files')
+    arguments.add_argument('--backend', choices=['vm', 'hack'], default='vm',
+                           help='write .vm files (default) or a single .asm file')
+    arguments.add_argument('--xml', action='store_true', help='also write the parse tree of each class as XML')
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Tools'))
+    import phaseprofile
+    phaseprofile.add_arguments(arguments)
+    options = arguments.parse_args()
+    profiler = phaseprofile.from_options('jackcompiler', options)
+    JackAnalyzer(options.filename, options.backend, options.xml, profiler)
+    if profiler is not None:
+        profiler.finish()
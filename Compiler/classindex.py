@@ -0,0 +1,110 @@
+'''
+Module implementing the ClassIndex of the JACK compiler, the signatures of every class in a program.
+
+Before compiling, the declarations of all .jack files in a directory are read (subroutine bodies are
+skipped), giving for each class its subroutines with their kind, return type and parameters. The index
+is cached in '.classindex.json' in the directory, an entry is only read again when its file's size or
+modification time changed. The cache is replaced in one step, so builds running in parallel read either
+the old or the new index, never part of one.
+'''
+
+import os, json, tempfile
+from collections import namedtuple
+from tokenizer import JackTokenizer
+
+Signature = namedtuple('Signature', ['kind', 'type', 'parameters'])
+
+CACHE = '.classindex.json'
+
+class ClassIndex():
+    '''
+    Maps class name -> subroutine name -> Signature, where parameters is a list of (type, name) pairs.
+    '''
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._classes = dict()
+        cache = self.read_cache()
+        entries = dict()
+        for file in sorted(os.listdir(directory)):
+            if not file.endswith('.jack'):
+                continue
+            status = os.stat(os.path.join(directory, file))
+            stamp = [status.st_size, status.st_mtime_ns]
+            entry = cache.get(file)
+            if entry is None or entry['stamp'] != stamp:
+                entry = {'stamp': stamp, 'classes': self.scan(os.path.join(directory, file))}
+            entries[file] = entry
+            for name, subroutines in entry['classes'].items():
+                self._classes[name] = {x: Signature(*signature) for x, signature in subroutines.items()}
+        if entries != cache:
+            self.write_cache(entries)
+
+    def read_cache(self):
+        try:
+            with open(os.path.join(self._directory, CACHE), 'r') as temp:
+                return json.load(temp)
+        except (OSError, ValueError):
+            return dict()
+
+    def write_cache(self, entries):
+        # write to a temporary file and move it over the cache, which replaces it atomically
+        try:
+            handle, name = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(handle, 'w') as temp:
+                json.dump(entries, temp)
+            os.replace(name, os.path.join(self._directory, CACHE))
+        except OSError:
+            # the index still works without a cache, e.g. in a read-only directory
+            pass
+
+    def scan(self, filename):
+        # {class name: {subroutine name: [kind, type, parameters]}} from the declarations of a .jack file
+        tokenizer = JackTokenizer(filename)
+        classes = dict()
+        subroutines = None
+        depth = 0
+        tokenizer.advance()
+        while tokenizer.has_more_tokens():
+            token = tokenizer.get_token()
+            if depth == 0 and tokenizer.keyword() == 'class':
+                tokenizer.advance()
+                subroutines = classes[tokenizer.get_token()] = dict()
+            elif depth == 1 and tokenizer.is_valid_subroutine():
+                kind = token
+                tokenizer.advance()
+                return_type = tokenizer.get_token()
+                tokenizer.advance()
+                name = tokenizer.get_token()
+                tokenizer.advance()
+                # '(' parameterList ')'
+                parameters = []
+                tokenizer.advance()
+                while tokenizer.symbol() != ')':
+                    if tokenizer.symbol() != ',':
+                        parameter_type = tokenizer.get_token()
+                        tokenizer.advance()
+                        parameters.append([parameter_type, tokenizer.get_token()])
+                    tokenizer.advance()
+                subroutines[name] = [kind, return_type, parameters]
+            elif tokenizer.symbol() == '{':
+                depth += 1
+            elif tokenizer.symbol() == '}':
+                depth -= 1
+            tokenizer.advance()
+        return classes
+
+    def classes(self):
+        return list(self._classes)
+
+    def lookup(self, class_name, subroutine):
+        # the Signature of class_name.subroutine, None if the class or subroutine is not in the index
+        return self._classes.get(class_name, dict()).get(subroutine)
+
+    def nargs(self, function):
+        # number of VM arguments of 'Class.subroutine', counting 'this' for methods, None if unknown
+        class_name, _, subroutine = function.partition('.')
+        signature = self.lookup(class_name, subroutine)
+        if signature is None:
+            return None
+        return len(signature.parameters) + (1 if signature.kind == 'method' else 0)
@@ -1,34 +1,49 @@
 '''
 Module implementing the CompilationEngine component of the JACK compiler.
 
-The CompilationEngine parses Jack code assuming that the input follows valid grammar rules 
+The CompilationEngine writes VM code for the parse tree built by the JackParser, assuming that the input
+follows valid grammar rules. The same tree can also be written as XML in the same run.
 
 '''
 
+from contextlib import nullcontext
 from symboltable import SymbolTable 
 from vmwriter import VMWriter
+from syntaxtree import JackParser
+from tokenizer import INTEGER, STRING, KEYWORD
+from xmlwriter import XMLWriter
 
 class CompilationEngine():
     '''
-    Parses a stream of jack tokens recursively.
+    Compiles the parse tree of a class recursively.
     '''
 
-    def __init__(self, tokenizer):
+    def __init__(self, tokenizer, writer = None, index = None, xml = False, profiler = None):
         self._name = tokenizer.get_filename().replace('.jack','')
-        # tokenizer for input
-        self._tokenizer = tokenizer
+        # times the phases of the compilation, if given
+        self._profiler = profiler
+        # parse tree of the class, read once from the tokenizer
+        with self.phase('parse'):
+            self._tree = JackParser(tokenizer).parse()
         # symbol table
         self._symbols = SymbolTable()
-        # vm output fiole
-        self._writer = VMWriter(self._name + '.vm')
-        # Input should be a tokenized .jack file containing one class
-        assert self._tokenizer.has_more_tokens()
-        self._tokenizer.advance()
+        # signatures of all classes in the program, if known
+        self._index = index
+        # vm output fiole, unless another writer such as a HackWriter is given
+        self._writer = writer if writer is not None else VMWriter(self._name + '.vm')
         self._class = None
         self._subroutine = None
         self._counter = 0
-        self.compile_class()
-        self.close()
+        if xml:
+            # the parse tree as XML, next to the .jack file
+            with self.phase('xml'):
+                tree = XMLWriter(self._name + '.xml')
+                tree.write_tree(self._tree)
+                tree.close()
+        with self.phase('compile'):
+            self.compile_class(self._tree)
+        with self.phase('write'):
+            self.close()
 
 
     def change_name(self, name):
@@ -37,142 +52,74 @@ class CompilationEngine():
     def get_name(self, name):
         return self._name
 
-    def get_token(self):
-        return self._tokenizer._token
+    def get_tree(self):
+        return self._tree
 
-    def get_type(self):
-        return self._tokenizer._type
+    def phase(self, name):
+        # times a phase of the compilation when a profiler is given
+        return self._profiler.phase(name) if self._profiler is not None else nullcontext()
 
     def close(self):
-        # close the output file at the end
+        # close the output file at the end, report the vm code removed as unreachable
         self._writer.close()
+        print(self._class + ':', 'removed', self._writer.removed(), 'unreachable VM lines')
 
-    def compile_class(self):
+    def resolve(self, token):
+        # the Symbol of the variable named by token, which has to be defined
+        symbol = self._symbols.resolve(token[0])
+        assert symbol is not None, self._name + '.jack:' + str(token[2]) + ': unknown variable ' + token[0]
+        return symbol
+
+    def compile_class(self, node):
         # 'class' className '{' classVarDec* subroutineDec* '}'
-        # keyword - class
-        assert self._tokenizer.keyword() == 'class'
-        self._tokenizer.advance()
-        # identifier - className
-        assert self._tokenizer.identifier()
-        self._class = self._tokenizer.identifier()
-        self._tokenizer.advance()
-        # sybmol - '{'
-        assert self._tokenizer.symbol() == '{', "expected '{' but got " + self.get_token()
-        self._tokenizer.advance()
-        # classVarDec*
-        while self._tokenizer.is_valid_class_variable():
-            self.compile_class_var()
-        # subroutineBody*
-        while self._tokenizer.is_valid_subroutine():
-            self.compile_subroutine()
-        # sybmol - '}'
-        assert self._tokenizer.symbol() == '}', "expected '}' but got " + self.get_token()
-        self._tokenizer.advance()
-        # assuming .jack file is properly formatted, there should be no more tokens
-        assert not self._tokenizer.has_more_tokens()
-
-
-    def compile_class_var(self):
+        children = node.children
+        self._class = children[1][0]
+        for child in children[3:-1]:
+            if child.kind == 'classVarDec':
+                self.compile_class_var(child)
+            else:
+                self.compile_subroutine(child)
+
+
+    def compile_class_var(self, node):
         # ('static'|'field') type varName (',' varName)* ';'
-        assert self._tokenizer.is_valid_class_variable()
-        # keyword - 'static' or 'field'
-        temp_kind = self._tokenizer.get_token()
-        self._tokenizer.advance()
-        # type - 'int' or 'char' or 'boolean' or className
-        assert self._tokenizer.is_valid_type()
-        temp_type = self._tokenizer.get_token()
-        self._tokenizer.advance()
-        # identifier - varName
-        assert self._tokenizer.identifier()
-        temp_name = self._tokenizer.get_token()
-        self._symbols.define(temp_name, temp_type, temp_kind)
-        self._tokenizer.advance()
-        # recursively check for (',' varName)*  structure
-        while self._tokenizer.symbol() == ',':
-            self._tokenizer.advance()
-            # identifier - varName
-            assert self._tokenizer.identifier()
-            temp_name = self._tokenizer.get_token()
-            self._symbols.define(temp_name, temp_type, temp_kind)
-            # symbol - ',' or ';'
-            self._tokenizer.advance()
-        # next token should be a ';'
-        assert self._tokenizer.symbol() == ';', "expected ';' but got " + self.get_token()
-        self._tokenizer.advance()
-
-
-    def compile_subroutine(self):
+        children = node.children
+        temp_kind = children[0][0]
+        temp_type = children[1][0]
+        # every other token from the first varName is a name, followed by ',' or ';'
+        for name in children[2:-1:2]:
+            self._symbols.define(name[0], temp_type, temp_kind)
+
+
+    def compile_subroutine(self, node):
         # ('constructor'|'method'|'function') ('void'| type) subroutineName '(' parameterList ')' subroutineBody
-        assert self._tokenizer.is_valid_subroutine()
+        children = node.children
         self._symbols.start_subroutine()
         # keyword - constructor or method or function
-        self._subroutine = self._tokenizer.get_token()
+        self._subroutine = children[0][0]
         if self._subroutine == 'method':
             # in the case of method, add 'this' to symbol table
             self._symbols.define('this', self._class, 'argument')
-        self._tokenizer.advance()
-        # keyword - type or void
-        assert self._tokenizer.is_valid_subroutine_type()
-        self._tokenizer.advance()
-        # identifier - subroutineName
-        assert self._tokenizer.identifier()
-        temp_name = self._tokenizer.identifier()
-        self._tokenizer.advance()
-        # symbol - '('
-        assert self._tokenizer.symbol() == '('
-        self._tokenizer.advance()
         # parameterList
-        if self._tokenizer.is_valid_type():
-            self.compile_parameter_list()
-        # symbol - '('
-        assert self._tokenizer.symbol() == ')'
-        self._tokenizer.advance()
-        temp_name = self._class + '.' + temp_name
-        # symbol - '{'
-        assert self._tokenizer.symbol() == '{'
+        self.compile_parameter_list(children[4])
+        temp_name = self._class + '.' + children[2][0]
         # subroutineBody
-        self.compile_subroutine_body(temp_name)
+        self.compile_subroutine_body(children[6], temp_name)
         self._writer.write_comment('end subroutine ' + temp_name)
 
 
-    def compile_parameter_list(self):
+    def compile_parameter_list(self, node):
         # ( (type varName) (',' type varName)* )?
-        # only called if non-empty parameter list
-        assert self._tokenizer.is_valid_type()
-        # type - int or char or boolean or className
-        temp_type = self._tokenizer.get_token()
-        self._tokenizer.advance()
-        # identifier - varName
-        assert self._tokenizer.identifier()
-        temp_name = self._tokenizer.get_token()
-        self._symbols.define(temp_name, temp_type, 'argument')
-        self._tokenizer.advance()
-        while self._tokenizer.symbol() == ',':
-            # symbol - ','
-            self._tokenizer.advance()
-            assert self._tokenizer.is_valid_type()
-            # type - int or char or boolean or className
-            temp_type = self._tokenizer.get_token()
-            self._tokenizer.advance()
-            # identifier - varName
-            assert self._tokenizer.identifier()
-            temp_name = self._tokenizer.get_token()
-            self._symbols.define(temp_name, temp_type, 'argument')
-            self._tokenizer.advance()
-        # symbol - ')'
-        assert self._tokenizer.symbol() == ')'
-
-
-    def compile_subroutine_body(self, name):
+        children = node.children
+        for i in range(0, len(children), 3):
+            self._symbols.define(children[i + 1][0], children[i][0], 'argument')
+
+
+    def compile_subroutine_body(self, node, name):
         # '{' varDec* statements '}'
-        # symbol - '{'
-        assert self._tokenizer.symbol() == '{'
-        self._tokenizer.advance()
-        # varDec
-        num_locals = 0
-        while self._tokenizer.keyword() == 'var':
-            # remember that compiling variables writes NO vm code
-            num_locals += self.compile_var()
+        children = node.children
+        # remember that compiling variables writes NO vm code
+        num_locals = sum(self.compile_var(child) for child in children[1:-2])
         self._writer.write_function(name, num_locals)
         if self._subroutine == 'method':
             # set this, in the case of a method
@@ -182,106 +129,52 @@ class CompilationEngine():
             # allocate object
             self._writer.write_object_alloc(self._symbols.var_count('field'))
         # statements
-        self.compile_statements()
-        # symbol - '{'
-        assert self._tokenizer.symbol() == '}'
-        self._tokenizer.advance()
+        self.compile_statements(children[-2])
 
 
-    def compile_var(self):
+    def compile_var(self, node):
         # 'var' type varName (',' varName)* ';'
-        assert self._tokenizer.is_valid_variable()
-        # keyword - 'var'
-        self._tokenizer.advance()
-        # type - int or char or boolean or className
-        assert self._tokenizer.is_valid_type()
-        temp_type = self._tokenizer.get_token()
-        self._tokenizer.advance()
-        # identifier - varName
-        assert self._tokenizer.identifier()
-        temp_name = self._tokenizer.get_token()
-        self._symbols.define(temp_name, temp_type, 'local')
-        num_locals = 1
-        self._tokenizer.advance()
-        while self._tokenizer.symbol() == ',':
-            # symbol - ','
-            self._tokenizer.advance()
-            # identifier - varName
-            assert self._tokenizer.identifier()
-            temp_name = self._tokenizer.get_token()
-            self._symbols.define(temp_name, temp_type, 'local')
-            num_locals += 1
-            self._tokenizer.advance()
-        # symbol - ';'
-        assert self._tokenizer.symbol() == ';'
-        self._tokenizer.advance()
-        return num_locals
-
-
-    def compile_statements(self):
+        children = node.children
+        temp_type = children[1][0]
+        names = children[2:-1:2]
+        for name in names:
+            self._symbols.define(name[0], temp_type, 'local')
+        return len(names)
+
+
+    def compile_statements(self, node):
         # statement*
-        while self._tokenizer.is_valid_statement():
-            if self._tokenizer.keyword() == 'let':
-                # letStatement
-                self.compile_let()
-            elif self._tokenizer.keyword() == 'if':
-                # ifStatement
-                self.compile_if()
-            elif self._tokenizer.keyword() == 'while':
-                # whileStatement
-                self.compile_while()
-            elif self._tokenizer.keyword() == 'do':
-                # doStatement
-                self.compile_do()
-            elif self._tokenizer.keyword() == 'return':
-                # returnStatement
-                self.compile_return()
-        # symbol - '}'
-        assert self._tokenizer.symbol() == '}'
-
-    def compile_let(self):
+        for child in node.children:
+            if child.kind == 'letStatement':
+                self.compile_let(child)
+            elif child.kind == 'ifStatement':
+                self.compile_if(child)
+            elif child.kind == 'whileStatement':
+                self.compile_while(child)
+            elif child.kind == 'doStatement':
+                self.compile_do(child)
+            else:
+                self.compile_return(child)
+
+    def compile_let(self, node):
         # 'let' varName ('[' expression ']')? '=' expression ';'
-        # keyword - 'let'
-        assert self._tokenizer.keyword() == 'let'
-        self._tokenizer.advance()
-        # identifier - varName
-        assert self._tokenizer.identifier()
-        if self._tokenizer.peek() == '=':
+        children = node.children
+        symbol = self.resolve(children[1])
+        if len(children) == 5:
             # varName '=' expression ';'
-            var_kind = self._symbols.kind_of(self._tokenizer.identifier())
-            var_index = self._symbols.index_of(self._tokenizer.identifier())
-            self._tokenizer.advance()
-            # next token is '='
-            self._tokenizer.advance()
             # evaluate RHS expression, pop into variable
-            self.compile_expression()
-            if var_kind == 'field':
-                self._writer.write_pop('this', var_index)
-            else:
-                self._writer.write_pop(var_kind, var_index)
-            # expression ends with a ';'
-            assert self._tokenizer.symbol() == ';', "expected ';' but got " + self.get_token()
-            self._tokenizer.advance()
-        elif self._tokenizer.peek() == '[':
+            self.compile_expression(children[3])
+            self._writer.write_pop(symbol.segment, symbol.index)
+        else:
             # varName '[' expression ']' '=' expression ';'
             # write base address to stack
-            self._writer.write_push(self._symbols.kind_of(self._tokenizer.identifier()),
-                                    self._symbols.index_of(self._tokenizer.identifier()))
-            self._tokenizer.advance()
-            # symbol - '['
-            self._tokenizer.advance()
+            self._writer.write_push(symbol.segment, symbol.index)
             # expression - represents array index
-            self.compile_expression()
+            self.compile_expression(children[3])
             # base address + array index
             self._writer.write_arithmetic('add')
-            # symbol - '['
-            assert self._tokenizer.symbol() == ']'
-            self._tokenizer.advance()
-            # symbol - '='
-            assert self._tokenizer.symbol() == '='
-            self._tokenizer.advance()
             # expression
-            self.compile_expression()
+            self.compile_expression(children[6])
             # pop RHS value into temp segment
             self._writer.write_pop('temp', 1)
             # align that with array[i]
@@ -290,280 +183,197 @@ class CompilationEngine():
             self._writer.write_push('temp', 1)
             # pop value into correct array index
             self._writer.write_pop('that', 0)
-            # symbol - ';'
-            assert self._tokenizer.symbol() == ';', "expected ';' but got " + self.get_token()
-            self._tokenizer.advance()
 
 
-    def compile_if(self):
-        # 'if' '(' expression ')' ('else' '{' statements '}')?
-        # keyword - if
-        assert self._tokenizer.keyword() == 'if'
+    def constant_condition(self, node):
+        # returns True or False if the condition is the literal 'true' or 'false', otherwise None
+        term = node.children[0].children
+        if len(node.children) == 1 and len(term) == 1 and term[0][1] == KEYWORD and term[0][0] in ['true','false']:
+            return term[0][0] == 'true'
+        return None
+
+
+    def compile_if(self, node):
+        # 'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
+        children = node.children
         self._writer.write_comment('if statement')
-        self._tokenizer.advance()
-        # symbol - (
-        assert self._tokenizer.symbol() == '(', "expected '(' but got " + self.get_token()
-        self._tokenizer.advance()
-        # expression
-        self.compile_expression()
-        self._writer.write_arithmetic('not')
-        label_num = str(self._counter)
-        self._counter += 1
-        self._writer.write_if('ELSE'+label_num)
-        # symbol - )
-        assert self._tokenizer.symbol() == ')', "expected '(' but got " + self.get_token()
-        self._tokenizer.advance()
-        # symbol - '{'
-        assert self._tokenizer.symbol() == '{'
-        self._tokenizer.advance()
-        # statements
-        self.compile_statements()
-        # symbol - '}'
-        assert self._tokenizer.symbol() == '}'
-        self._tokenizer.advance()
-        self._writer.write_goto('IF'+label_num)
-        self._writer.write_label('ELSE'+label_num)
+        constant = self.constant_condition(children[2])
+        if constant is None:
+            # expression
+            self.compile_expression(children[2])
+            self._writer.write_arithmetic('not')
+            label_num = str(self._counter)
+            self._counter += 1
+            self._writer.write_if('ELSE'+label_num)
+        # statements, only one of the branches is compiled for a keywordConstant
+        mark = self._writer.mark()
+        self.compile_statements(children[5])
+        if constant is False:
+            self._writer.discard(mark)
+        if constant is None:
+            self._writer.write_goto('IF'+label_num)
+            self._writer.write_label('ELSE'+label_num)
         # check for else
-        if self._tokenizer.keyword() == 'else':
+        if len(children) > 7:
             # 'else' '{' statements '}'
-            # keyword - 'else'
-            self._tokenizer.advance()
-            # symbol - '{'
-            assert self._tokenizer.symbol() == '{', "expected '{' but got " + self.get_token()
-            self._tokenizer.advance()
-            # statements
-            self.compile_statements()
-            # symbol - '}'
-            assert self._tokenizer.symbol() == '}', "expected '}' but got " + self.get_token()
-            self._tokenizer.advance()
-        self._writer.write_label('IF'+label_num)
-
-
-    def compile_while(self):
+            mark = self._writer.mark()
+            self.compile_statements(children[9])
+            if constant is True:
+                self._writer.discard(mark)
+        if constant is None:
+            self._writer.write_label('IF'+label_num)
+
+
+    def compile_while(self, node):
         # 'while' '(' expression ')' '{' statements '}'
-        # keyword - 'while'
-        assert self._tokenizer.keyword() == 'while'
+        children = node.children
         # labels for ifgoto and goto vm commands
         label_num = str(self._counter)
         self._counter += 1
-        self._tokenizer.advance()
-        # symbol - '('
-        assert self._tokenizer.symbol() == '('
-        self._tokenizer.advance()
+        mark = self._writer.mark()
         self._writer.write_label('WHILE'+label_num)
-        # expression
-        self.compile_expression()
-        self._writer.write_arithmetic('not')
-        self._writer.write_if('ELSE'+label_num)
-        # symbol - ')'
-        assert self._tokenizer.symbol() == ')'
-        self._tokenizer.advance()
-        # symbol - '{'
-        assert self._tokenizer.symbol() == '{'
-        self._tokenizer.advance()
-        # statements
-        self.compile_statements()
+        constant = self.constant_condition(children[2])
+        if constant is None:
+            # expression
+            self.compile_expression(children[2])
+            self._writer.write_arithmetic('not')
+            self._writer.write_if('ELSE'+label_num)
+        # statements, no test is needed for a keywordConstant
+        self.compile_statements(children[5])
         self._writer.write_goto('WHILE'+label_num)
-        self._writer.write_label('ELSE'+label_num)
-        # symbol - '}'
-        assert self._tokenizer.symbol() == '}'
-        self._tokenizer.advance()
+        if constant is None:
+            self._writer.write_label('ELSE'+label_num)
+        elif constant is False:
+            # the loop body never runs
+            self._writer.discard(mark)
 
-    def compile_do(self):
+    def compile_do(self, node):
         # 'do' subroutineCall ';'
-        assert self._tokenizer.keyword() == 'do'
-        # keyword - 'do'
-        self._tokenizer.advance()
-        # identifier - subroutineCall
-        assert self._tokenizer.identifier()
-        # outer subroutine must be void function
-        self.compile_subroutine_call()
-        # symbol - ';'
-        assert self._tokenizer.symbol() == ';'
+        self.compile_subroutine_call(node.children[1:-1])
         # discard void function default return value
         self._writer.write_pop('temp',0)
-        self._tokenizer.advance()
 
 
 
-    def compile_return(self):
+    def compile_return(self, node):
         # 'return' expression? ';'
-        # keyword - 'return'
-        assert self._tokenizer.keyword() == 'return'
+        children = node.children
         self._writer.write_comment('return statement')
-        self._tokenizer.advance()
-        # expression?
-        if self._tokenizer.symbol() == ';':
+        if len(children) == 2:
             # symbol - ';' (void function)
             self._writer.write_push('constant', 0)
-            self._tokenizer.advance()
         else:
             # expression (not void)
-            self.compile_expression()
-            # symbol - ';'
-            assert self._tokenizer.symbol() == ';'
-            self._tokenizer.advance()
+            self.compile_expression(children[1])
         self._writer.write_return()
 
 
-    def compile_expression(self):
+    def compile_expression(self, node):
         # term (op term)*
+        children = node.children
         # term
-        self.compile_term()
-        # check for op
-        while self._tokenizer.is_valid_operator():
-            # op
-            temp_op = self._tokenizer.symbol()
-            self._tokenizer.advance()
+        self.compile_term(children[0])
+        for i in range(1, len(children), 2):
             # term
-            self.compile_term()
+            self.compile_term(children[i + 1])
             # write operator vm command, postfix order
-            self._writer.write_operator(temp_op)
+            self._writer.write_operator(children[i][0])
 
 
-    def compile_term(self):
+    def compile_term(self, node):
         # integerConstant | stringConstant | keywordConstant | varName |
         # varName '[' expression']' | subroutineCall | '(' expression ')' | unaryOp term
-        if self._tokenizer.int_value() is not None:
+        children = node.children
+        token = children[0]
+        if token[1] == INTEGER:
             # integerConstant
-            self._writer.write_push('constant', self._tokenizer.int_value())
-            self._tokenizer.advance()
-        elif self._tokenizer.string_value() is not None:
+            assert int(token[0]) <= 32767, self._name + '.jack:' + str(token[2]) + ': integer too large ' + token[0]
+            self._writer.write_push('constant', token[0])
+        elif token[1] == STRING:
             # stringConstant
-            self._writer.write_string_constant(self._tokenizer.string_value())
-            self._tokenizer.advance()
-        elif self._tokenizer.keyword() is not None:
+            self._writer.write_string_constant(token[0])
+        elif token[1] == KEYWORD:
             # keywordConstant
-            self._writer.write_keyword_constant(self._tokenizer.keyword())
-            self._tokenizer.advance()
-        elif self._tokenizer.symbol() == '(':
+            self._writer.write_keyword_constant(token[0])
+        elif token[0] == '(':
             # '(' expression ')'
-            self._tokenizer.advance()
-            self.compile_expression()
-            assert self._tokenizer.symbol() == ')'
-            self._tokenizer.advance()
-        elif self._tokenizer.is_valid_unary():
+            self.compile_expression(children[1])
+        elif len(children) == 2:
             # unaryOp term
-            temp_op = self._tokenizer.symbol()
-            self._tokenizer.advance()
-            # term
-            self.compile_term()
+            self.compile_term(children[1])
             # write operator vm command, postfix order
-            self._writer.write_unary(temp_op)
-        elif self._tokenizer.identifier() and self._tokenizer.peek() == '[':
+            self._writer.write_unary(token[0])
+        elif len(children) == 1:
+            # varName
+            symbol = self.resolve(token)
+            self._writer.write_push(symbol.segment, symbol.index)
+        elif children[1][0] == '[':
             # varName '[' expression']'
             # process array name, push associated value onto stack
-            self._writer.write_push(self._symbols.kind_of(self._tokenizer.identifier()),
-                                    self._symbols.index_of(self._tokenizer.identifier()))
-            self._tokenizer.advance()
-            # process [ symbol
-            self._tokenizer.advance()
+            symbol = self.resolve(token)
+            self._writer.write_push(symbol.segment, symbol.index)
             # expects expression, value is pushed onto the stack
-            self.compile_expression()
+            self.compile_expression(children[2])
             # setup pointer to array element
             self._writer.write_operator('+')
             self._writer.write_pop('pointer', 1)
             # push array value onto stack
             self._writer.write_push('that', 0)
-            # expects closing square bracket
-            assert self._tokenizer.symbol() == ']'
-            self._tokenizer.advance()
-        elif self._tokenizer.identifier() and self._tokenizer.peek() in ['(','.']:
-            # subroutineCall
-            self.compile_subroutine_call()
-        elif self._symbols.exists(self._tokenizer.identifier()):
-            # varName
-            var_name = self._tokenizer.identifier()
-            var_kind = self._symbols.kind_of(var_name)
-            var_index = self._symbols.index_of(var_name)
-            if var_kind == 'field':
-                # push field var onto stack
-                self._writer.write_push('this', var_index)
-            else:
-                self._writer.write_push(var_kind, var_index)
-            self._tokenizer.advance()
         else:
-            assert False, "unknown token: " + self.get_token() + " with type " + self.get_type()
+            # subroutineCall
+            self.compile_subroutine_call(children)
+
+    def signature(self, class_name, subroutine):
+        # the callee's Signature from the class index, None if it is not part of the program (e.g. the OS)
+        if self._index is None:
+            return None
+        return self._index.lookup(class_name, subroutine)
 
-    def compile_subroutine_call(self):
+    def check_call(self, name, signature, nargs):
+        # a call must pass as many VM arguments as the callee takes
+        if signature is not None:
+            expected = len(signature.parameters) + (1 if signature.kind == 'method' else 0)
+            assert nargs == expected, name + ' takes ' + str(expected) + ' arguments but is given ' + str(nargs)
+
+    def compile_subroutine_call(self, tokens):
         # subroutineName '(' expressionList ')'| (className | varName) '.' subroutineName '(' expressionList ')'
-        assert self._tokenizer.identifier() and self._tokenizer.peek() in ['(','.']
-        if self._tokenizer.identifier() and self._tokenizer.peek() == '(':
+        # tokens are the children of the doStatement or term making the call, ending with ')'
+        name = tokens[0][0]
+        symbol = self._symbols.resolve(name)
+        if tokens[1][0] == '(':
             # subroutineName '(' expressionList ')'
             # method (in current class)
-            temp_name = self._class + '.' + self._tokenizer.identifier()
-            self._tokenizer.advance()
-            # symbol - '('
-            self._tokenizer.advance()
-            # push this onto the stack
-            self._writer.write_push('pointer',0)
-            temp_nargs = 1
-            # expressionList
-            temp_nargs += self.compile_expression_list()
-            self._writer.write_call(temp_name, temp_nargs)
-            # symbol - ')'
-            assert  self._tokenizer.symbol() == ')'
-            self._tokenizer.advance()
-        elif self._symbols.exists(self._tokenizer.identifier()) and self._tokenizer.peek() == '.':
+            temp_name = self._class + '.' + name
+            signature = self.signature(self._class, name)
+            if signature is not None and signature.kind != 'method':
+                # a function or constructor of this class, no object is passed
+                temp_nargs = 0
+            else:
+                # push this onto the stack
+                self._writer.write_push('pointer',0)
+                temp_nargs = 1
+        elif symbol is not None:
             # varName '.' subroutineName '(' expressionList ')'
             # varName (object)
-            temp_name = self._tokenizer.identifier()
             # push object address onto stack, this is an implicit argument
-            if self._symbols.kind_of(temp_name) == 'field':
-                self._writer.write_push('this',
-                                        self._symbols.index_of(temp_name))
-            else: 
-                self._writer.write_push(self._symbols.kind_of(temp_name),
-                                        self._symbols.index_of(temp_name))
+            self._writer.write_push(symbol.segment, symbol.index)
             # change name to class name
-            temp_name = self._symbols.type_of(temp_name)
+            temp_name = symbol.type + '.' + tokens[2][0]
+            signature = self.signature(symbol.type, tokens[2][0])
             temp_nargs = 1
-            self._tokenizer.advance()
-            # symbol - '.'
-            temp_name += self._tokenizer.get_token()
-            self._tokenizer.advance()
-            # subroutineName
-            assert self._tokenizer.identifier()
-            temp_name += self._tokenizer.identifier()
-            self._tokenizer.advance()
-            # symbol - '('
-            assert self._tokenizer.symbol() == '('
-            self._tokenizer.advance()
-            # expressionList
-            temp_nargs += self.compile_expression_list()
-            self._writer.write_call(temp_name, temp_nargs)
-            # symbol - '('
-            assert  self._tokenizer.symbol() == ')'
-            self._tokenizer.advance()
-        elif self._tokenizer.identifier() and self._tokenizer.peek() == '.':
+        else:
             # className . subroutineName '(' expressionList ')'
-            # className
-            temp_name = self._tokenizer.identifier()
-            self._tokenizer.advance()
-            # symbol - '.'
-            temp_name += self._tokenizer.get_token()
-            self._tokenizer.advance()
-            # subroutineName
-            assert self._tokenizer.identifier(), print(self._tokenizer._tokens)
-            temp_name += self._tokenizer.identifier()
-            self._tokenizer.advance()
-            # symbol - '('
-            assert self._tokenizer.symbol() == '('
-            self._tokenizer.advance()
-            # expressionList
-            temp_nargs = self.compile_expression_list()
-            self._writer.write_call(temp_name, temp_nargs)
-            # symbol - ')'
-            assert  self._tokenizer.symbol() == ')'
-            self._tokenizer.advance()
-
-    def compile_expression_list(self):
+            temp_name = name + '.' + tokens[2][0]
+            signature = self.signature(name, tokens[2][0])
+            temp_nargs = 0
+        # expressionList
+        temp_nargs += self.compile_expression_list(tokens[-2])
+        self.check_call(temp_name, signature, temp_nargs)
+        self._writer.write_call(temp_name, temp_nargs)
+
+    def compile_expression_list(self, node):
         # (expression ( ',' expression)* )?
-        temp_nargs = 0
-        while self._tokenizer.symbol() != ')':
-            self.compile_expression()
-            temp_nargs += 1
-            if self._tokenizer.symbol() == ',':
-                # there is another expression in the list
-                self._tokenizer.advance()
-        return temp_nargs
+        expressions = node.children[0::2]
+        for expression in expressions:
+            self.compile_expression(expression)
+        return len(expressions)
@@ -0,0 +1,243 @@
+'''
+Module implementing the HackWriter component of the JACK compiler, a backend writing Hack assembly instead of VM code.
+
+The CompilationEngine drives a HackWriter exactly like a VMWriter. Each subroutine is buffered as VM commands
+(so dead code elimination still applies) and then translated. Expressions are not pushed onto the RAM stack:
+the postfix commands are read back into their expression trees on a stack of pending operands, which are
+only evaluated when an operator needs them. Results are kept in D or in the scratch registers R7-R12, temp 0
+and temp 1 (R5, R6) are left to the compiler's own use. Calls, returns, labels and functions go through the
+VM Translator's CodeWriter, so the output follows the standard calling convention and can be linked with
+code translated from .vm files, such as the Jack OS.
+'''
+
+from vmwriter import VMWriter
+
+# operators computed into D, 'D' is the left operand, the right operand is in A ('A') or M ('M')
+OPERATOR = {'add': {'A': 'D=D+A', 'M': 'D=D+M', 'reversed A': 'D=D+A', 'reversed M': 'D=D+M'},
+            'sub': {'A': 'D=D-A', 'M': 'D=D-M', 'reversed A': 'D=A-D', 'reversed M': 'D=M-D'},
+            'and': {'A': 'D=D&A', 'M': 'D=D&M', 'reversed A': 'D=D&A', 'reversed M': 'D=D&M'},
+            'or': {'A': 'D=D|A', 'M': 'D=D|M', 'reversed A': 'D=D|A', 'reversed M': 'D=D|M'}}
+
+# jump taken by x - y for each comparison
+COMPARISON = {'eq': 'JEQ', 'gt': 'JGT', 'lt': 'JLT'}
+
+SCRATCH = [7, 8, 9, 10, 11, 12]
+
+# pending operands
+D = ('D',)
+STACK = ('stack',)
+
+
+class HackWriter(VMWriter):
+    '''
+    Writes the Hack assembly for one class through a CodeWriter shared by all classes of the program.
+    Pending operands are ('constant', value), ('memory', segment, index), ('register', n), D (the value
+    is in the D register) and STACK (the value is on top of the RAM stack).
+    '''
+
+    def __init__(self, code, name):
+        self._name = name
+        self._code = code
+        self._buffer = []
+        self._removed = 0
+        self._operands = []
+        self._free = list(SCRATCH)
+        self._code.filename(name)
+
+    def close(self):
+        # the CodeWriter is closed once the whole program is written
+        self.flush()
+
+    def flush(self):
+        commands = [line.split() for line in self.eliminate_dead_code(self._buffer)]
+        self._buffer = []
+        for i, command in enumerate(commands):
+            if command[0] == '//':
+                self._code.write_asm([' '.join(command) + '\n'])
+            elif command[0] == 'return' and i > 0 and commands[i - 1][0] == 'call' and self._code.tail_calls():
+                # written with the call
+                continue
+            else:
+                self.translate(command, commands[i + 1] if i + 1 < len(commands) else None)
+        self.materialize()
+
+    def translate(self, command, following):
+        if command[0] == 'push':
+            if command[1] == 'constant':
+                self._operands.append(('constant', int(command[2])))
+            else:
+                self._operands.append(('memory', command[1], command[2]))
+        elif command[0] == 'pop':
+            self.pop(command[1], command[2])
+        elif command[0] in OPERATOR:
+            y = self.operand()
+            x = self.operand()
+            self.spill_d()
+            self.emit(self.binary(x, y, command[0]))
+            self._operands.append(D)
+        elif command[0] in COMPARISON:
+            y = self.operand()
+            x = self.operand()
+            self.spill_d()
+            true, end = self._code.unique_label('TRUE'), self._code.unique_label('END')
+            self.emit(self.binary(x, y, 'sub') + ['@'+true, 'D;'+COMPARISON[command[0]], 'D=0', '@'+end, '0;JMP',
+                                                 '('+true+')', 'D=-1', '('+end+')'])
+            self._operands.append(D)
+        elif command[0] in ['neg', 'not']:
+            x = self.operand()
+            if x[0] == 'constant':
+                value = -x[1] if command[0] == 'neg' else ~x[1]
+                self._operands.append(('constant', (value + 32768) % 65536 - 32768))
+                return
+            self.spill_d()
+            self.emit(self.load(x) + ['D=-D' if command[0] == 'neg' else 'D=!D'])
+            self._operands.append(D)
+        elif command[0] == 'if-goto':
+            condition = self.operand()
+            if condition == D and self._operands:
+                condition = self.spill(condition)
+            self.materialize()
+            self.emit(self.load(condition) + ['@'+self._code.label_name(command[1]), 'D;JNE'])
+        else:
+            # control flow and calls use the RAM stack
+            self.materialize()
+            if command[0] == 'label':
+                self._code.write_label(command[1])
+            elif command[0] == 'goto':
+                self._code.write_goto(command[1])
+            elif command[0] == 'function':
+                self._code.write_function(command[1], command[2])
+            elif command[0] == 'call' and following is not None and following[0] == 'return' and self._code.tail_calls():
+                self._code.write_tail_call(command[1], command[2])
+            elif command[0] == 'call':
+                self._code.write_call(command[1], command[2])
+            elif command[0] == 'return':
+                self._code.write_return()
+
+    def emit(self, lines):
+        self._code.write_asm([line + '\n' for line in lines])
+
+    def operand(self):
+        # the top pending operand, once those run out the operands are on the RAM stack
+        if self._operands:
+            return self._operands.pop()
+        return STACK
+
+    # evaluation
+
+    def load(self, operand):
+        # set D to the value of operand
+        if operand == D:
+            return []
+        elif operand == STACK:
+            return ['@SP', 'AM=M-1', 'D=M']
+        elif operand[0] == 'register':
+            self.release(operand)
+            return ['@R' + str(operand[1]), 'D=M']
+        elif operand[0] == 'memory':
+            return [line.strip() for line in self._code.load_d(operand[1], operand[2])]
+        value = operand[1]
+        if value in [0, 1, -1]:
+            return ['D=' + str(value)]
+        elif value == -32768:
+            return ['@32767', 'D=!A']
+        elif value < 0:
+            return ['@' + str(-value), 'D=-A']
+        return ['@' + str(value), 'D=A']
+
+    def address(self, operand):
+        # set A so that M is the value of operand without changing D, None if that is not possible
+        if operand == STACK:
+            return ['@SP', 'AM=M-1']
+        elif operand[0] == 'register':
+            self.release(operand)
+            return ['@R' + str(operand[1])]
+        elif operand[0] == 'memory' and self.reachable(operand[1], operand[2]):
+            return [line.strip() for line in self._code.address_a(operand[1], operand[2])]
+        return None
+
+    def reachable(self, segment, index):
+        # segment index can be addressed without using D
+        return self._code.direct(segment, index) is not None or int(index) <= 3
+
+    def binary(self, x, y, op):
+        # code setting D to x op y
+        if y == STACK:
+            # x is on the stack as well, below y
+            return ['@SP', 'AM=M-1', 'D=M'] + self.binary(x, D, op)
+        if y == D:
+            if x[0] == 'constant' and 0 <= x[1] <= 32767:
+                return ['@' + str(x[1]), OPERATOR[op]['reversed A']]
+            address = self.address(x)
+            if address is not None:
+                return address + [OPERATOR[op]['reversed M']]
+            return ['@R13', 'M=D'] + self.load(x) + ['@R13', OPERATOR[op]['M']]
+        code = self.load(x)
+        if y[0] == 'constant' and 0 <= y[1] <= 32767:
+            return code + ['@' + str(y[1]), OPERATOR[op]['A']]
+        address = self.address(y)
+        if address is not None:
+            return code + address + [OPERATOR[op]['M']]
+        return code + ['@R13', 'M=D'] + self.load(y) + ['@R13', OPERATOR[op]['reversed M']]
+
+    def pop(self, segment, index):
+        value = self.operand()
+        # values read lazily from memory must be read before it changes
+        if value == D and any(x[0] == 'memory' for x in self._operands):
+            value = self.spill(value)
+        self.spill_d()
+        if sum(1 for x in self._operands if x[0] == 'memory') > len(self._free):
+            self.materialize()
+        for i, operand in enumerate(self._operands):
+            if operand[0] == 'memory':
+                self._operands[i] = self.spill(operand)
+        if value[0] == 'constant' and value[1] in [0, 1, -1] and self.reachable(segment, index):
+            self.emit(self.address(('memory', segment, index)) + ['M=' + str(value[1])])
+        elif self.reachable(segment, index):
+            self.emit(self.load(value) + [line.strip() for line in self._code.address_a(segment, index)] + ['M=D'])
+        else:
+            if value == D:
+                value = self.spill(value)
+            self.emit([line.strip() for line in self._code.address_d(segment, index)] + ['@R13', 'M=D']
+                      + self.load(value) + ['@R13', 'A=M', 'M=D'])
+
+    # registers
+
+    def release(self, operand):
+        if operand[1] in SCRATCH:
+            self._free.append(operand[1])
+
+    def spill(self, operand):
+        # move operand into a scratch register, or when none are free push everything onto the stack,
+        # operand last, so it must be the top operand
+        if not self._free:
+            self._operands.append(operand)
+            self.materialize()
+            return STACK
+        register = self._free.pop(0)
+        self.emit(self.load(operand) + ['@R' + str(register), 'M=D'])
+        return ('register', register)
+
+    def spill_d(self):
+        # D is about to be overwritten, keep a pending value that lives in D
+        if D not in self._operands:
+            return
+        elif not self._free:
+            self.materialize()
+            return
+        i = self._operands.index(D)
+        self._operands[i] = ('register', self._free.pop(0))
+        self.emit(['@R' + str(self._operands[i][1]), 'M=D'])
+
+    def materialize(self):
+        # push all pending operands onto the RAM stack, in order
+        if not self._operands:
+            return
+        code = []
+        if D in self._operands:
+            code += ['@R13', 'M=D']
+            self._operands[self._operands.index(D)] = ('register', 13)
+        for operand in self._operands:
+            code += self.load(operand) + ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+        self._operands = []
+        self.emit(code)
@@ -2,15 +2,34 @@
 Module implementing the SymbolTable component of the JACK compiler.
 '''
 
-from collections import namedtuple
+# VM segment holding the variables of each kind
+SEGMENT = {'static': 'static', 'field': 'this', 'local': 'local', 'argument': 'argument'}
 
-Symbol = namedtuple('Symbol', ['type','kind','number'])
+class Symbol():
+    '''
+    A resolved variable: its Jack type and kind, and the VM segment and index it is stored at.
+    '''
+    __slots__ = ('type', 'kind', 'segment', 'index')
+
+    def __init__(self, var_type, kind, index):
+        self.type = var_type
+        self.kind = kind
+        self.segment = SEGMENT[kind]
+        self.index = index
+
+    def __repr__(self):
+        return 'Symbol(' + ', '.join([self.type, self.kind, self.segment, str(self.index)]) + ')'
 
 class SymbolTable():
+    '''
+    Scopes are kept as a chain of dictionaries: the class scope, the subroutine scope and one more for
+    each nested block that is open. Names are resolved from the innermost scope outwards.
+    '''
 
     def __init__(self):
         self._class = dict()
         self._subroutine = dict()
+        self._scopes = [self._class, self._subroutine]
         self._static = 0
         self._field = 0
         self._local = 0
@@ -20,9 +39,18 @@ class SymbolTable():
     def start_subroutine(self):
         # clears the old subroutine dictionary, if it exis
         self._subroutine = dict()
+        self._scopes = [self._class, self._subroutine]
         self._arg = 0
         self._local = 0
 
+    def start_block(self):
+        # open a nested scope, its locals take further indexes of the local segment
+        self._scopes.append(dict())
+
+    def end_block(self):
+        assert len(self._scopes) > 2, "no block to end"
+        self._scopes.pop()
+
     def print_class_table(self, class_name):
         # for debugging the symbol tables
         print('class scope symbol table for', class_name, ':\n')
@@ -45,7 +73,7 @@ class SymbolTable():
             self._class[var_name] = Symbol(var_type, kind, self._field)
             self._field += 1
         elif kind == 'local':
-            self._subroutine[var_name] = Symbol(var_type, kind, self._local)
+            self._scopes[-1][var_name] = Symbol(var_type, kind, self._local)
             self._local += 1
         elif kind == 'argument':
             self._subroutine[var_name] = Symbol(var_type, kind, self._arg)
@@ -66,39 +94,32 @@ class SymbolTable():
         else:
             assert False, "invalid var_type given."
 
+    def resolve(self, var_name):
+        # the Symbol for var_name in the innermost scope defining it, None if no scope does
+        for scope in reversed(self._scopes):
+            symbol = scope.get(var_name)
+            if symbol is not None:
+                return symbol
+        return None
+
     def exists(self, var_name):
         # check if variable with this name exists
-        return var_name in self._class or var_name in self._subroutine
+        return self.resolve(var_name) is not None
 
 
     def kind_of(self, var_name):
         # check subroutine scope, then class scope, if neither returns None
-        try:
-            return self._subroutine[var_name].kind
-        except KeyError:
-            try:
-                return self._class[var_name].kind
-            except KeyError:
-                return None
+        symbol = self.resolve(var_name)
+        return symbol.kind if symbol is not None else None
 
 
     def type_of(self, var_name):
         # check subroutine scope, then class scope, if neither returns None
-        try:
-            return self._subroutine[var_name].type
-        except KeyError:
-            try:
-                return self._class[var_name].type
-            except KeyError:
-                return None
+        symbol = self.resolve(var_name)
+        return symbol.type if symbol is not None else None
 
 
     def index_of(self, var_name):
         # check subroutine scope, then class scope, if neither returns None
-        try:
-            return self._subroutine[var_name].number
-        except KeyError:
-            try:
-                return self._class[var_name].number
-            except KeyError:
-                return None
+        symbol = self.resolve(var_name)
+        return symbol.index if symbol is not None else None
@@ -0,0 +1,271 @@
+'''
+Module implementing the JackParser of the JACK compiler, which builds the parse tree of a class.
+
+The tree is parsed once and then walked by each output: the CompilationEngine writes VM code from it and
+the XMLWriter writes it as XML, so a single run can produce both. Nodes are named after the grammar rules
+(and XML tags) of the Jack language, their children are nodes and tokens in source order, where a token
+is the (text, type code, line) tuple produced by the JackTokenizer. parts() gives the class one member at a
+time instead, for outputs that do not need the whole tree at once.
+'''
+
+from tokenizer import INTEGER, STRING, IDENTIFIER, STATEMENTS
+
+class Node():
+    '''
+    A grammar rule in the parse tree, e.g. Node('letStatement', [('let', KEYWORD, 3), ...]).
+    '''
+    __slots__ = ('kind', 'children')
+
+    def __init__(self, kind, children = None):
+        self.kind = kind
+        self.children = children if children is not None else []
+
+    def __repr__(self):
+        return 'Node(' + self.kind + ', ' + repr(self.children) + ')'
+
+
+class JackParser():
+    '''
+    Parses a stream of jack tokens recursively into a tree of Nodes.
+    '''
+
+    def __init__(self, tokenizer):
+        self._tokenizer = tokenizer
+        # Input should be a .jack file containing one class
+        assert self._tokenizer.has_more_tokens(), self._tokenizer.get_filename() + ': no tokens'
+        self._tokenizer.advance()
+
+    def error(self, expected):
+        return self._tokenizer.location() + ': expected ' + expected + ' but got ' + self._tokenizer.get_token()
+
+    def take(self, node, valid = True, expected = 'a token'):
+        # add the current token to node and move on, valid tells whether it belongs there
+        assert valid and self._tokenizer.has_more_tokens(), self.error(expected)
+        node.children.append(self._tokenizer.current())
+        self._tokenizer.advance()
+
+    def expect(self, node, symbol):
+        self.take(node, self._tokenizer.get_token() == symbol, "'" + symbol + "'")
+
+    def parse(self):
+        # the tree of the whole class
+        return self.parse_class()
+
+    def parse_class(self):
+        # 'class' className '{' classVarDec* subroutineDec* '}'
+        parts = self.parts()
+        node = next(parts)
+        node.children.extend(parts)
+        return node
+
+    def parts(self):
+        # generator of the class a part at a time: the class Node holding 'class' className '{', then each
+        # classVarDec and subroutineDec Node as soon as it is parsed and the closing '}' token last,
+        # so a caller writing each part out only holds one subroutine in memory
+        node = Node('class')
+        self.take(node, self._tokenizer.keyword() == 'class', "'class'")
+        self.take(node, self._tokenizer.identifier(), 'a class name')
+        self.expect(node, '{')
+        yield node
+        while self._tokenizer.is_valid_class_variable():
+            yield self.parse_class_var()
+        while self._tokenizer.is_valid_subroutine():
+            yield self.parse_subroutine()
+        closing = Node('class')
+        self.expect(closing, '}')
+        # assuming .jack file is properly formatted, there should be no more tokens
+        assert not self._tokenizer.has_more_tokens(), self.error('the end of the file')
+        yield closing.children[0]
+
+    def parse_class_var(self):
+        # ('static'|'field') type varName (',' varName)* ';'
+        node = Node('classVarDec')
+        self.take(node)
+        self.take(node, self._tokenizer.is_valid_type(), 'a type')
+        self.take(node, self._tokenizer.identifier(), 'a variable name')
+        while self._tokenizer.symbol() == ',':
+            self.take(node)
+            self.take(node, self._tokenizer.identifier(), 'a variable name')
+        self.expect(node, ';')
+        return node
+
+    def parse_subroutine(self):
+        # ('constructor'|'method'|'function') ('void'| type) subroutineName '(' parameterList ')' subroutineBody
+        node = Node('subroutineDec')
+        self.take(node)
+        self.take(node, self._tokenizer.is_valid_subroutine_type(), 'a return type')
+        self.take(node, self._tokenizer.identifier(), 'a subroutine name')
+        self.expect(node, '(')
+        node.children.append(self.parse_parameter_list())
+        self.expect(node, ')')
+        node.children.append(self.parse_subroutine_body())
+        return node
+
+    def parse_parameter_list(self):
+        # ( (type varName) (',' type varName)* )?
+        node = Node('parameterList')
+        if self._tokenizer.symbol() == ')':
+            return node
+        self.take(node, self._tokenizer.is_valid_type(), 'a type')
+        self.take(node, self._tokenizer.identifier(), 'a parameter name')
+        while self._tokenizer.symbol() == ',':
+            self.take(node)
+            self.take(node, self._tokenizer.is_valid_type(), 'a type')
+            self.take(node, self._tokenizer.identifier(), 'a parameter name')
+        return node
+
+    def parse_subroutine_body(self):
+        # '{' varDec* statements '}'
+        node = Node('subroutineBody')
+        self.expect(node, '{')
+        while self._tokenizer.keyword() == 'var':
+            node.children.append(self.parse_var())
+        node.children.append(self.parse_statements())
+        self.expect(node, '}')
+        return node
+
+    def parse_var(self):
+        # 'var' type varName (',' varName)* ';'
+        node = Node('varDec')
+        self.take(node)
+        self.take(node, self._tokenizer.is_valid_type(), 'a type')
+        self.take(node, self._tokenizer.identifier(), 'a variable name')
+        while self._tokenizer.symbol() == ',':
+            self.take(node)
+            self.take(node, self._tokenizer.identifier(), 'a variable name')
+        self.expect(node, ';')
+        return node
+
+    def parse_statements(self):
+        # statement*
+        node = Node('statements')
+        while self._tokenizer.keyword() in STATEMENTS:
+            keyword = self._tokenizer.keyword()
+            if keyword == 'let':
+                node.children.append(self.parse_let())
+            elif keyword == 'if':
+                node.children.append(self.parse_if())
+            elif keyword == 'while':
+                node.children.append(self.parse_while())
+            elif keyword == 'do':
+                node.children.append(self.parse_do())
+            else:
+                node.children.append(self.parse_return())
+        return node
+
+    def parse_let(self):
+        # 'let' varName ('[' expression ']')? '=' expression ';'
+        node = Node('letStatement')
+        self.take(node)
+        self.take(node, self._tokenizer.identifier(), 'a variable name')
+        if self._tokenizer.symbol() == '[':
+            self.take(node)
+            node.children.append(self.parse_expression())
+            self.expect(node, ']')
+        self.expect(node, '=')
+        node.children.append(self.parse_expression())
+        self.expect(node, ';')
+        return node
+
+    def parse_if(self):
+        # 'if' '(' expression ')' '{' statements '}' ('else' '{' statements '}')?
+        node = Node('ifStatement')
+        self.take(node)
+        self.expect(node, '(')
+        node.children.append(self.parse_expression())
+        self.expect(node, ')')
+        self.expect(node, '{')
+        node.children.append(self.parse_statements())
+        self.expect(node, '}')
+        if self._tokenizer.keyword() == 'else':
+            self.take(node)
+            self.expect(node, '{')
+            node.children.append(self.parse_statements())
+            self.expect(node, '}')
+        return node
+
+    def parse_while(self):
+        # 'while' '(' expression ')' '{' statements '}'
+        node = Node('whileStatement')
+        self.take(node)
+        self.expect(node, '(')
+        node.children.append(self.parse_expression())
+        self.expect(node, ')')
+        self.expect(node, '{')
+        node.children.append(self.parse_statements())
+        self.expect(node, '}')
+        return node
+
+    def parse_do(self):
+        # 'do' subroutineCall ';'
+        node = Node('doStatement')
+        self.take(node)
+        self.parse_subroutine_call(node)
+        self.expect(node, ';')
+        return node
+
+    def parse_return(self):
+        # 'return' expression? ';'
+        node = Node('returnStatement')
+        self.take(node)
+        if self._tokenizer.symbol() != ';':
+            node.children.append(self.parse_expression())
+        self.expect(node, ';')
+        return node
+
+    def parse_expression(self):
+        # term (op term)*
+        node = Node('expression', [self.parse_term()])
+        while self._tokenizer.is_valid_operator():
+            self.take(node)
+            node.children.append(self.parse_term())
+        return node
+
+    def parse_term(self):
+        # integerConstant | stringConstant | keywordConstant | varName |
+        # varName '[' expression']' | subroutineCall | '(' expression ')' | unaryOp term
+        node = Node('term')
+        token = self._tokenizer.current()
+        if token is None:
+            self.take(node, False, 'a term')
+        elif token[1] in (INTEGER, STRING) or self._tokenizer.is_valid_keyword_constant():
+            self.take(node)
+        elif self._tokenizer.symbol() == '(':
+            self.take(node)
+            node.children.append(self.parse_expression())
+            self.expect(node, ')')
+        elif self._tokenizer.is_valid_unary():
+            self.take(node)
+            node.children.append(self.parse_term())
+        elif token[1] == IDENTIFIER and self._tokenizer.peek() == '[':
+            self.take(node)
+            self.take(node)
+            node.children.append(self.parse_expression())
+            self.expect(node, ']')
+        elif token[1] == IDENTIFIER and self._tokenizer.peek() in ['(', '.']:
+            self.parse_subroutine_call(node)
+        else:
+            self.take(node, token[1] == IDENTIFIER, 'a term')
+        return node
+
+    def parse_subroutine_call(self, node):
+        # subroutineName '(' expressionList ')'| (className | varName) '.' subroutineName '(' expressionList ')'
+        # the tokens are added to node directly, there is no subroutineCall node
+        self.take(node, self._tokenizer.identifier(), 'a subroutine call')
+        if self._tokenizer.symbol() == '.':
+            self.take(node)
+            self.take(node, self._tokenizer.identifier(), 'a subroutine name')
+        self.expect(node, '(')
+        node.children.append(self.parse_expression_list())
+        self.expect(node, ')')
+
+    def parse_expression_list(self):
+        # (expression ( ',' expression)* )?
+        node = Node('expressionList')
+        if self._tokenizer.symbol() == ')':
+            return node
+        node.children.append(self.parse_expression())
+        while self._tokenizer.symbol() == ',':
+            self.take(node)
+            node.children.append(self.parse_expression())
+        return node
@@ -1,96 +1,84 @@
-from collections import deque
-import re
+import re, sys
+
+# token type codes, index into TYPES
+KEYWORD, SYMBOL, INTEGER, STRING, IDENTIFIER = range(5)
+TYPES = ('keyword', 'symbol', 'integerConstant', 'stringConstant', 'identifier')
+
+KEYWORDS = frozenset(['class','constructor','function','method','field','static','var','int','char','boolean',
+                      'void','true','false','null','this','let','do','if','else','while','return'])
+OPERATORS = frozenset(['+','-','*','/','&','|','<','>','='])
+UNARY = frozenset(['-','~'])
+PRIMITIVE_TYPES = frozenset(['int','char','boolean'])
+SUBROUTINE_TYPES = frozenset(['int','char','boolean','void'])
+SUBROUTINES = frozenset(['constructor','function','method'])
+STATEMENTS = frozenset(['let','if','while','do','return'])
+CLASS_VARIABLES = frozenset(['static','field'])
+KEYWORD_CONSTANTS = frozenset(['true','false','null','this'])
+
+# one pass over the source: whitespace and comments are skipped, every other match is a token
+SCANNER = re.compile(r'\s+|//[^\n]*|/\*.*?\*/'
+                     r'|(?P<symbol>[{}()\[\].,;+\-*/&|<>=~])'
+                     r'|(?P<integer>[0-9]+)'
+                     r'|"(?P<string>[^"\n]*)"'
+                     r'|(?P<word>[a-zA-Z_][a-zA-Z0-9_]*)', re.S)
+
+# characters read from the source at a time
+BLOCK = 1 << 16
 
 class JackTokenizer():
     '''
-    Tokenizes input .jack file using regular expressions
+    Tokenizes input .jack file using regular expressions.
+    The file is read in blocks by a generator, so tokens are produced as the CompilationEngine asks for
+    them and only the current block, the current token and the next one (for peek) are held in memory.
     '''
 
     def __init__(self, filename):
         self._name = filename
-        self._input = self.remove_comments(filename)
-        # REGEX to check if string begins with symbol
-        self._symbol = re.compile('^[\{\}\(\)\[\]\.,;\+\-\*/&\|<>=~]')
-        # REGEX to check if string begins with integer
-        self._integer = re.compile('^[0-9]+')
-        # REGEX to check for keyword
-        self._keyword = re.compile('^(class|constructor|function|method|field|static|var|int|char|boolean|void|true|false|null|this|let|do|if|else|while|return)(?=[\W]+)')
-        # REGEX to check for string constant
-        self._string = re.compile('^["][^"]+["]')
-        # REGEX to check for identifier, also flags keywords
-        self._identifier = re.compile('^[a-zA-Z0-9_]+')
-        self._xmlsymbol = {'<':'&lt;','>':'&gt;','&':'&amp;'}
-        self._tokens = None
-        self._backup = None
-        self._finished = True
-        self.tokenize(self._input)
-        #self.write_tokens()
+        self._stream = self.tokenize()
+        # one token of lookahead, (text, type code, line) or None at the end of the file
+        self._next = next(self._stream, None)
+        self._finished = self._next is None
+        self._current = None
         self._token = None
         self._type = None
+        self._line = None
         self._labels = dict()
 
 
-    def tokenize(self, string):
-        tokens = []
-        types = []
-        while string:
-            match = self._symbol.match(string)
-            if match:
-                # next token is symbol
-                start, end = match.span()
-                tokens.append(string[start:end])
-                types.append('symbol')
-                string = re.sub('^[\s]+','', string[end:])
-                continue
-            match = self._integer.match(string)
-            if match:
-                # next token is integer
-                start, end = match.span()
-                tokens.append(string[start:end])
-                types.append('integerConstant')
-                string = re.sub('^[\s]+','', string[end:])
-                continue
-            match = self._keyword.match(string)
-            if match:
-                # next token is keyword
-                start, end = match.span()
-                tokens.append(string[start:end])
-                types.append('keyword')
-                string = re.sub('^[\s]+','', string[end:])
-                continue
-            match = self._string.match(string)
-            if match:
-                # next token is string
-                start, end = match.span()
-                tokens.append(string[start+1:end-1]) # drop the enclosing double quotes
-                types.append('stringConstant')
-                string = re.sub('^[\s]+','', string[end:])
-                continue
-            match = self._identifier.match(string)
-            if match:
-                # next token is symbol
-                start, end = match.span()
-                tokens.append(string[start:end])
-                types.append('identifier')
-                string = re.sub('^[\s]+','', string[end:])
-                continue
-            print('invalid next token')
-            print(string)
-            return
-        self._backup = list(zip(tokens,types))
-        self._tokens = deque(self._backup)
-        self._finished = (len(self._tokens) == 0)
-        return None
-
-
-    def remove_comments(self, filename):
-        with open(filename, 'r') as temp:
-            raw = temp.read()
-        # removes comments, using regex
-        raw = re.sub('//.*?\n|/\*.*?\*/', '', raw, flags=re.S)
-        # replace multiple successive whitespace characters with single space
-        raw = re.sub('[\s]+',' ', raw)
-        return re.sub('^[\s]+','', raw)
+    def tokenize(self):
+        # generator of (text, type code, line) for each token of the file
+        with open(self._name, 'r') as temp:
+            buffer, position, line, end_of_file = '', 0, 1, False
+            while True:
+                match = SCANNER.match(buffer, position)
+                if not end_of_file and (match is None or match.end() == len(buffer)
+                                        or (match.lastgroup == 'symbol' and buffer.startswith('/*', position))):
+                    # the token or comment may continue in the next block
+                    block = temp.read(BLOCK)
+                    end_of_file = not block
+                    buffer, position = buffer[position:] + block, 0
+                    continue
+                if match is None:
+                    if position < len(buffer):
+                        print('invalid next token')
+                        print(buffer[position:].split('\n')[0])
+                    return
+                kind = match.lastgroup
+                position = match.end()
+                if kind is None:
+                    # whitespace or comment
+                    line += match.group().count('\n')
+                    continue
+                text = sys.intern(match.group(kind))
+                if kind == 'symbol':
+                    code = SYMBOL
+                elif kind == 'integer':
+                    code = INTEGER
+                elif kind == 'string':
+                    code = STRING
+                else:
+                    code = KEYWORD if text in KEYWORDS else IDENTIFIER
+                yield text, code, line
 
 
     def has_more_tokens(self):
@@ -101,77 +89,64 @@ class JackTokenizer():
         return self._name
 
 
-    def write_tokens(self):
-        with open(self._name.replace('.jack','Tokens.xml'),'w') as temp:
-            temp.writelines(['<tokens>\n'])
-            for tokens, types in self._backup:
-                if tokens in ['<','>','&']:
-                    temp.writelines(['<'+types+'> '+self._xmlsymbol[tokens]+' </'+types+'>\n'])
-                else:
-                    temp.writelines(['<'+types+'> '+tokens+' </'+types+'>\n'])
-            temp.writelines(['</tokens>\n'])
-
-
     def advance(self):
-        try:
-            temp = self._tokens.popleft()
-        except:
-            temp = None
-        if self._finished:
-            self._token = None
-            self._type = None
-        elif temp is None:
+        if self._finished or self._next is None:
             self._finished = True
+            self._current = None
             self._token = None
             self._type = None
         else:
-            self._token, self._type = temp
+            self._current = self._next
+            self._token, self._type, self._line = self._next
+            self._next = next(self._stream, None)
 
     def debug(self):
-        # only called in the case of an AssertionError
-        print(self._tokens)
+        # only called in the case of an AssertionError, shows where the current token is
+        print(self._name + ':' + str(self._line) + ':', self._token)
+
+    def current(self):
+        # the current token as (text, type code, line), the leaves of the parse tree
+        return self._current
+
+    def location(self):
+        return self._name + ':' + str(self._line)
 
     def peek(self):
-        try:
-            temp, _ = self._tokens[0]
-        except:
-            temp = None
-        return temp
+        if self._next is not None:
+            return self._next[0]
+        return None
 
 
-    def xml_token(self):
-        if self._token in ['<','>','&']:
-            return '<' + self._type + '> ' + self._xmlsymbol[self._token] + ' </' + self._type + '>\n'
-        else:
-            return '<' + self._type + '> ' + self._token + ' </' + self._type + '>\n'
+    def token_type(self):
+        return TYPES[self._type] if self._type is not None else None
 
 
     def is_valid_type(self):
-        return self._type == 'identifier' or self._token in ['int','char','boolean']
+        return self._type == IDENTIFIER or self._token in PRIMITIVE_TYPES
 
 
     def is_valid_operator(self):
-        return self._type == 'symbol' and self._token in ['+','-','*','/','&','|','<','>','=']
+        return self._type == SYMBOL and self._token in OPERATORS
 
 
     def is_valid_unary(self):
-        return self._type == 'symbol' and self._token in ['-','~']
+        return self._type == SYMBOL and self._token in UNARY
 
 
     def is_valid_subroutine(self):
-        return self._type == 'keyword' and self._token in ['constructor','function','method']
+        return self._type == KEYWORD and self._token in SUBROUTINES
 
 
     def is_valid_subroutine_type(self):
-        return self._type == 'identifier' or self._token in ['int','char','boolean','void']
+        return self._type == IDENTIFIER or self._token in SUBROUTINE_TYPES
 
 
     def is_valid_statement(self):
-        return self._type == 'keyword' or self._token in ['let','if','while','do','return']
+        return self._type == KEYWORD or self._token in STATEMENTS
 
 
     def is_valid_class_variable(self):
-        return self._type == 'keyword' and self._token in ['static','field']
+        return self._type == KEYWORD and self._token in CLASS_VARIABLES
 
 
     def is_valid_variable(self):
@@ -179,42 +154,42 @@ class JackTokenizer():
 
 
     def is_valid_keyword_constant(self):
-        return self._type == 'keyword' and self._token in ['true','false', 'null','this']
+        return self._type == KEYWORD and self._token in KEYWORD_CONSTANTS
 
 
     def get_token(self):
         return str(self._token)
 
     def keyword(self):
-        if self._type != 'keyword':
+        if self._type != KEYWORD:
             return None
         else:
-            return str(self._token)
+            return self._token
 
 
     def symbol(self):
-        if self._type != 'symbol':
+        if self._type != SYMBOL:
             return None
         else:
-            return str(self._token)
+            return self._token
 
 
     def identifier(self):
-        if self._type != 'identifier':
+        if self._type != IDENTIFIER:
             return None
         else:
-            return str(self._token)
+            return self._token
 
 
     def int_value(self):
-        if self._type != 'integerConstant' or int(self._token) > 32767:
+        if self._type != INTEGER or int(self._token) > 32767:
             return None
         else:
-            return str(self._token)
+            return self._token
 
 
     def string_value(self):
-        if self._type != 'stringConstant':
+        if self._type != STRING:
             return None
         else:
-            return str(self._token)
+            return self._token
@@ -1,5 +1,8 @@
 '''
 Module implementing the VMWriter component of the JACK compiler.
+
+VM commands are buffered one subroutine at a time, so that unreachable code can be removed before the
+subroutine is written to the output file.
 '''
 
 class VMWriter():
@@ -7,6 +10,10 @@ class VMWriter():
     def __init__(self, filename):
         self._name = filename
         self._file = open(filename, 'w')
+        # vm commands of the current subroutine, flushed by write_function and close
+        self._buffer = []
+        # number of vm commands dropped as unreachable
+        self._removed = 0
 
     
     def write_object_alloc(self, size):
@@ -34,7 +41,7 @@ class VMWriter():
     def write_keyword_constant(self, keyword):
         if keyword == 'true':
             self.write_push('constant',1)
-            self._file.writelines(['neg\n'])
+            self._buffer.extend(['neg\n'])
         elif keyword == 'false':
             self.write_push('constant',0)
         elif keyword == 'null':
@@ -46,74 +53,119 @@ class VMWriter():
 
     def write_operator(self, op):
         if op == '+':
-            self._file.writelines(['add\n'])
+            self._buffer.extend(['add\n'])
         elif op == '-':
-            self._file.writelines(['sub\n'])
+            self._buffer.extend(['sub\n'])
         elif op == '*':
             self.write_call('Math.multiply', 2)
         elif op == '/':
             self.write_call('Math.divide', 2)
         elif op == '&':
-            self._file.writelines(['and\n'])
+            self._buffer.extend(['and\n'])
         elif op == '|':
-            self._file.writelines(['or\n'])
+            self._buffer.extend(['or\n'])
         elif op == '<':
-            self._file.writelines(['lt\n'])
+            self._buffer.extend(['lt\n'])
         elif op == '>':
-            self._file.writelines(['gt\n'])
+            self._buffer.extend(['gt\n'])
         elif op == '=':
-            self._file.writelines(['eq\n'])
+            self._buffer.extend(['eq\n'])
         else:
             assert False, 'bad operator given: ' + str(op)
 
     def write_unary(self, op):
         if op == '-':
-            self._file.writelines(['neg\n'])
+            self._buffer.extend(['neg\n'])
         elif op == '~':
-            self._file.writelines(['not\n'])
+            self._buffer.extend(['not\n'])
         else:
             assert False, 'bad operator given: ' + str(op)
 
     def write_comment(self, string):
-        self._file.writelines(['// '+string+'\n'])
+        self._buffer.extend(['// '+string+'\n'])
 
     # the following are the atomic vm commands
 
     def write_push(self, segment, index):
         
         # push segment index
-        self._file.writelines(['push ' + segment + ' ' + str(index) + '\n'])
+        self._buffer.extend(['push ' + segment + ' ' + str(index) + '\n'])
 
     def write_pop(self, segment, index):
         # pop segment index
-        self._file.writelines(['pop ' + segment + ' ' + str(index) + '\n'])
+        self._buffer.extend(['pop ' + segment + ' ' + str(index) + '\n'])
 
     def write_arithmetic(self, command):
         # command
-        self._file.writelines([command + '\n'])
+        self._buffer.extend([command + '\n'])
 
     def write_label(self, label):
         # label symbol
-        self._file.writelines(['label ' + label + '\n'])
+        self._buffer.extend(['label ' + label + '\n'])
 
     def write_goto(self, label):
         # goto symbol
-        self._file.writelines(['goto ' + label + '\n'])
+        self._buffer.extend(['goto ' + label + '\n'])
 
     def write_if(self, label):
         # if-goto symbol
-        self._file.writelines(['if-goto ' + label + '\n'])
+        self._buffer.extend(['if-goto ' + label + '\n'])
 
     def write_call(self, name, num_args):
         # call name nargs
-        self._file.writelines(['call ' + name + ' ' + str(num_args) + '\n'])
+        self._buffer.extend(['call ' + name + ' ' + str(num_args) + '\n'])
 
     def write_function(self, name, num_locals):
         # function name nlocals
-        self._file.writelines(['function ' + name + ' ' + str(num_locals) + '\n'])
+        self.flush()
+        self._buffer.extend(['function ' + name + ' ' + str(num_locals) + '\n'])
 
     def write_return(self):
-        self._file.writelines(['return\n'])
+        self._buffer.extend(['return\n'])
+
+    # dead code elimination
+
+    def mark(self):
+        # position in the current subroutine, used with discard
+        return len(self._buffer)
+
+    def discard(self, mark):
+        # drop everything written since mark, e.g. a branch whose condition is a constant
+        self._removed += sum(1 for line in self._buffer[mark:] if not line.startswith('//'))
+        del self._buffer[mark:]
+
+    def removed(self):
+        return self._removed
+
+    def eliminate_dead_code(self, lines):
+        # keep only the commands reachable from the start of the subroutine, comments are always kept
+        labels = dict()
+        for i, line in enumerate(lines):
+            if line.startswith('label '):
+                labels[line.split()[1]] = i
+        reachable = [line.startswith('//') for line in lines]
+        todo = [0]
+        while todo:
+            i = todo.pop()
+            while i < len(lines) and (not reachable[i] or lines[i].startswith('//')):
+                reachable[i] = True
+                command = lines[i].split()
+                if command[0] == 'goto':
+                    i = labels[command[1]]
+                    continue
+                elif command[0] == 'if-goto':
+                    todo.append(labels[command[1]])
+                elif command[0] == 'return':
+                    break
+                i += 1
+        self._removed += reachable.count(False)
+        return [line for i, line in enumerate(lines) if reachable[i]]
+
+    def flush(self):
+        # write the buffered subroutine to the output file
+        self._file.writelines(self.eliminate_dead_code(self._buffer))
+        self._buffer = []
 
     def close(self):
+        self.flush()
         self._file.close()
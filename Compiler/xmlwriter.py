@@ -0,0 +1,96 @@
+'''
+Module implementing the XMLWriter of the JACK compiler, which writes a parse tree as XML.
+
+Each Node becomes a pair of tags named after its grammar rule and each token a line such as
+'<keyword> class </keyword>', the format of the parse trees in Chapter 10 of 'The Elements of Computing Systems'.
+
+The output goes through a large write buffer. The escaped line of each distinct token, the tags of each rule
+and the indentation of each depth are made once and reused, so writing the tree only joins cached strings.
+The token list (the T.xml file) can be written in the same pass over the tree, as its tokens are the leaves
+of the tree in order.
+'''
+
+from tokenizer import TYPES
+from syntaxtree import Node
+
+# characters written to the output files at a time
+BUFFER = 1 << 16
+
+class XMLWriter():
+
+    def __init__(self, filename, tokens = None, indent = 0):
+        # filename gets the parse tree and tokens the token list, either can be None
+        self._file = open(filename, 'w', buffering=BUFFER) if filename else None
+        self._tokens = open(tokens, 'w', buffering=BUFFER) if tokens else None
+        # spaces per level of the tree, 0 writes every line at the start like the book's files
+        self._indent = indent
+        # (text, type code) -> escaped xml line
+        self._lines = dict()
+        # kind -> (open tag, close tag)
+        self._tags = dict()
+        # depth -> indentation
+        self._margins = ['']
+        if self._tokens is not None:
+            self._tokens.write('<tokens>\n')
+
+    def token_line(self, token):
+        key = token[:2]
+        line = self._lines.get(key)
+        if line is None:
+            text = token[0].replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            line = self._lines[key] = '<' + TYPES[token[1]] + '> ' + text + ' </' + TYPES[token[1]] + '>\n'
+        return line
+
+    def margin(self, depth):
+        while len(self._margins) <= depth:
+            self._margins.append(' ' * (self._indent * len(self._margins)))
+        return self._margins[depth]
+
+    def tags(self, kind):
+        tags = self._tags.get(kind)
+        if tags is None:
+            tags = self._tags[kind] = ('<' + kind + '>\n', '</' + kind + '>\n')
+        return tags
+
+    def write_tree(self, node, depth = 0):
+        # the tree under node, and its tokens if a token list is written
+        self.write_open(node, depth)
+        for child in node.children:
+            self.write_child(child, depth + 1)
+        self.write_close(node, depth)
+
+    def write_parts(self, parts):
+        # a class from JackParser.parts(), each part is written as it is parsed and then dropped
+        parts = iter(parts)
+        node = next(parts)
+        self.write_open(node, 0)
+        for child in node.children:
+            self.write_child(child, 1)
+        for part in parts:
+            self.write_child(part, 1)
+        self.write_close(node, 0)
+
+    def write_open(self, node, depth):
+        if self._file is not None:
+            self._file.write(self.margin(depth) + self.tags(node.kind)[0])
+
+    def write_close(self, node, depth):
+        if self._file is not None:
+            self._file.write(self.margin(depth) + self.tags(node.kind)[1])
+
+    def write_child(self, child, depth):
+        if child.__class__ is Node:
+            self.write_tree(child, depth)
+            return
+        line = self.token_line(child)
+        if self._file is not None:
+            self._file.write(self.margin(depth) + line)
+        if self._tokens is not None:
+            self._tokens.write(line)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self._tokens is not None:
+            self._tokens.write('</tokens>\n')
+            self._tokens.close()
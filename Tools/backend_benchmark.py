@@ -0,0 +1,101 @@
+'''
+Benchmark of the Jack compiler's Hack backend against the VM path.
+
+A Jack program is compiled twice: to .vm files which are translated by the VM Translator, and straight to
+Hack assembly with 'JackCompiler.py --backend hack'. Both builds are run on the CPU emulator, reporting
+the cycles used, the ROM size and whether they leave the same results in RAM. The workload does not
+call the Jack OS (which is not part of this repository), a directory holding the OS .vm files can be
+given to benchmark programs that do, its .vm files are copied next to the sources.
+
+To use this script run 'python backend_benchmark.py [program directory] [OS directory]'.
+'''
+
+import os, sys, shutil, tempfile
+from emulator import CPUEmulator
+from toolchain import compile_jack, compile_hack, build
+
+SOURCES = {'Sys.jack': '''class Sys {
+    function void init() {
+        do Main.main();
+        while (true) {}
+        return;
+    }
+}
+''', 'Main.jack': '''class Main {
+    static Array out;
+    function int fibonacci(int n) {
+        if (n < 2) { return n; }
+        return Main.fibonacci(n - 1) + Main.fibonacci(n - 2);
+    }
+    function void sort(Array a, int n) {
+        var int i, j, t;
+        let i = 0;
+        while (i < n) {
+            let j = n - 1;
+            while (j > i) {
+                if (a[j] < a[j - 1]) { let t = a[j]; let a[j] = a[j - 1]; let a[j - 1] = t; }
+                let j = j - 1;
+            }
+            let i = i + 1;
+        }
+        return;
+    }
+    function void main() {
+        var Array a;
+        var int i, seed;
+        let out = 8000;
+        let a = 8100;
+        let seed = 7;
+        while (i < 40) {
+            let seed = ((seed + seed + seed + seed + seed) + 3) & 255;
+            let a[i] = seed - 128;
+            let i = i + 1;
+        }
+        do Main.sort(a, 40);
+        let out[0] = Main.fibonacci(12);
+        let out[1] = a[0] + a[39] - (a[20] | a[19]);
+        return;
+    }
+}
+'''}
+
+# RAM compared between the two builds: statics and the workload's output and array
+COMPARED = [(16, 256), (8000, 8200)]
+
+
+def build_both(sources, system):
+    # returns the ROMs of the VM path and the Hack backend
+    roms = []
+    for backend in ['vm', 'hack']:
+        with tempfile.TemporaryDirectory() as directory:
+            if isinstance(sources, dict):
+                for name, source in sources.items():
+                    with open(os.path.join(directory, name), 'w') as temp:
+                        temp.write(source)
+            else:
+                for name in os.listdir(sources):
+                    if name.endswith('.jack'):
+                        shutil.copy(os.path.join(sources, name), directory)
+            if system:
+                for name in os.listdir(system):
+                    if name.endswith('.vm') and not os.path.exists(os.path.join(directory, name.replace('.vm', '.jack'))):
+                        shutil.copy(os.path.join(system, name), directory)
+            if backend == 'vm':
+                compile_jack(directory)
+                roms.append(build(directory))
+            else:
+                roms.append(compile_hack(directory))
+    return roms
+
+
+if __name__ == '__main__':
+    sources = sys.argv[1] if len(sys.argv) > 1 else SOURCES
+    system = sys.argv[2] if len(sys.argv) > 2 else None
+    results = []
+    print('backend'.rjust(8), 'cycles'.rjust(10), 'ROM'.rjust(8))
+    for backend, rom in zip(['vm', 'hack'], build_both(sources, system)):
+        cpu = CPUEmulator(rom)
+        cpu.run(50000000)
+        results.append([cpu.ram[start:end] for start, end in COMPARED])
+        print(backend.rjust(8), str(cpu.cycles).rjust(10), str(len(rom)).rjust(8), '' if cpu.halted else '(stopped)')
+    print('RAM matches' if results[0] == results[1] else 'RAM differs')
@@ -0,0 +1,176 @@
+'''
+Runs a corpus of Hack programs on the CPUEmulator in a pool of worker processes and reports them together.
+
+The programs are .hack files and packed ROM images (.bin or .rom, read as by the Assembler's
+Disassembler), given as files or directories. Decoding is shared: every 16 bit word is decoded once into
+emulator.decode_table(), which is built before the pool starts (forked workers inherit it, other workers
+build it once in their initializer), and each emulator only looks its ROM up in it. The programs are
+sent to the workers in chunks, so a worker runs many emulators without a round trip per program.
+
+Each program runs until it halts or its cycle budget is used up: --cycles for all programs, or the budget
+of its name (the file name without its extension) in a --budgets file of 'name cycles' lines. The report
+has, for each program, its status (halted, budget when it did not halt within its budget, or error),
+cycles, ROM words, the registers R0-R15 and a hash of RAM up to the keyboard, then the totals. A saved
+report is a baseline: a later run must give every program the same status and RAM.
+
+To use this script run 'python batch.py <path> [path ...] [options]', e.g. 'python batch.py
+../Assembler/hack --set 0=3 --set 1=5'. The exit status is 1 if a program did not halt or differs from
+the baseline.
+
+Options:
+    --cycles N          cycle budget of each program (default 10000000)
+    --budgets FILE      budgets of single programs, 'name cycles' lines
+    --set ADDR=VALUE    initial value of a RAM address for every program, can be repeated
+    --jobs N            worker processes (default the number of CPUs)
+    --json FILE         write the report as JSON
+    --baseline FILE     compare with a saved report
+'''
+
+import os, sys, json, time, hashlib, argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from emulator import CPUEmulator, decode_table
+from toolchain import load_tool
+
+EXTENSIONS = ('.hack', '.bin', '.rom')
+# RAM hashed after a run, up to and including the keyboard
+RAM_SIZE = 24577
+
+
+def find_programs(paths):
+    # program name -> file, for files and the programs in directories
+    programs = dict()
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, x) for x in sorted(os.listdir(path)) if x.endswith(EXTENSIONS)]
+        else:
+            files = [path]
+        for file in files:
+            name = os.path.splitext(os.path.basename(file))[0]
+            if name in programs:
+                name = os.path.normpath(file)
+            programs[name] = file
+    return programs
+
+
+def read_budgets(filename):
+    # 'name cycles' lines -> {name: cycles}, '#' starts a comment
+    budgets = dict()
+    with open(filename, 'r') as temp:
+        for line in temp:
+            line = line.split('#')[0].split()
+            if line:
+                budgets[line[0]] = int(line[1])
+    return budgets
+
+
+def run_program(name, file, budget, memory, table):
+    # run one program on a new emulator, returns its results
+    start = time.perf_counter()
+    try:
+        rom = load_tool('Assembler', 'disassembler').read_rom(file)
+        if len(rom) > 32768:
+            raise ValueError('%d words do not fit in the ROM' % len(rom))
+        machine = CPUEmulator(rom, table)
+        for address, value in memory.items():
+            machine.ram[address] = value & 0xFFFF
+        machine.run(budget)
+    except (OSError, ValueError) as error:
+        return {'program': name, 'status': 'error', 'error': str(error), 'cycles': 0, 'budget': budget,
+                'rom': None, 'registers': None, 'ram': None, 'seconds': round(time.perf_counter() - start, 6)}
+    return {'program': name, 'status': 'halted' if machine.halted else 'budget', 'cycles': machine.cycles,
+            'budget': budget, 'rom': len(rom), 'registers': machine.ram[:16],
+            'ram': hashlib.blake2b(array('H', machine.ram[:RAM_SIZE]).tobytes(), digest_size=8).hexdigest(),
+            'seconds': round(time.perf_counter() - start, 6)}
+
+
+def run_chunk(jobs, memory):
+    # a worker's job: several programs, all decoded with the worker's shared table
+    table = decode_table()
+    return [run_program(name, file, budget, memory, table) for name, file, budget in jobs]
+
+
+def run(programs, cycles = 10000000, budgets = None, memory = None, jobs = None):
+    # {name: file} -> the report, see the module docstring
+    budgets, memory = budgets or dict(), memory or dict()
+    work = [(name, file, budgets.get(name, cycles)) for name, file in programs.items()]
+    workers = jobs or os.cpu_count() or 1
+    # a few chunks per worker, so a slow program does not keep the others waiting
+    size = max(1, -(-len(work) // (workers * 4)))
+    start = time.perf_counter()
+    decode_table()
+    with ProcessPoolExecutor(workers, initializer=decode_table) as pool:
+        futures = [pool.submit(run_chunk, work[n:n + size], memory) for n in range(0, len(work), size)]
+        results = [result for future in futures for result in future.result()]
+    seconds = time.perf_counter() - start
+    statuses = dict()
+    for result in results:
+        statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    total = sum(result['cycles'] for result in results)
+    return {'programs': {result['program']: result for result in results}, 'count': len(results),
+            'status': statuses, 'cycles': total, 'workers': workers, 'seconds': round(seconds, 6),
+            'cycles_per_second': round(total / seconds) if seconds else None}
+
+
+def compare(report, baseline):
+    # programs whose status or RAM differs from the baseline's, with what differs
+    differ = dict()
+    for name, result in report['programs'].items():
+        old = baseline['programs'].get(name)
+        if old is None:
+            continue
+        if result['status'] != old['status']:
+            differ[name] = 'status %s, was %s' % (result['status'], old['status'])
+        elif result['ram'] != old['ram']:
+            differ[name] = 'RAM differs'
+    return differ
+
+
+def parse_memory(settings):
+    # ['addr=value', ...] -> {address: value}
+    memory = dict()
+    for setting in settings:
+        address, value = setting.split('=')
+        memory[int(address)] = int(value)
+    return memory
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Runs many Hack programs in a pool of emulators.')
+    arguments.add_argument('paths', nargs='+', help='.hack files, packed ROM images or directories of them')
+    arguments.add_argument('--cycles', type=int, default=10000000, help='cycle budget of each program')
+    arguments.add_argument('--budgets', metavar='FILE', help="budgets of single programs, 'name cycles' lines")
+    arguments.add_argument('--set', metavar='ADDR=VALUE', action='append', default=[],
+                           help='initial value of a RAM address, can be repeated')
+    arguments.add_argument('--jobs', type=int, help='worker processes (default the number of CPUs)')
+    arguments.add_argument('--json', metavar='FILE', help='write the report as JSON')
+    arguments.add_argument('--baseline', metavar='FILE', help='compare with a saved report')
+    options = arguments.parse_args()
+    try:
+        memory = parse_memory(options.set)
+        budgets = read_budgets(options.budgets) if options.budgets else None
+    except (OSError, ValueError) as error:
+        sys.exit(str(error))
+    programs = find_programs(options.paths)
+    if not programs:
+        sys.exit('no .hack files or ROM images found')
+    report = run(programs, options.cycles, budgets, memory, options.jobs)
+    differ = dict()
+    if options.baseline:
+        with open(options.baseline, 'r') as temp:
+            differ = compare(report, json.load(temp))
+    print('program'.ljust(24), 'status'.ljust(7), 'cycles'.rjust(11), 'budget'.rjust(11), 'ROM'.rjust(6), ' R0-R3')
+    for name, result in sorted(report['programs'].items()):
+        print(name[:24].ljust(24), result['status'].ljust(7), str(result['cycles']).rjust(11),
+              str(result['budget']).rjust(11), str(result['rom'] or '').rjust(6),
+              '', result.get('error') or ' '.join(str(x) for x in result['registers'][:4]),
+              '  ' + differ[name] if name in differ else '')
+    print(report['count'], 'programs:', ', '.join('%d %s' % (n, status) for status, n in sorted(report['status'].items())),
+          '-', report['cycles'], 'cycles in', report['seconds'], 's on', report['workers'], 'workers',
+          '(%s cycles/s)' % report['cycles_per_second'])
+    if options.baseline:
+        print('baseline:', 'same results' if not differ else '%d programs differ' % len(differ))
+    if options.json:
+        with open(options.json, 'w') as temp:
+            json.dump(report, temp, indent=1)
+    sys.exit(1 if differ or len(report['programs']) != report['status'].get('halted', 0) else 0)
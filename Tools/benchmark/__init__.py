@@ -0,0 +1,11 @@
+'''
+Benchmark suite for the Assembler, VM Translator and Jack compiler.
+
+    generators - synthetic .asm, .vm and .jack programs of a given size and shape
+    runner - times each stage with warmup and repetitions, saves results as JSON and compares them with a baseline
+
+Run 'python -m benchmark --help' from the 'Tools' folder.
+'''
+
+from benchmark.generators import generate_asm, generate_vm, generate_jack
+from benchmark.runner import STAGES, measure, run, compare, save, load
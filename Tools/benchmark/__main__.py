@@ -0,0 +1,48 @@
+'''
+Runs the benchmark suite and prints a table of the results.
+
+To use it run 'python -m benchmark [options]' from the 'Tools' folder, e.g.
+
+    python -m benchmark --save baseline.json
+    python -m benchmark --baseline baseline.json --save latest.json
+
+The exit status is 1 if any case is slower than the baseline by more than the threshold.
+'''
+
+import sys, argparse
+from benchmark.runner import STAGES, run, compare, save, load
+
+arguments = argparse.ArgumentParser(prog='python -m benchmark',
+                                    description='Times the Assembler, VM Translator and Jack compiler on generated inputs.')
+arguments.add_argument('--stages', nargs='+', choices=list(STAGES), help='stages to run (default all)')
+arguments.add_argument('--shapes', nargs='+', help='shapes to run (default all of each stage)')
+arguments.add_argument('--sizes', nargs='+', type=int, help="sizes to run, in each stage's unit (default two per stage)")
+arguments.add_argument('--scale', type=float, default=1.0, help='multiply every size, e.g. 0.1 for a quick run')
+arguments.add_argument('--warmup', type=int, default=1, help='untimed runs before each case (default 1)')
+arguments.add_argument('--repeat', type=int, default=5, help='timed runs of each case (default 5)')
+arguments.add_argument('--save', metavar='FILE', help='write the results to FILE as JSON')
+arguments.add_argument('--baseline', metavar='FILE', help='compare the median times with a saved run')
+arguments.add_argument('--threshold', type=float, default=0.1,
+                       help='relative slowdown reported as a regression (default 0.1)')
+options = arguments.parse_args()
+
+results = run(options.stages, options.sizes, options.shapes, options.warmup, options.repeat, options.scale)
+changes = compare(results, load(options.baseline), options.threshold) if options.baseline else dict()
+
+print('stage'.ljust(10), 'shape'.ljust(12), 'size'.rjust(7), 'unit'.ljust(12), 'lines'.rjust(8), 'median ms'.rjust(10),
+      'min ms'.rjust(9), 'lines/s'.rjust(9), ' baseline' if options.baseline else '')
+for name, case in results['cases'].items():
+    change = ''
+    if name in changes:
+        ratio, status = changes[name]
+        change = ' %+.1f%% %s' % (100 * (ratio - 1), status if status != 'same' else '')
+    print(case['stage'].ljust(10), case['shape'].ljust(12), str(case['size']).rjust(7), STAGES[case['stage']][2].ljust(12),
+          str(case['lines']).rjust(8), ('%.1f' % (1000 * case['median'])).rjust(10), ('%.1f' % (1000 * case['min'])).rjust(9),
+          str(int(case['lines'] / case['median'])).rjust(9), change)
+
+if options.save:
+    save(results, options.save)
+regressions = [name for name, (ratio, status) in changes.items() if status == 'regression']
+if regressions:
+    print(len(regressions), 'regression(s):', ', '.join(regressions))
+    sys.exit(1)
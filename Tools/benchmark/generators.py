@@ -0,0 +1,152 @@
+'''
+Generators of large synthetic inputs for the Assembler, VM Translator and Jack compiler.
+
+Each generator takes a size and a shape and returns the files of a program as {filename: source}. The output
+only depends on its arguments, so a benchmark run on the same size and shape always gets the same input.
+The programs are valid for the tools (labels are defined, calls pass the arguments the callee takes) but are
+not meant to be run.
+'''
+
+# subroutines (or VM functions) per generated class
+PER_CLASS = 20
+
+
+def generate_asm(instructions, shape = 'straight'):
+    # a single .asm file of about the given number of instructions
+    # 'straight' - arithmetic on constants and the predefined registers, no labels
+    # 'symbols' - a label per block and many variables, which loads the symbol table
+    lines = []
+    n = 0
+    while n < instructions:
+        if shape == 'straight':
+            block = ['@' + str(n % 32768), 'D=A', '@R' + str(n % 16), 'M=D+M', 'D=M', '@SP', 'AM=M+1', 'M=D']
+        elif shape == 'symbols':
+            block = ['(L' + str(n) + ')', '@v' + str(n % 1000), 'M=M-1', 'D=M', '@L' + str(n // 2), 'D;JGT',
+                     '@w' + str((n * 7) % 1000), 'M=D']
+        else:
+            raise ValueError('unknown asm shape: ' + shape)
+        lines += block
+        n += len([line for line in block if not line.startswith('(')])
+    lines += ['(END)', '@END', '0;JMP']
+    return {'Gen.asm': '\n'.join(lines) + '\n'}
+
+
+def vm_function(name, k, shape, calls):
+    # a VM function of about 40 commands, k varies the constants and the callee
+    code = ['function ' + name + ' 3']
+    if shape == 'arithmetic':
+        for j in range(6):
+            code += ['push argument 0', 'push constant ' + str((k * 7 + j) % 1000), 'add',
+                     'push local ' + str(j % 3), ['sub', 'and', 'or', 'eq', 'lt', 'gt'][j], 'not',
+                     'pop local ' + str((j + 1) % 3)]
+    elif shape == 'calls':
+        for j in range(5):
+            code += ['push local ' + str(j % 3), 'push constant ' + str(k + j), 'call ' + calls[j], 'pop temp 0',
+                     'push static ' + str(j), 'push temp 0', 'add', 'pop local ' + str(j % 3)]
+    elif shape == 'branches':
+        for j in range(4):
+            label = 'B' + str(j)
+            code += ['label ' + label, 'push local 0', 'push constant ' + str(k + 10 * j), 'lt', 'not',
+                     'if-goto ' + label + '_END', 'push local 0', 'push constant 1', 'add', 'pop local 0',
+                     'goto ' + label, 'label ' + label + '_END']
+    else:
+        raise ValueError('unknown vm shape: ' + shape)
+    return code + ['push local 0', 'return']
+
+
+def generate_vm(functions, shape = 'arithmetic'):
+    # .vm files with the given number of functions, PER_CLASS to a file, and a Sys.init calling them
+    # 'arithmetic' - stack arithmetic and comparisons on locals and arguments
+    # 'calls' - every function calls five others, in other files
+    # 'branches' - loops of labels, if-goto and goto
+    functions = max(1, functions)
+    classes = (functions + PER_CLASS - 1) // PER_CLASS
+    names = ['Gen' + str(n // PER_CLASS) + '.f' + str(n % PER_CLASS) for n in range(functions)]
+    files = dict()
+    for c in range(classes):
+        code = []
+        for n in range(c * PER_CLASS, min(functions, (c + 1) * PER_CLASS)):
+            calls = [names[(n * 3 + j + 1) % len(names)] + ' 2' for j in range(5)]
+            code += vm_function(names[n], n, shape, calls)
+        files['Gen' + str(c) + '.vm'] = '\n'.join(code) + '\n'
+    init = ['function Sys.init 0'] + sum([['push constant 1', 'push constant 2', 'call ' + names[c * PER_CLASS] + ' 2',
+                                           'pop temp 0'] for c in range(classes)], []) + ['label END', 'goto END']
+    files['Sys.vm'] = '\n'.join(init) + '\n'
+    return files
+
+
+JACK = {
+    'statements': '''
+    /** Subroutine %(k)d of a generated class. */
+    function int f%(k)d(int x, int y) {
+        var int i, total;
+        var Array values;
+        let values = Array.new(y);
+        let i = 0; // counter
+        let total = x;
+        while (i < y) {
+            if ((i & 1) = 0) { let total = total + (x * i) - %(k)d; }
+            else { let total = total - (y / 2) | 5; }
+            let values[i] = total;
+            let i = i + 1;
+        }
+        do Output.printString("f%(k)d done");
+        return total;
+    }
+''',
+    'calls': '''
+    function int f%(k)d(int x, int y) {
+        var Gen%(c)d o;
+        let o = Gen%(c)d.new(x);
+        do o.set(y + %(k)d);
+        if (x > 0) {
+            return Gen%(next)d.f%(callee)d(x - 1, o.get()) + o.add(Math.max(x, y));
+        }
+        do o.dispose();
+        return o.get();
+    }
+''',
+    'expressions': '''
+    function int f%(k)d(int a, int b, Array c) {
+        var int d, e;
+        let d = ((a + b) * (c[0] - %(k)d)) / ((a | ~b) + 1) & -c[a + 1];
+        let e = (((d * d) - (a * b)) + ((c[d] & 255) | (~(a = b)))) - ((-d) + (b / (a + 3)));
+        let c[(a + b) & 15] = (d > e) & (e < %(k)d) | ~(d = e);
+        return (d + e) * ((a - b) + (c[1] * c[2])) - (d / 7);
+    }
+''',
+}
+
+# fields, constructor and methods used by the 'calls' shape
+JACK_OBJECT = '''
+    field int a, b;
+    constructor Gen%(c)d new(int x) { let a = x; let b = x + %(c)d; return this; }
+    method int get() { return a + b; }
+    method void set(int x) { let a = x; return; }
+    method int add(int x) { let b = b + x; return b; }
+    method void dispose() { do Memory.deAlloc(this); return; }
+'''
+
+
+def generate_jack(subroutines, shape = 'statements'):
+    # .jack classes with the given number of subroutines, PER_CLASS to a class
+    # 'statements' - loops, branches and arrays with comments, like hand written code
+    # 'calls' - objects and calls between the classes, checked against the class index
+    # 'expressions' - long nested expressions with every operator
+    if shape not in JACK:
+        raise ValueError('unknown jack shape: ' + shape)
+    subroutines = max(1, subroutines)
+    classes = (subroutines + PER_CLASS - 1) // PER_CLASS
+    files = dict()
+    for c in range(classes):
+        values = {'c': c, 'next': (c + 1) % classes}
+        source = 'class Gen' + str(c) + ' {\n'
+        if shape == 'calls':
+            source += JACK_OBJECT % values
+        for k in range(min(PER_CLASS, subroutines - c * PER_CLASS)):
+            # the subroutine called in the next class, which may be the last and shorter one
+            values['k'] = k
+            values['callee'] = k % min(PER_CLASS, subroutines - values['next'] * PER_CLASS)
+            source += JACK[shape] % values
+        files['Gen' + str(c) + '.jack'] = source + '}\n'
+    return files
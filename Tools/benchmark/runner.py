@@ -0,0 +1,101 @@
+'''
+Times the stages of the toolchain on generated inputs and compares the results with a stored baseline.
+
+A case is a stage, a shape and a size. Its input is generated into a temporary folder, the stage is run a
+few times to warm up and then timed over a number of repetitions, each a full build (the compiler's class
+index cache is removed first). Results are kept as a dictionary that is saved as JSON, keyed by
+'stage/shape/size', so a saved run can be used as the baseline of later ones.
+'''
+
+import os, time, json, platform, tempfile, statistics
+from toolchain import compile_jack, translate, assemble
+from benchmark.generators import generate_asm, generate_vm, generate_jack
+
+# stage -> (generator, shapes, unit of size, default sizes)
+STAGES = {
+    'assemble': (generate_asm, ['straight', 'symbols'], 'instructions', [5000, 30000]),
+    'translate': (generate_vm, ['arithmetic', 'calls', 'branches'], 'functions', [40, 400]),
+    'compile': (generate_jack, ['statements', 'calls', 'expressions'], 'subroutines', [40, 400]),
+}
+
+
+def key(stage, shape, size):
+    return stage + '/' + shape + '/' + str(size)
+
+
+def run_stage(stage, directory):
+    # run stage on the generated files in directory
+    if stage == 'assemble':
+        assemble(os.path.join(directory, 'Gen.asm'))
+    elif stage == 'translate':
+        translate(directory)
+    else:
+        cache = os.path.join(directory, '.classindex.json')
+        if os.path.exists(cache):
+            os.remove(cache)
+        compile_jack(directory)
+
+
+def measure(stage, shape, size, warmup = 1, repeat = 5):
+    # time one case, returns its result as a dictionary
+    generator = STAGES[stage][0]
+    with tempfile.TemporaryDirectory() as directory:
+        files = generator(size, shape)
+        lines = 0
+        for name, source in files.items():
+            with open(os.path.join(directory, name), 'w') as temp:
+                temp.write(source)
+            lines += source.count('\n')
+        for _ in range(warmup):
+            run_stage(stage, directory)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_stage(stage, directory)
+            times.append(time.perf_counter() - start)
+    return {'stage': stage, 'shape': shape, 'size': size, 'lines': lines, 'times': times,
+            'min': min(times), 'median': statistics.median(times)}
+
+
+def run(stages = None, sizes = None, shapes = None, warmup = 1, repeat = 5, scale = 1.0):
+    # measure every case, sizes and shapes default to those of each stage, scale multiplies the sizes
+    results = {'python': platform.python_version(), 'machine': platform.machine(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'warmup': warmup, 'repeat': repeat, 'cases': dict()}
+    for stage in stages or list(STAGES):
+        _, default_shapes, _, default_sizes = STAGES[stage]
+        for shape in shapes or default_shapes:
+            if shape not in default_shapes:
+                continue
+            for size in sizes or default_sizes:
+                size = max(1, int(size * scale))
+                results['cases'][key(stage, shape, size)] = measure(stage, shape, size, warmup, repeat)
+    return results
+
+
+def compare(results, baseline, threshold = 0.1):
+    # {key: (ratio of median times, status)} for the cases in both runs, status is 'regression' when a case
+    # got slower by more than threshold, 'faster' when it got faster by more than threshold, otherwise 'same'
+    changes = dict()
+    for name, case in results['cases'].items():
+        old = baseline['cases'].get(name)
+        if old is None:
+            continue
+        ratio = case['median'] / old['median']
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 - threshold:
+            status = 'faster'
+        else:
+            status = 'same'
+        changes[name] = (ratio, status)
+    return changes
+
+
+def save(results, filename):
+    with open(filename, 'w') as temp:
+        json.dump(results, temp, indent=1)
+
+
+def load(filename):
+    with open(filename, 'r') as temp:
+        return json.load(temp)
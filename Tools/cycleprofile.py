@@ -0,0 +1,248 @@
+'''
+Cycle profiler for Hack programs, mapping the ROM addresses that use the most cycles back to the VM code.
+
+The CycleProfiler is a CPUEmulator that counts how often each ROM address runs, in an array with one
+counter per instruction. With the Assembler's label table these counts are added up per label (a label
+covers the addresses up to the next one, e.g. 'Main.loop$WHILE0' or a 'CALL12' return point, labels inside
+the code of a single VM command such as 'TRUE3' are not counted on their own) and per VM
+function (from a function's label up to the next function's). The profiler also follows the calling
+convention of the VM Translator: a jump to a function's label is a call, whose return address is at
+LCL-5, a jump to the return address of the innermost call is its return and a call that keeps the return
+address and ARG of the current call is a tail call. Cycles are counted per call stack, which gives the
+inclusive cycles and calls of each function and can be written in the collapsed stack format read by
+flamegraph.pl, speedscope and similar tools.
+
+To use this script run 'python cycleprofile.py <path> [options]', where <path> is an .asm file, a .vm file
+or a directory of .vm or .jack files (.jack files are compiled first).
+
+Options:
+    --cycles N          stop after N cycles (default: run until the program halts)
+    --top N             number of functions and labels listed (default 15)
+    --collapsed FILE    write the cycles per call stack as collapsed stacks, e.g. for flamegraph.pl
+    --json FILE         write the totals per function and label and the hottest addresses as JSON
+'''
+
+import os, json, argparse
+from array import array
+from emulator import CPUEmulator, load_hack, jumps
+from toolchain import load_tool, quiet, compile_jack, translate
+
+# name of the code before the first function, the bootstrap, and the root of every call stack
+BOOTSTRAP = '(bootstrap)'
+
+
+def is_function(label):
+    # labels written for 'function f n' are the plain function names, labels inside a function are 'f$label'
+    return '.' in label and '$' not in label
+
+
+def is_named(label):
+    # functions, labels of the VM code and call return points, other labels such as TRUE3 or COPY5 are
+    # internal to the code of one VM command and counted with the label before them
+    return '.' in label or '$' in label or label.startswith('CALL') or label == 'END'
+
+
+def load_program(path, **options):
+    # assemble the program at path, returns (ROM, label -> address)
+    path = os.path.normpath(path)
+    if path.endswith('.asm'):
+        asm = path
+    else:
+        if os.path.isdir(path) and any(x.endswith('.jack') for x in os.listdir(path)):
+            compile_jack(path)
+        asm = translate(path, **options)
+    hack = asm.replace('.asm', '.hack')
+    assembler = quiet(load_tool('Assembler', 'Assembler').Assembler, asm, hack)
+    return load_hack(hack), assembler.labels()
+
+
+class CycleProfiler(CPUEmulator):
+    '''
+    A CPUEmulator counting the cycles of each ROM address and of each call stack.
+    '''
+
+    def __init__(self, rom, labels):
+        CPUEmulator.__init__(self, rom)
+        # runs of each ROM address
+        self.hits = array('Q', bytes(8 * len(rom)))
+        # label names at each address, in ROM order
+        self._labels = dict()
+        for label, address in sorted(labels.items(), key=lambda x: x[1]):
+            if is_named(label):
+                self._labels.setdefault(address, []).append(label)
+        # function label addresses -> function name
+        self._entries = {address: label for label, address in labels.items() if is_function(label)}
+        # call stack -> cycles, the stack as 'f;g;h' from the outermost call
+        self.stacks = dict()
+        # function -> number of calls, tail calls included
+        self.calls = dict()
+        # open calls: (stack, return address, ARG), and how many of them return to each address
+        self._frames = [(BOOTSTRAP, None, None)]
+        self._returns = dict()
+        self._mark = 0
+
+    def reset(self):
+        CPUEmulator.reset(self)
+        self.hits = array('Q', bytes(8 * len(self.rom)))
+        self.stacks = dict()
+        self.calls = dict()
+        self._frames = [(BOOTSTRAP, None, None)]
+        self._returns = dict()
+        self._mark = 0
+
+    def run(self, max_cycles = None):
+        # the loop of CPUEmulator.run, counting the cycles of each address and following calls and returns
+        program, ram, halt, hits = self._program, self.ram, self._halt, self.hits
+        entries, frames, returns, stacks, calls = self._entries, self._frames, self._returns, self.stacks, self.calls
+        a, d, pc, max_sp, mark = self.a, self.d, self.pc, self.max_sp, self._mark
+        start = self.cycles
+        limit = float('inf') if max_cycles is None else self.cycles + max_cycles
+        cycles = self.cycles
+        size = len(program)
+        while cycles < limit:
+            if pc in halt or pc >= size:
+                self.halted = True
+                break
+            is_c, comp, use_m, dest, jump = program[pc]
+            hits[pc] += 1
+            cycles += 1
+            if not is_c:
+                a = comp
+                pc += 1
+                continue
+            out = comp(d, ram[a] if use_m else a) & 0xFFFF
+            target = a
+            if dest & 1:
+                ram[a] = out
+                if a == 0 and out > max_sp:
+                    max_sp = out
+            if dest & 4:
+                a = out
+            if dest & 2:
+                d = out
+            if not (jump and jumps(jump, out)):
+                pc += 1
+                continue
+            pc = target
+            if target in entries:
+                # a call, the cycles so far belong to the caller's stack
+                stack = frames[-1][0]
+                stacks[stack] = stacks.get(stack, 0) + cycles - mark
+                mark = cycles
+                name = entries[target]
+                calls[name] = calls.get(name, 0) + 1
+                back = ram[(ram[1] - 5) & 0xFFFF]
+                if len(frames) > 1 and frames[-1][1] == back and frames[-1][2] == ram[2]:
+                    # a tail call takes over the caller's frame, its arguments start where the caller's did
+                    frames[-1] = (frames[-2][0] + ';' + name, back, ram[2])
+                else:
+                    frames.append((stack + ';' + name, back, ram[2]))
+                    returns[back] = returns.get(back, 0) + 1
+            elif target in returns:
+                # a return, to the innermost call with this return address
+                stack = frames[-1][0]
+                stacks[stack] = stacks.get(stack, 0) + cycles - mark
+                mark = cycles
+                while True:
+                    back = frames.pop()[1]
+                    returns[back] -= 1
+                    if not returns[back]:
+                        del returns[back]
+                    if back == target:
+                        break
+        stack = frames[-1][0]
+        stacks[stack] = stacks.get(stack, 0) + cycles - mark
+        self.a, self.d, self.pc, self.cycles, self.max_sp, self._mark = a, d, pc, cycles, max_sp, cycles
+        return cycles - start
+
+    def label_cycles(self):
+        # label -> cycles of the addresses from the label up to the next one, labels at the same address are
+        # joined with '='
+        totals = dict()
+        owner = BOOTSTRAP
+        for address, count in enumerate(self.hits):
+            if address in self._labels:
+                owner = '='.join(self._labels[address])
+            if count:
+                totals[owner] = totals.get(owner, 0) + count
+        return totals
+
+    def function_cycles(self):
+        # function -> cycles of its own code, the Linker's stubs after '(END)' are counted under their labels
+        totals = dict()
+        owner = BOOTSTRAP
+        for address, count in enumerate(self.hits):
+            for label in self._labels.get(address, []):
+                if is_function(label) or label == 'END' or label.startswith('LINK$STUB'):
+                    owner = label
+            if count:
+                totals[owner] = totals.get(owner, 0) + count
+        return totals
+
+    def inclusive_cycles(self):
+        # function -> cycles spent in calls to it, including the functions it calls
+        totals = dict()
+        for stack, count in self.stacks.items():
+            for name in set(stack.split(';')):
+                totals[name] = totals.get(name, 0) + count
+        return totals
+
+    def write_collapsed(self, filename):
+        # one 'outer;inner;innermost cycles' line per call stack
+        with open(filename, 'w') as temp:
+            temp.writelines(stack + ' ' + str(count) + '\n' for stack, count in sorted(self.stacks.items()) if count)
+
+    def hot_addresses(self, count):
+        # the count addresses run most often, as (address, runs, label covering it)
+        owners = []
+        owner = BOOTSTRAP
+        for address in range(len(self.hits)):
+            if address in self._labels:
+                owner = '='.join(self._labels[address])
+            owners.append(owner)
+        hottest = sorted(range(len(self.hits)), key=lambda x: -self.hits[x])[:count]
+        return [(address, self.hits[address], owners[address]) for address in hottest if self.hits[address]]
+
+    def report(self, top = 20):
+        # the profile as a dictionary, for JSON
+        inclusive = self.inclusive_cycles()
+        return {'cycles': self.cycles, 'halted': self.halted,
+                'functions': {name: {'self': count, 'inclusive': inclusive.get(name, count),
+                                     'calls': self.calls.get(name, 0)}
+                              for name, count in sorted(self.function_cycles().items(), key=lambda x: -x[1])},
+                'labels': dict(sorted(self.label_cycles().items(), key=lambda x: -x[1])),
+                'addresses': [{'address': address, 'runs': runs, 'label': label}
+                              for address, runs, label in self.hot_addresses(top)]}
+
+
+def table(title, rows, total):
+    print(title.ljust(40), 'cycles'.rjust(12), '%'.rjust(6))
+    for name, count in rows:
+        print(name[:40].ljust(40), str(count).rjust(12), ('%.1f' % (100 * count / total)).rjust(6))
+    print()
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Profiles the cycles of a Hack program per VM function and label.')
+    arguments.add_argument('path', help='.asm file, .vm file or directory of .vm or .jack files')
+    arguments.add_argument('--cycles', type=int, help='stop after this many cycles')
+    arguments.add_argument('--top', type=int, default=15, help='number of functions and labels listed')
+    arguments.add_argument('--collapsed', metavar='FILE', help='write collapsed call stacks for flame graphs')
+    arguments.add_argument('--json', metavar='FILE', help='write the profile as JSON')
+    options = arguments.parse_args()
+    profiler = CycleProfiler(*load_program(options.path))
+    profiler.run(options.cycles)
+    total = max(1, profiler.cycles)
+    print(options.path, 'ran for', profiler.cycles, 'cycles', '(halted)' if profiler.halted else '(stopped)', '\n')
+    report = profiler.report(options.top)
+    print('function'.ljust(40), 'self'.rjust(12), '%'.rjust(6), 'inclusive'.rjust(12), 'calls'.rjust(9))
+    for name, counts in list(report['functions'].items())[:options.top]:
+        print(name[:40].ljust(40), str(counts['self']).rjust(12), ('%.1f' % (100 * counts['self'] / total)).rjust(6),
+              str(counts['inclusive']).rjust(12), str(counts['calls']).rjust(9))
+    print()
+    table('label', list(report['labels'].items())[:options.top], total)
+    if options.collapsed:
+        profiler.write_collapsed(options.collapsed)
+    if options.json:
+        with open(options.json, 'w') as temp:
+            json.dump(report, temp, indent=1)
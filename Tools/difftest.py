@@ -0,0 +1,293 @@
+'''
+Differential test of the compiler, optimizer and translator: every program of a corpus is built at each
+optimization level, run, and its final state is compared with the first level's.
+
+Levels (LEVELS):
+    vm      the compiler's .vm code run on the VMEmulator, without any optimization, counting VM commands
+    O0      translated without tail calls and without the Linker's merging of duplicate functions
+    O1      translated as by default, with tail calls and merged duplicate functions
+    O2      the VM optimizer (inlining, peephole, jump threading) first, then translated with shared stubs
+    hack    compiled straight to Hack assembly by the compiler's Hack backend
+
+All levels but vm are assembled and run on the CPUEmulator. The state compared is the value of every
+static variable (found by name in the Assembler's variables, as their addresses can change between
+levels) and RAM from the heap to the keyboard (2048-24576), i.e. the heap, the screen and any fixed
+addresses the program writes to. The stack is not compared. A level passes when it halts like the first
+level and leaves the same state. Programs calling functions they do not contain (such as the Jack OS)
+cannot run on the CPUEmulator, such levels are reported as missing. The cycles and ROM words of each
+level are reported relative to O0.
+
+Each build and run is a job for a pool of worker processes. The corpus is the workloads of
+backend_benchmark.py and tailcall_benchmark.py and an object test with its own Memory and Math classes,
+as the Jack OS is not part of this repository. Directories of .jack or .vm files can be given as
+well, with --os a directory of Jack OS .vm files is copied into each build of a program that calls them.
+
+To use this script run 'python difftest.py [directory ...] [options]'. The exit status is 1 if any level
+fails.
+
+Options:
+    --levels L ...      levels to build, the first is the reference (default vm O0 O1 O2 hack)
+    --jobs N            worker processes (default the number of CPUs)
+    --max-cycles N      cycles (or VM commands) each run may take (default 50000000)
+    --os DIR            directory of Jack OS .vm files
+    --json FILE         write the results as JSON
+'''
+
+import os, sys, json, shutil, tempfile, argparse
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from emulator import CPUEmulator, load_hack
+from vmemulator import VMEmulator, vm_files
+from toolchain import load_tool, quiet, compile_jack, translate
+import backend_benchmark, tailcall_benchmark
+
+# level -> (run on the VMEmulator, compiler backend, VM optimizer inlining or None, VMTranslator options)
+LEVELS = {'vm': (True, 'vm', None, {}),
+          'O0': (False, 'vm', None, {'tail_calls': False, 'dedup': False}),
+          'O1': (False, 'vm', None, {}),
+          'O2': (False, 'vm', 8, {'share_stubs': True}),
+          'hack': (False, 'hack', None, {})}
+
+# RAM compared after a run: the heap, the screen and the keyboard
+COMPARED = (2048, 24577)
+
+OBJECTS = {'Sys.jack': '''class Sys {
+    function void init() {
+        do Memory.init();
+        do Main.main();
+        while (true) {}
+        return;
+    }
+}
+''', 'Memory.jack': '''class Memory {
+    static int free;
+    function void init() { let free = 2048; return; }
+    function int alloc(int size) {
+        var int block;
+        let block = free;
+        let free = free + size;
+        return block;
+    }
+    function void deAlloc(int object) { return; }
+}
+''', 'Array.jack': '''class Array {
+    function Array new(int size) { return Memory.alloc(size); }
+    method void dispose() { do Memory.deAlloc(this); return; }
+}
+''', 'Math.jack': '''class Math {
+    function int abs(int x) { if (x < 0) { return -x; } return x; }
+    function int multiply(int x, int y) {
+        var int sum, bit, shifted;
+        let bit = 1;
+        let shifted = x;
+        while (~(bit = 0)) {
+            if (~((y & bit) = 0)) { let sum = sum + shifted; }
+            let shifted = shifted + shifted;
+            let bit = bit + bit;
+        }
+        return sum;
+    }
+    function int divide(int x, int y) {
+        var int q;
+        let q = Math.positive(Math.abs(x), Math.abs(y));
+        if ((x < 0) = (y < 0)) { return q; }
+        return -q;
+    }
+    function int positive(int x, int y) {
+        var int q;
+        if ((y > x) | (y < 0)) { return 0; }
+        let q = Math.positive(x, y + y);
+        if ((x - ((q + q) * y)) < y) { return q + q; }
+        return q + q + 1;
+    }
+}
+''', 'Node.jack': '''class Node {
+    field int value;
+    field Node next;
+    static int count;
+    constructor Node new(int v, Node n) { let value = v; let next = n; let count = count + 1; return this; }
+    method int value() { return value; }
+    method Node next() { return next; }
+    method int sum() {
+        if (next = null) { return value; }
+        return value + next.sum();
+    }
+    method Node reverse(Node done) {
+        var Node rest;
+        let rest = next;
+        let next = done;
+        if (rest = null) { return this; }
+        return rest.reverse(this);
+    }
+    function int count() { return count; }
+}
+''', 'Main.jack': '''class Main {
+    static int total, nodes;
+    function void main() {
+        var Node list;
+        var Array out;
+        var int i;
+        let out = 8000;
+        while (i < 30) {
+            let list = Node.new((i * i) - (7 * i) + (i / 3), list);
+            let i = i + 1;
+        }
+        let total = list.sum();
+        let list = list.reverse(null);
+        let i = 0;
+        while (~(list = null)) {
+            let out[i] = list.value() * (i - 15) / 4;
+            let list = list.next();
+            let i = i + 1;
+        }
+        let nodes = Node.count();
+        return;
+    }
+}
+'''}
+
+CORPUS = {'sort': backend_benchmark.SOURCES,
+          'tailcall': {name: source % 150 if '%d' in source else source
+                       for name, source in tailcall_benchmark.SOURCES.items()},
+          'objects': OBJECTS}
+
+
+def copy_sources(sources, directory, system):
+    # write a corpus program, given as {filename: source} or a directory, and the OS .vm files it lacks
+    if isinstance(sources, dict):
+        for name, source in sources.items():
+            with open(os.path.join(directory, name), 'w') as temp:
+                temp.write(source)
+    else:
+        for name in os.listdir(sources):
+            if name.endswith('.jack') or (name.endswith('.vm') and not os.path.exists(
+                    os.path.join(sources, name.replace('.vm', '.jack')))):
+                shutil.copy(os.path.join(sources, name), directory)
+    if system:
+        for name in os.listdir(system):
+            if name.endswith('.vm') and not os.path.exists(os.path.join(directory, name.replace('.vm', '.jack'))):
+                shutil.copy(os.path.join(system, name), directory)
+
+
+def run_level(program, sources, level, max_cycles, system = None):
+    # build and run one program at one level, returns its results with the compared state
+    interpret, backend, inline, translator = LEVELS[level]
+    with tempfile.TemporaryDirectory() as directory:
+        directory = os.path.join(directory, program)
+        os.mkdir(directory)
+        copy_sources(sources, directory, system)
+        if any(x.endswith('.jack') for x in os.listdir(directory)):
+            compile_jack(directory, backend=backend)
+        if interpret:
+            machine = VMEmulator(vm_files(directory))
+            machine.run(max_cycles)
+            count, rom, missing = machine.steps, None, []
+            statics = {file + '.' + str(index): machine.ram[address]
+                       for (file, index), address in machine.statics.items()}
+        else:
+            if backend == 'hack':
+                asm = directory + '/' + program + '.asm'
+            else:
+                if inline is not None:
+                    quiet(load_tool('Virtual_Machine', 'optimizer').VMOptimizer, directory, inline)
+                asm = translate(directory, **translator)
+            hack = asm.replace('.asm', '.hack')
+            assembler = quiet(load_tool('Assembler', 'Assembler').Assembler, asm, hack)
+            variables = assembler.variables()
+            # statics are named File.index, other names with a dot are calls to functions the program lacks
+            statics = {name: address for name, address in variables.items() if name.rsplit('.', 1)[-1].isdigit()}
+            missing = sorted(name for name in variables if '.' in name and name not in statics)
+            machine = CPUEmulator(load_hack(hack))
+            if not missing:
+                machine.run(max_cycles)
+            count, rom = machine.cycles, len(machine.rom)
+            statics = {name: machine.ram[address] for name, address in statics.items()}
+    return {'program': program, 'level': level, 'halted': machine.halted, 'count': count, 'rom': rom,
+            'statics': statics, 'missing': missing,
+            'memory': array('H', machine.ram[COMPARED[0]:COMPARED[1]]).tobytes()}
+
+
+def differences(result, reference):
+    # what differs between the final states of two runs, as a list of strings
+    found = []
+    if result['halted'] != reference['halted']:
+        found.append('halted' if result['halted'] else 'did not halt')
+    for name in sorted(set(result['statics']) | set(reference['statics'])):
+        # a static no code refers to is never allocated, and would be 0
+        if result['statics'].get(name, 0) != reference['statics'].get(name, 0):
+            found.append('%s = %d, expected %d' % (name, result['statics'].get(name, 0),
+                                                   reference['statics'].get(name, 0)))
+    if result['memory'] != reference['memory']:
+        new, old = array('H', result['memory']), array('H', reference['memory'])
+        addresses = [n + COMPARED[0] for n in range(len(new)) if new[n] != old[n]]
+        found.append('RAM[%d] = %d, expected %d (%d words differ)' % (
+            addresses[0], new[addresses[0] - COMPARED[0]], old[addresses[0] - COMPARED[0]], len(addresses)))
+    return found
+
+
+def run(corpus, levels, jobs = None, max_cycles = 50000000, system = None):
+    # program -> level -> results, with 'status' and 'differences' against the first level
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(run_level, program, sources, level, max_cycles, system)
+                   for program, sources in corpus.items() for level in levels]
+        results = dict()
+        for future in futures:
+            result = future.result()
+            results.setdefault(result['program'], dict())[result['level']] = result
+    for program, runs in results.items():
+        reference = runs[levels[0]]
+        for level in levels:
+            result = runs[level]
+            result['differences'] = differences(result, reference)
+            if result['missing']:
+                result['status'] = 'missing'
+                result['differences'] = ['calls functions that are not in the program: ' + ', '.join(result['missing'])]
+            elif not result['halted'] and not reference['halted']:
+                result['status'] = 'stopped'
+            else:
+                result['status'] = 'FAIL' if result['differences'] else 'pass'
+        for result in runs.values():
+            del result['memory']
+    return results
+
+
+def change(value, base):
+    if value is None or base is None or not base:
+        return ''
+    return '%+.1f%%' % (100 * (value - base) / base)
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Compares the results of programs built at each optimization level.')
+    arguments.add_argument('directories', nargs='*', help='more programs, directories of .jack or .vm files')
+    arguments.add_argument('--levels', nargs='+', choices=list(LEVELS), default=list(LEVELS),
+                           help='levels to build, the first is the reference')
+    arguments.add_argument('--jobs', type=int, help='worker processes (default the number of CPUs)')
+    arguments.add_argument('--max-cycles', type=int, default=50000000, help='cycles each run may take')
+    arguments.add_argument('--os', metavar='DIR', help='directory of Jack OS .vm files')
+    arguments.add_argument('--json', metavar='FILE', help='write the results as JSON')
+    options = arguments.parse_args()
+    corpus = dict(CORPUS)
+    for directory in options.directories:
+        directory = os.path.abspath(directory)
+        corpus[os.path.basename(directory)] = directory
+    results = run(corpus, options.levels, options.jobs, options.max_cycles,
+                  os.path.abspath(options.os) if options.os else None)
+    print('program'.ljust(14), 'level'.ljust(6), 'status'.ljust(8), 'cycles'.rjust(11), 'vs O0'.rjust(8),
+          'ROM'.rjust(7), 'vs O0'.rjust(8))
+    failed = 0
+    for program, runs in results.items():
+        base = runs.get('O0', dict())
+        for level, result in runs.items():
+            unit = ' cmds' if result['rom'] is None else ''
+            print(program[:14].ljust(14), level.ljust(6), result['status'].ljust(8),
+                  (str(result['count']) + unit).rjust(11), change(None if unit else result['count'], base.get('count')).rjust(8),
+                  str(result['rom'] or '').rjust(7), change(result['rom'], base.get('rom')).rjust(8))
+            for difference in result['differences'][:5]:
+                print(' ' * 30, difference)
+            failed += result['status'] == 'FAIL'
+    print(len(results), 'programs,', failed, 'failed')
+    if options.json:
+        with open(options.json, 'w') as temp:
+            json.dump(results, temp, indent=1)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,148 @@
+'''
+Module implementing a Hack CPU emulator, which runs the binary code produced by the Assembler.
+
+Each instruction is decoded once when the ROM is loaded, the emulator then steps through the decoded
+program until it reaches a halting loop such as '(END) @END 0;JMP' or runs out of cycles.
+
+To use this script run 'python emulator.py <hack file> [cycles]', the first 16 registers are printed.
+'''
+
+import sys
+
+# ALU output for each 6 bit comp field, x is D and y is A or M
+COMP = {0b101010: lambda x, y: 0, 0b111111: lambda x, y: 1, 0b111010: lambda x, y: -1,
+        0b001100: lambda x, y: x, 0b110000: lambda x, y: y, 0b001101: lambda x, y: ~x,
+        0b110001: lambda x, y: ~y, 0b001111: lambda x, y: -x, 0b110011: lambda x, y: -y,
+        0b011111: lambda x, y: x + 1, 0b110111: lambda x, y: y + 1, 0b001110: lambda x, y: x - 1,
+        0b110010: lambda x, y: y - 1, 0b000010: lambda x, y: x + y, 0b010011: lambda x, y: x - y,
+        0b000111: lambda x, y: y - x, 0b000000: lambda x, y: x & y, 0b010101: lambda x, y: x | y}
+
+
+def alu(comp):
+    # the ALU for comp bits outside of the documented table, built from the zx,nx,zy,ny,f,no flags
+    def compute(x, y):
+        x = 0 if comp & 32 else x
+        x = ~x if comp & 16 else x
+        y = 0 if comp & 8 else y
+        y = ~y if comp & 4 else y
+        out = x + y if comp & 2 else x & y
+        return ~out if comp & 1 else out
+    return compute
+
+
+def jumps(jump, out):
+    # out is a 16 bit value, the jump bits are (lt, eq, gt)
+    if out & 0x8000:
+        return bool(jump & 4)
+    elif out == 0:
+        return bool(jump & 2)
+    return bool(jump & 1)
+
+
+def load_hack(filename):
+    # read a .hack file into a list of 16 bit words
+    with open(filename, 'r') as temp:
+        return [int(line.strip(), 2) for line in temp if line.strip()]
+
+
+def decode(word):
+    # A instruction: (False, value), C instruction: (True, comp, uses M, dest, jump)
+    if not word & 0x8000:
+        return (False, word, None, None, None)
+    comp = (word >> 6) & 0x3F
+    return (True, COMP.get(comp, alu(comp)), bool(word & 0x1000), (word >> 3) & 7, word & 7)
+
+
+def halt_loops(rom):
+    # addresses of '@n; 0;JMP' loops at n, which is how Hack programs stop
+    return set(i for i in range(len(rom) - 1) if rom[i] == i and rom[i + 1] & 0xE007 == 0xE007)
+
+
+_table = None
+
+
+def decode_table():
+    # every 16 bit word decoded, built once per process and shared by emulators given it as their table
+    global _table
+    if _table is None:
+        _table = [decode(word) for word in range(0x10000)]
+    return _table
+
+
+class CPUEmulator():
+    '''
+    Emulates the Hack CPU with 32K words of ROM and 64K words of RAM (only the first 24577 are mapped
+    in hardware, the rest catch out of range addresses). Registers and RAM hold unsigned 16 bit values.
+    The ROM is decoded word by word, or looked up in a table such as decode_table() when one is given.
+    '''
+
+    def __init__(self, rom, table = None):
+        self.rom = rom
+        self.ram = [0] * 65536
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+        # largest value written to SP, i.e. the deepest the stack has grown
+        self.max_sp = 0
+        # ROM addresses run() stops at before running them, unless it starts there
+        self.breakpoints = set()
+        self._program = [(table[word] if table is not None else decode(word)) for word in rom]
+        self._halt = halt_loops(rom)
+
+    def reset(self):
+        self.ram = [0] * 65536
+        self.a = self.d = self.pc = self.cycles = self.max_sp = 0
+        self.halted = False
+
+    def run(self, max_cycles = None):
+        # run until the program halts or max_cycles have been used, returns the number of cycles run
+        program, ram, halt = self._program, self.ram, self._halt
+        stops = halt | self.breakpoints if self.breakpoints else halt
+        a, d, pc, max_sp = self.a, self.d, self.pc, self.max_sp
+        start = self.cycles
+        limit = float('inf') if max_cycles is None else self.cycles + max_cycles
+        cycles = self.cycles
+        size = len(program)
+        while cycles < limit:
+            if pc in stops:
+                if pc in halt:
+                    self.halted = True
+                    break
+                if cycles != start:
+                    break
+            if pc >= size:
+                self.halted = True
+                break
+            is_c, comp, use_m, dest, jump = program[pc]
+            cycles += 1
+            if not is_c:
+                a = comp
+                pc += 1
+                continue
+            out = comp(d, ram[a] if use_m else a) & 0xFFFF
+            target = a
+            if dest & 1:
+                ram[a] = out
+                if a == 0 and out > max_sp:
+                    max_sp = out
+            if dest & 4:
+                a = out
+            if dest & 2:
+                d = out
+            pc = target if jump and jumps(jump, out) else pc + 1
+        self.a, self.d, self.pc, self.cycles, self.max_sp = a, d, pc, cycles, max_sp
+        return cycles - start
+
+
+if __name__ == '__main__':
+    try:
+        filename = sys.argv[1]
+    except IndexError:
+        filename = ""
+    if filename.endswith('.hack'):
+        cpu = CPUEmulator(load_hack(filename))
+        cpu.run(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(filename, 'ran for', cpu.cycles, 'cycles', '(halted)' if cpu.halted else '(stopped)')
+        print('RAM[0..15]:', cpu.ram[:16])
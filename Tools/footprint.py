@@ -0,0 +1,235 @@
+'''
+Static analysis of a VM program's ROM size and stack depth, so a build can fail before it is assembled.
+
+ROM: each function is translated on its own by the VM Translator's CodeWriter, with the same options as
+a build, and its Hack instructions are counted. This is the size the function takes in the .asm file
+before the Linker merges duplicate functions, so the total is an upper bound of the assembled ROM.
+
+Stack: the height of the stack is followed through the commands of each function (push +1, pop and
+binary operators -1, a call pops its arguments and pushes the result, a label takes the height of the
+jumps to it). A call adds the 5 words of the callee's frame and the callee's own depth to the height at
+the call, and the depth of a function is its locals plus the highest of these. Calls between functions
+that can call each other again (a cycle in the call graph) are recursive, they are left out and the
+functions are listed, so the depth holds for every non-recursive path. Tail calls are counted like normal
+calls, which may only overestimate. Functions that are not in the program (e.g. the Jack OS when its .vm
+files are not in the directory) count as 0.
+
+To use this script run 'python footprint.py <path> [options]', where <path> is a .vm file or a directory
+of .vm or .jack files (.jack files are compiled first). The exit status is 1 if the ROM or the stack is
+over its limit.
+
+Options:
+    --rom-limit N       words of ROM available (default 32768)
+    --stack-limit N     words between the stack and the heap (default 2048 - 256)
+    --cycle-weight W    --no-tail-calls    translate as the VM Translator would with these options
+    --top N             number of functions listed (default 20)
+    --json FILE         write the report as JSON
+'''
+
+import io, os, sys, json, argparse
+from toolchain import load_tool, compile_jack
+
+ROM_SIZE = 32768
+STACK_SIZE = 2048 - 256
+# words pushed by a call before the callee's locals
+FRAME = 5
+# the (END) loop written after the program
+END = 2
+
+
+def vm_files(path):
+    # the .vm files at path, compiling .jack files first
+    path = os.path.normpath(path)
+    if os.path.isdir(path):
+        if any(x.endswith('.jack') for x in os.listdir(path)):
+            compile_jack(path)
+        return [path + '/' + x for x in os.listdir(path) if x.endswith('.vm')]
+    return [path]
+
+
+class Function():
+    __slots__ = ('name', 'locals', 'rom', 'height', 'calls')
+
+    def __init__(self, name, nlocals):
+        self.name = name
+        self.locals = nlocals
+        self.rom = 0
+        # highest stack height of its own code, above its locals
+        self.height = 0
+        # (callee, stack height at the call with the arguments pushed)
+        self.calls = []
+
+
+class Footprint():
+    '''
+    ROM words and worst-case stack depth of each function of a VM program.
+    '''
+
+    def __init__(self, files, cycle_weight = 0.4, tail_calls = True):
+        Parser = load_tool('Virtual_Machine', 'parser').Parser
+        CodeWriter = load_tool('Virtual_Machine', 'codewriter').CodeWriter
+        self._cycle_weight = cycle_weight
+        self._tail_calls = tail_calls
+        self.functions = dict()
+        # class -> ROM words
+        self.classes = dict()
+        self.bootstrap = 0
+        for file in files:
+            name = os.path.basename(file).replace('.vm', '')
+            commands = Parser(file).commands()
+            starts = [n for n, command in enumerate(commands) if command[0] == 'C_FUNCTION'] + [len(commands)]
+            if starts[0] > 0:
+                # code outside of a function, as in a file of plain commands
+                self.bootstrap += self.rom(CodeWriter, name, commands[:starts[0]])
+            for start, end in zip(starts, starts[1:]):
+                function = self.analyze(commands[start:end])
+                function.rom = self.rom(CodeWriter, name, commands[start:end])
+                self.functions[function.name] = function
+                self.classes[name] = self.classes.get(name, 0) + function.rom
+        if len(files) > 1 or 'Sys.init' in self.functions:
+            # written by the VM Translator for a directory
+            buffer = io.StringIO()
+            writer = CodeWriter('Sys', cycle_weight, tail_calls, buffer)
+            writer.write_init()
+            self.bootstrap += writer.cost(buffer.getvalue().splitlines())
+        self._depths = dict()
+        # functions calling each other are in the same component, calls within a component are recursive
+        self._component = self.components()
+        self.recursive = set(name for name, function in self.functions.items()
+                             if any(self._component.get(callee) == self._component[name]
+                                    for callee, height in function.calls))
+
+    def rom(self, CodeWriter, name, commands):
+        # instructions the CodeWriter writes for commands
+        buffer = io.StringIO()
+        writer = CodeWriter(name, self._cycle_weight, self._tail_calls, buffer)
+        writer.filename(name)
+        writer.write_commands(commands)
+        return writer.cost(buffer.getvalue().splitlines())
+
+    def analyze(self, commands):
+        # the stack height through the commands of one function
+        function = Function(commands[0][2], int(commands[0][3]))
+        height = 0
+        labels = dict()
+        for kind, command, arg1, arg2 in commands[1:]:
+            if kind == 'C_PUSH':
+                height += 1
+            elif kind == 'C_POP' or kind == 'C_IF':
+                height -= 1
+            elif kind in ('C_ARITHMETIC', 'C_BOOLEAN') and command not in ('neg', 'not'):
+                height -= 1
+            elif kind == 'C_CALL':
+                function.calls.append((arg1, height))
+                height += 1 - int(arg2)
+            elif kind == 'C_LABEL':
+                height = max(height, labels.get(arg1, height))
+            if kind in ('C_IF', 'C_GOTO'):
+                labels[arg1] = max(height, labels.get(arg1, height))
+            function.height = max(function.height, height)
+        return function
+
+    def components(self):
+        # the strongly connected components of the call graph (Tarjan), function -> component number
+        index, low, stack, component = dict(), dict(), [], dict()
+        count = [0]
+
+        def visit(name):
+            index[name] = low[name] = len(index)
+            stack.append(name)
+            for callee, height in self.functions[name].calls:
+                if callee not in self.functions:
+                    continue
+                if callee not in index:
+                    visit(callee)
+                    low[name] = min(low[name], low[callee])
+                elif callee not in component:
+                    low[name] = min(low[name], index[callee])
+            if low[name] == index[name]:
+                while True:
+                    member = stack.pop()
+                    component[member] = count[0]
+                    if member == name:
+                        break
+                count[0] += 1
+
+        for name in self.functions:
+            if name not in index:
+                visit(name)
+        return component
+
+    def depth(self, name):
+        # (worst-case stack words used by a call to name above its arguments, deepest call path)
+        if name in self._depths:
+            return self._depths[name]
+        function = self.functions.get(name)
+        if function is None:
+            return 0, []
+        deepest, chain = function.height, []
+        for callee, height in function.calls:
+            if callee in self.functions and self._component[callee] == self._component[name]:
+                # a recursive call, left out
+                continue
+            words, calls = self.depth(callee)
+            if height + FRAME + words > deepest:
+                deepest, chain = height + FRAME + words, [callee] + calls
+        self._depths[name] = (function.locals + deepest, chain)
+        return self._depths[name]
+
+    def report(self, rom_limit = ROM_SIZE, stack_limit = STACK_SIZE):
+        # the analysis as a dictionary, see the module docstring
+        entry = 'Sys.init' if 'Sys.init' in self.functions or 'Main.main' not in self.functions else 'Main.main'
+        stack, chain = self.depth(entry)
+        stack += FRAME
+        rom = self.bootstrap + sum(function.rom for function in self.functions.values()) + END
+        functions = dict()
+        for name, function in self.functions.items():
+            words, calls = self.depth(name)
+            functions[name] = {'rom': function.rom, 'locals': function.locals, 'stack': words,
+                               'deepest': calls, 'recursive': name in self.recursive}
+        external = sorted(set(callee for function in self.functions.values() for callee, height in function.calls
+                              if callee not in self.functions))
+        return {'rom': rom, 'rom_limit': rom_limit, 'bootstrap': self.bootstrap + END,
+                'stack': stack, 'stack_limit': stack_limit, 'entry': entry, 'deepest': [entry] + chain,
+                'recursive': sorted(self.recursive), 'external': external,
+                'classes': dict(sorted(self.classes.items(), key=lambda x: -x[1])),
+                'functions': dict(sorted(functions.items(), key=lambda x: -x[1]['rom'])),
+                'ok': rom <= rom_limit and stack <= stack_limit}
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Predicts the ROM size and stack depth of a VM program.')
+    arguments.add_argument('path', help='.vm file or directory of .vm or .jack files')
+    arguments.add_argument('--rom-limit', type=int, default=ROM_SIZE, help='words of ROM available')
+    arguments.add_argument('--stack-limit', type=int, default=STACK_SIZE, help='words between stack and heap')
+    arguments.add_argument('--cycle-weight', type=float, default=0.4,
+                           help='cost of one cycle relative to one word of ROM, as for the VM Translator')
+    arguments.add_argument('--no-tail-calls', dest='tail_calls', action='store_false',
+                           help="translate 'call f n; return' as a normal call followed by a return")
+    arguments.add_argument('--top', type=int, default=20, help='number of functions listed')
+    arguments.add_argument('--json', metavar='FILE', help='write the report as JSON')
+    options = arguments.parse_args()
+    footprint = Footprint(vm_files(options.path), options.cycle_weight, options.tail_calls)
+    report = footprint.report(options.rom_limit, options.stack_limit)
+    print('function'.ljust(40), 'ROM'.rjust(7), '%'.rjust(6), 'locals'.rjust(7), 'stack'.rjust(7))
+    for name, function in list(report['functions'].items())[:options.top]:
+        print((name + (' (recursive)' if function['recursive'] else ''))[:40].ljust(40), str(function['rom']).rjust(7),
+              ('%.1f' % (100 * function['rom'] / max(1, report['rom']))).rjust(6), str(function['locals']).rjust(7),
+              str(function['stack']).rjust(7))
+    print()
+    print('class'.ljust(40), 'ROM'.rjust(7), '%'.rjust(6))
+    for name, rom in list(report['classes'].items())[:options.top]:
+        print(name[:40].ljust(40), str(rom).rjust(7), ('%.1f' % (100 * rom / max(1, report['rom']))).rjust(6))
+    print()
+    print('ROM:', report['rom'], 'of', report['rom_limit'], 'words (before the Linker, bootstrap and end',
+          str(report['bootstrap']) + ')', '' if report['rom'] <= report['rom_limit'] else 'OVER THE LIMIT')
+    print('stack:', report['stack'], 'of', report['stack_limit'], 'words along', ' -> '.join(report['deepest']),
+          '' if report['stack'] <= report['stack_limit'] else 'OVER THE LIMIT')
+    if report['recursive']:
+        print('recursive, not included:', ', '.join(report['recursive']))
+    if report['external']:
+        print('not in the program, counted as 0:', ', '.join(report['external']))
+    if options.json:
+        with open(options.json, 'w') as temp:
+            json.dump(report, temp, indent=1)
+    sys.exit(0 if report['ok'] else 1)
@@ -0,0 +1,238 @@
+'''
+Runs many copies of one Hack program in lockstep, for parameter sweeps of the same ROM with different
+initial RAM (e.g. R0 and R1 of Max, or the rows of Rect). Needs NumPy.
+
+The LockstepEmulator keeps the A, D, PC and RAM of N machines (lanes) in NumPy arrays and runs one
+instruction at a time for a group of lanes at the same PC, so each instruction is decoded once (from
+emulator.decode_table()) and executed as a few array operations over the group. Where a jump goes
+different ways for different lanes, the group keeps the lanes going to the lowest address and the others
+are masked out and wait. Every --regroup instructions, and whenever the group halts or runs out of
+cycles, the waiting lanes are regrouped: the new group is every running lane at the lowest PC, so lanes
+that went separate ways join again once they reach the same code. Each lane counts its own cycles, as
+the CPUEmulator would.
+
+Each lane has the full 64K words of RAM of the CPUEmulator (128 KB), so 1000 lanes take 128 MB.
+
+To use this script run 'python lockstep.py <hack file> [options]', e.g. 'python lockstep.py
+../Assembler/hack/Max.hack --sweep 0=0:32 --sweep 1=0:32'. The lanes are all combinations of the swept
+values. The same runs are then made one after the other on the CPUEmulator, the results are compared and
+the speedup is reported (the time of each sequential run, without copying its RAM for the comparison).
+The exit status is 1 if any lane differs from its sequential run.
+
+Options:
+    --sweep ADDR=START:STOP[:STEP]   values of a RAM address, one lane per combination, can be repeated
+    --set ADDR=VALUE    initial value of a RAM address for every lane, can be repeated
+    --lanes N           run N lanes, repeating the combinations (default one per combination)
+    --cycles N          cycles each lane may take (default 10000000)
+    --regroup N         instructions between regroupings (default 64)
+    --json FILE         write the report as JSON
+'''
+
+import sys, time, json, argparse
+from array import array
+from itertools import product
+from emulator import CPUEmulator, decode_table, halt_loops, load_hack
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RAM_SIZE = 65536
+# lane states
+RUNNING, HALTED, STOPPED = 0, 1, 2
+
+
+class LockstepEmulator():
+    '''
+    Emulates N Hack CPUs running the same ROM in lockstep, see the module docstring. ram is an array of
+    N rows of RAM, set the initial values of each lane there before run().
+    '''
+
+    def __init__(self, rom, lanes, table = None, regroup = 64):
+        if np is None:
+            raise ImportError('the lockstep emulator needs NumPy')
+        table = table if table is not None else decode_table()
+        self.rom = rom
+        self.lanes = lanes
+        self.regroup = regroup
+        self._program = [table[word] for word in rom]
+        self._halt = halt_loops(rom)
+        # whether each jump is taken, for each jump field (lt, eq, gt) and 16 bit ALU output
+        out = np.arange(0x10000)
+        lt, eq, gt = out >= 0x8000, out == 0, (out > 0) & (out < 0x8000)
+        self._jumps = [(lt & bool(jump & 4)) | (eq & bool(jump & 2)) | (gt & bool(jump & 1)) for jump in range(8)]
+        self._base = np.arange(lanes, dtype=np.int64) * RAM_SIZE
+        self.reset()
+
+    def reset(self):
+        self._ram = np.zeros(self.lanes * RAM_SIZE, dtype=np.uint16)
+        self.ram = self._ram.reshape(self.lanes, RAM_SIZE)
+        self.a = np.zeros(self.lanes, dtype=np.int64)
+        self.d = np.zeros(self.lanes, dtype=np.int64)
+        self.pc = np.zeros(self.lanes, dtype=np.int64)
+        self.cycles = np.zeros(self.lanes, dtype=np.int64)
+        self.state = np.full(self.lanes, RUNNING, dtype=np.int8)
+        # instructions run for groups, groups formed, and jumps that split a group
+        self.steps = self.groups = self.divergences = 0
+
+    @property
+    def halted(self):
+        return self.state == HALTED
+
+    def run(self, max_cycles = None):
+        # run until every lane halts or has used max_cycles more cycles, returns the cycles run by all lanes
+        program, halt, size, ram, base = self._program, self._halt, len(self._program), self._ram, self._base
+        a, d, pc, cycles, state = self.a, self.d, self.pc, self.cycles, self.state
+        state[state == STOPPED] = RUNNING
+        start = int(cycles.sum())
+        limit = cycles + (max_cycles if max_cycles is not None else 2 ** 62)
+        group = None
+        while True:
+            if group is not None:
+                # the group leaves its instruction, its lanes have run steps more cycles
+                pc[group] = p
+                cycles[group] += steps
+            running = np.flatnonzero(state == RUNNING)
+            if not running.size:
+                break
+            p = int(pc[running].min())
+            group = running[pc[running] == p]
+            self.groups += 1
+            # basic slicing is much faster than indexing when the group is every lane
+            index = slice(None) if group.size == self.lanes else group
+            budget = min(self.regroup, int((limit[group] - cycles[group]).min()))
+            steps = 0
+            while steps < budget:
+                if p in halt or p >= size:
+                    state[group] = HALTED
+                    break
+                is_c, comp, use_m, dest, jump = program[p]
+                steps += 1
+                if not is_c:
+                    a[index] = comp
+                    p += 1
+                    continue
+                target = a[index]
+                if dest & 4 and jump:
+                    # a view of A when the group is every lane, the jump goes to A before it is written
+                    target = target.copy()
+                if use_m or dest & 1:
+                    address = base[index] + target
+                out = comp(d[index], ram[address] if use_m else target)
+                out = np.full(group.size, out & 0xFFFF) if np.ndim(out) == 0 else out & 0xFFFF
+                if dest & 1:
+                    ram[address] = out
+                if dest & 4:
+                    a[index] = out
+                if dest & 2:
+                    d[index] = out
+                if not jump:
+                    p += 1
+                    continue
+                taken = self._jumps[jump][out]
+                if taken.all() and (target == target[0]).all():
+                    p = int(target[0])
+                elif not taken.any():
+                    p += 1
+                else:
+                    # the lanes go separate ways: the group keeps the lowest address, the others wait
+                    self.divergences += 1
+                    following = np.where(taken, target, p + 1)
+                    pc[group] = following
+                    cycles[group] += steps
+                    self.steps += steps
+                    p = int(following.min())
+                    group = group[following == p]
+                    index = group
+                    budget -= steps
+                    steps = 0
+            else:
+                state[group[cycles[group] + steps >= limit[group]]] = STOPPED
+            self.steps += steps
+        return int(cycles.sum()) - start
+
+
+def sequential(rom, memories, max_cycles):
+    # the same runs one after the other on the CPUEmulator, ([(halted, cycles, RAM bytes)], seconds), only
+    # the runs are timed and not the copies of their RAM kept for the comparison
+    table = decode_table()
+    results = []
+    seconds = 0
+    for memory in memories:
+        start = time.perf_counter()
+        machine = CPUEmulator(rom, table)
+        for address, value in memory.items():
+            machine.ram[address] = value
+        machine.run(max_cycles)
+        seconds += time.perf_counter() - start
+        results.append((machine.halted, machine.cycles, array('H', machine.ram).tobytes()))
+    return results, seconds
+
+
+def parse_sweep(setting):
+    # 'addr=start:stop[:step]' -> (address, range)
+    address, values = setting.split('=')
+    return int(address), range(*[int(x) for x in values.split(':')])
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Runs copies of a Hack program with different RAM in lockstep.')
+    arguments.add_argument('filename', help='.hack file')
+    arguments.add_argument('--sweep', metavar='ADDR=START:STOP[:STEP]', action='append', default=[],
+                           help='values of a RAM address, one lane per combination')
+    arguments.add_argument('--set', metavar='ADDR=VALUE', action='append', default=[],
+                           help='initial value of a RAM address for every lane')
+    arguments.add_argument('--lanes', type=int, help='run this many lanes, repeating the combinations')
+    arguments.add_argument('--cycles', type=int, default=10000000, help='cycles each lane may take')
+    arguments.add_argument('--regroup', type=int, default=64, help='instructions between regroupings')
+    arguments.add_argument('--json', metavar='FILE', help='write the report as JSON')
+    options = arguments.parse_args()
+    if np is None:
+        sys.exit('the lockstep emulator needs NumPy (pip install numpy)')
+    try:
+        fixed = {int(address): int(value) & 0xFFFF for address, value in (x.split('=') for x in options.set)}
+        sweeps = [parse_sweep(x) for x in options.sweep]
+    except ValueError as error:
+        sys.exit('bad --set or --sweep: ' + str(error))
+    combinations = list(product(*[values for address, values in sweeps]))
+    if options.lanes:
+        combinations = [combinations[n % len(combinations)] for n in range(options.lanes)]
+    memories = []
+    for combination in combinations:
+        memory = dict(fixed)
+        memory.update((address, value & 0xFFFF) for (address, values), value in zip(sweeps, combination))
+        memories.append(memory)
+    if not memories:
+        sys.exit('no lanes, a sweep is empty')
+    rom = load_hack(options.filename)
+    decode_table()
+
+    start = time.perf_counter()
+    machine = LockstepEmulator(rom, len(memories), regroup=options.regroup)
+    for lane, memory in enumerate(memories):
+        for address, value in memory.items():
+            machine.ram[lane, address] = value
+    machine.run(options.cycles)
+    lockstep = time.perf_counter() - start
+    results, one_by_one = sequential(rom, memories, options.cycles)
+
+    differ = [lane for lane, (halted, cycles, memory) in enumerate(results)
+              if halted != machine.halted[lane] or cycles != machine.cycles[lane]
+              or memory != machine.ram[lane].tobytes()]
+    total = int(machine.cycles.sum())
+    report = {'program': options.filename, 'lanes': len(memories), 'halted': int(machine.halted.sum()),
+              'cycles': total, 'steps': machine.steps, 'groups': machine.groups,
+              'divergences': machine.divergences, 'lanes_per_step': round(total / max(1, machine.steps), 2),
+              'lockstep_seconds': round(lockstep, 6), 'sequential_seconds': round(one_by_one, 6),
+              'speedup': round(one_by_one / lockstep, 2), 'differ': differ}
+    print(report['program'] + ':', report['lanes'], 'lanes,', report['halted'], 'halted,', total, 'cycles')
+    print('lockstep:', machine.steps, 'instructions for', report['lanes_per_step'], 'lanes on average,',
+          machine.divergences, 'divergent jumps,', machine.groups, 'groups')
+    print('lockstep %.3f s, sequential %.3f s, speedup %.2fx' % (lockstep, one_by_one, report['speedup']))
+    print('same results as the sequential runs' if not differ else
+          '%d lanes differ from the sequential runs, first lane %d' % (len(differ), differ[0]))
+    if options.json:
+        with open(options.json, 'w') as temp:
+            json.dump(report, temp, indent=1)
+    sys.exit(1 if differ else 0)
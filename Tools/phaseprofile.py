@@ -0,0 +1,139 @@
+'''
+Module giving the Assembler, VM Translator and Jack compiler a shared --profile option.
+
+A PhaseProfiler times the phases a tool goes through (e.g. preprocess, first_pass and second_pass for the
+Assembler) and tracks the memory allocated in each with tracemalloc. A phase entered several times, such
+as once per file, is added up. Phases can be nested, the time and memory of the inner phase are then not
+counted in the outer one. The report is written as JSON, optionally with the top allocation sites of each
+phase and a cProfile dump of the whole run, which can be read with pstats or snakeviz.
+
+The tools add this folder to their path and call add_arguments and from_options:
+
+    --profile [FILE]      write the JSON report to FILE, or to stderr without one
+    --profile-top N       list the N lines that allocated the most memory in each phase
+    --cprofile FILE       dump cProfile statistics of the whole run to FILE
+'''
+
+import sys, time, json, tracemalloc, contextlib
+from contextlib import contextmanager
+
+# allocations made by the profiler itself, left out of the top allocation sites
+OWN = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, contextlib)] + [
+       tracemalloc.Filter(False, __file__)]
+
+
+def add_arguments(arguments):
+    # add the profiling options to an argparse.ArgumentParser
+    arguments.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                           help='report the time and memory of each phase as JSON, to FILE or stderr')
+    arguments.add_argument('--profile-top', type=int, default=0, metavar='N',
+                           help='with --profile, the N lines allocating the most memory in each phase')
+    arguments.add_argument('--cprofile', metavar='FILE', help='dump cProfile statistics of the run to FILE')
+
+
+def from_options(tool, options):
+    # a started PhaseProfiler if profiling was asked for, otherwise None
+    if options.profile is None and options.cprofile is None:
+        return None
+    return PhaseProfiler(tool, options.profile, options.profile_top, options.cprofile)
+
+
+class PhaseProfiler():
+
+    def __init__(self, tool, output = '-', top = 0, cprofile = None):
+        self._tool = tool
+        self._output = output
+        self._top = top
+        self._cprofile = None
+        self._cprofile_file = cprofile
+        # name -> totals of the phase, in the order the phases were first entered
+        self._phases = dict()
+        # open phases: [name, start time, traced memory at the start, peak above it so far]
+        self._stack = []
+        # highest traced memory of the run
+        self._peak = 0
+        tracemalloc.start()
+        if cprofile is not None:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        self._start = time.perf_counter()
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(OWN)
+
+    def reset_peak(self):
+        # tracemalloc keeps one peak, the highest of the run is kept before it is reset for a phase
+        self._peak = max(self._peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    def pause(self, frame):
+        # stop counting for frame, keeping the time and the peak it reached
+        self._phases[frame[0]]['seconds'] += time.perf_counter() - frame[1]
+        frame[3] = max(frame[3], tracemalloc.get_traced_memory()[1] - frame[2])
+
+    def resume(self, frame):
+        self.reset_peak()
+        frame[1] = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        if self._stack:
+            self.pause(self._stack[-1])
+        phase = self._phases.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0, 'allocated_bytes': 0,
+                                               'top': dict()})
+        snapshot = self.snapshot() if self._top else None
+        self.reset_peak()
+        frame = [name, time.perf_counter(), tracemalloc.get_traced_memory()[0], 0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self.pause(frame)
+            self._stack.pop()
+            allocated = tracemalloc.get_traced_memory()[0] - frame[2]
+            phase['calls'] += 1
+            phase['peak_bytes'] = max(phase['peak_bytes'], frame[3])
+            phase['allocated_bytes'] += allocated
+            if snapshot is not None:
+                for statistic in self.snapshot().compare_to(snapshot, 'lineno'):
+                    if statistic.size_diff > 0:
+                        site = statistic.traceback[0]
+                        location = site.filename + ':' + str(site.lineno)
+                        size, count = phase['top'].get(location, (0, 0))
+                        phase['top'][location] = (size + statistic.size_diff, count + statistic.count_diff)
+            if self._stack:
+                # the outer phase does not count the memory kept by the inner one
+                self._stack[-1][2] += allocated
+                self.resume(self._stack[-1])
+
+    def report(self):
+        # the results as a dictionary, see finish
+        phases = []
+        for name, phase in self._phases.items():
+            top = sorted(phase['top'].items(), key=lambda x: -x[1][0])[:self._top]
+            phases.append({'name': name, 'calls': phase['calls'], 'seconds': round(phase['seconds'], 6),
+                           'peak_bytes': phase['peak_bytes'], 'allocated_bytes': phase['allocated_bytes'],
+                           'top': [{'location': location, 'bytes': size, 'blocks': count}
+                                   for location, (size, count) in top]})
+        return {'tool': self._tool, 'arguments': sys.argv[1:],
+                'seconds': round(time.perf_counter() - self._start, 6),
+                'peak_bytes': max(self._peak, tracemalloc.get_traced_memory()[1]),
+                'phases': phases, 'cprofile': self._cprofile_file}
+
+    def finish(self):
+        # stop profiling and write the report and the cProfile dump
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self._cprofile_file)
+        report = self.report()
+        tracemalloc.stop()
+        if self._output is None:
+            return report
+        text = json.dumps(report, indent=1)
+        if self._output == '-':
+            print(text, file=sys.stderr)
+        else:
+            with open(self._output, 'w') as temp:
+                temp.write(text + '\n')
+        return report
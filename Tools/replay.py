@@ -0,0 +1,184 @@
+'''
+Replays scripted keyboard input into a Jack program frame by frame, for benchmarks that check behavior.
+
+A frame ends each time the program calls the frame function (Sys.wait by default, which the Pong game
+calls once per pass of its main loop). Before each frame the key of the timeline is written to the
+keyboard register (KBD in the Assembler's SymbolTable), then the program runs headless up to the next
+call and the cycles of the frame and a hash of SCREEN memory are recorded. The same program and
+timeline always give the same results, so a saved run is a baseline: a later run with a changed compiler
+or translator must give the same screen after every frame, and its cycles show what the change gained.
+
+Two emulators can run the program: 'vm' runs the .vm code on the VMEmulator with its built in Jack OS,
+counting VM commands, and 'hack' translates and assembles the program and counts CPU cycles on the
+CPUEmulator, which needs the Jack OS .vm files in the program's directory. The screens of the two are
+not comparable (the VMEmulator does not draw text), so a baseline is only compared with runs on the same
+emulator.
+
+The timeline is a list of 'frame key' lines, a key is held from its frame until the next line. Keys are
+numbers, single characters or the names in KEYS, '#' starts a comment, e.g.
+
+    0   none
+    10  right      # hold the right arrow for 20 frames
+    30  none
+
+To use this script run 'python replay.py <path> [options]', where <path> is a directory of .vm or .jack
+files (.jack files are compiled first), e.g. 'python replay.py ../Compiler/Pong --keys 0:right,20:none'.
+
+Options:
+    --frames N          frames to run (default 100)
+    --script FILE       the keyboard timeline
+    --keys SPEC         the timeline as frame:key pairs separated by commas
+    --emulator E        vm or hack (default vm)
+    --frame-function F  the function whose calls end a frame (default Sys.wait)
+    --frame-limit N     cycles a frame may take before the run is stopped (default 10000000)
+    --save FILE         write the results as JSON
+    --baseline FILE     compare with saved results, the exit status is 1 if a screen differs
+    --threshold T       with --baseline, also fail if the total cycles grew by more than T (e.g. 0.05)
+'''
+
+import os, sys, json, time, hashlib, argparse
+from array import array
+from toolchain import load_tool
+
+# key codes of the Hack keyboard
+KEYS = {'none': 0, 'newline': 128, 'enter': 128, 'backspace': 129, 'left': 130, 'up': 131, 'right': 132,
+        'down': 133, 'home': 134, 'end': 135, 'pageup': 136, 'pagedown': 137, 'insert': 138, 'delete': 139,
+        'esc': 140, 'space': 32}
+
+
+def key_code(key):
+    if key.lower() in KEYS:
+        return KEYS[key.lower()]
+    if key.isdigit():
+        return int(key)
+    if len(key) == 1:
+        return ord(key)
+    raise ValueError('unknown key: ' + key)
+
+
+def parse_timeline(lines):
+    # 'frame key' lines -> sorted [(frame, key code)]
+    timeline = []
+    for line in lines:
+        line = line.split('#')[0].strip()
+        if line:
+            frame, key = line.replace(':', ' ').split()
+            timeline.append((int(frame), key_code(key)))
+    return sorted(timeline)
+
+
+def screen_hash(ram, screen, keyboard):
+    return hashlib.blake2b(array('H', ram[screen:keyboard]).tobytes(), digest_size=8).hexdigest()
+
+
+class Replay():
+    '''
+    Runs a program with a keyboard timeline, see the module docstring.
+    '''
+
+    def __init__(self, path, emulator = 'vm', frame_function = 'Sys.wait'):
+        table = load_tool('Assembler', 'symboltable').SymbolTable()
+        self.screen, self.keyboard = table.get_address('SCREEN'), table.get_address('KBD')
+        self.emulator = emulator
+        if emulator == 'vm':
+            from vmprofile import load_program
+            from vmemulator import VMEmulator
+            self._machine = VMEmulator(load_program(path))
+            self._machine.breakpoints.add(frame_function)
+        elif emulator == 'hack':
+            from cycleprofile import load_program
+            from emulator import CPUEmulator
+            rom, labels = load_program(path)
+            if frame_function not in labels:
+                raise ValueError(frame_function + ' is not in the program, the hack emulator needs the Jack OS'
+                                 ' .vm files')
+            self._machine = CPUEmulator(rom)
+            self._machine.breakpoints.add(labels[frame_function])
+        else:
+            raise ValueError('unknown emulator: ' + emulator)
+
+    def count(self):
+        # VM commands or cycles run so far
+        return self._machine.steps if self.emulator == 'vm' else self._machine.cycles
+
+    def run(self, frames, timeline, frame_limit = 10000000):
+        machine, ram = self._machine, self._machine.ram
+        timeline = list(timeline)
+        key = 0
+        results = []
+        start = time.perf_counter()
+        status = 'done'
+        for frame in range(frames):
+            while timeline and timeline[0][0] <= frame:
+                key = timeline.pop(0)[1]
+            ram[self.keyboard] = key
+            before = self.count()
+            machine.run(frame_limit)
+            results.append({'cycles': self.count() - before, 'key': key,
+                            'screen': screen_hash(ram, self.screen, self.keyboard)})
+            if machine.halted:
+                status = 'halted'
+                break
+            if self.count() - before >= frame_limit:
+                status = 'frame limit'
+                break
+        digest = hashlib.blake2b(''.join(x['screen'] for x in results).encode(), digest_size=8).hexdigest()
+        return {'emulator': self.emulator, 'unit': 'VM commands' if self.emulator == 'vm' else 'cycles',
+                'frames': results, 'total': sum(x['cycles'] for x in results), 'status': status,
+                'screen': digest, 'seconds': round(time.perf_counter() - start, 6)}
+
+
+def compare(results, baseline):
+    # (frames whose screen differs, relative change of the total cycles)
+    differ = [n for n, (new, old) in enumerate(zip(results['frames'], baseline['frames']))
+              if new['screen'] != old['screen']]
+    if len(results['frames']) != len(baseline['frames']):
+        differ.append(min(len(results['frames']), len(baseline['frames'])))
+    return differ, results['total'] / max(1, baseline['total']) - 1
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Replays keyboard input into a Jack program frame by frame.')
+    arguments.add_argument('path', help='directory of .vm or .jack files')
+    arguments.add_argument('--frames', type=int, default=100, help='frames to run')
+    arguments.add_argument('--script', metavar='FILE', help="the keyboard timeline, 'frame key' lines")
+    arguments.add_argument('--keys', metavar='SPEC', help='the timeline as frame:key pairs separated by commas')
+    arguments.add_argument('--emulator', choices=['vm', 'hack'], default='vm', help='emulator to run on')
+    arguments.add_argument('--frame-function', default='Sys.wait', help='the function whose calls end a frame')
+    arguments.add_argument('--frame-limit', type=int, default=10000000, help='cycles a frame may take')
+    arguments.add_argument('--save', metavar='FILE', help='write the results as JSON')
+    arguments.add_argument('--baseline', metavar='FILE', help='compare with saved results')
+    arguments.add_argument('--threshold', type=float, help='with --baseline, fail if the total cycles grew more')
+    options = arguments.parse_args()
+    lines = []
+    if options.script:
+        with open(options.script, 'r') as temp:
+            lines += temp.readlines()
+    if options.keys:
+        lines += options.keys.split(',')
+    try:
+        replay = Replay(options.path, options.emulator, options.frame_function)
+    except ValueError as error:
+        sys.exit(str(error))
+    results = replay.run(options.frames, parse_timeline(lines), options.frame_limit)
+    results['program'] = os.path.normpath(options.path)
+    results['timeline'] = parse_timeline(lines)
+    counts = [x['cycles'] for x in results['frames']]
+    print(results['program'], 'on the', results['emulator'], 'emulator:', len(counts), 'frames', '(' + results['status'] + '),',
+          results['total'], results['unit'], 'in', results['seconds'], 's')
+    if counts:
+        print(results['unit'], 'per frame: min', min(counts), 'median', sorted(counts)[len(counts) // 2], 'max', max(counts))
+    print('screen', results['screen'])
+    if options.save:
+        with open(options.save, 'w') as temp:
+            json.dump(results, temp, indent=1)
+    if options.baseline:
+        with open(options.baseline, 'r') as temp:
+            baseline = json.load(temp)
+        if baseline['emulator'] != results['emulator']:
+            sys.exit('the baseline was run on the ' + baseline['emulator'] + ' emulator')
+        differ, change = compare(results, baseline)
+        print('baseline: %+.1f%% %s,' % (100 * change, results['unit']),
+              'same screens' if not differ else 'screens differ from frame ' + str(differ[0]))
+        if differ or (options.threshold is not None and change > options.threshold):
+            sys.exit(1)
@@ -0,0 +1,106 @@
+'''
+Micro-benchmark for the Jack compiler's SymbolTable.
+
+A table is filled with a class's statics and fields and a subroutine's arguments and locals, then every
+name is looked up many times the way the CompilationEngine uses variables:
+    before     ScopeTable, the table as it was before resolve() (a class and a subroutine dictionary of
+               named tuples), with separate kind_of, index_of and type_of calls plus mapping 'field' to
+               the 'this' segment
+    wrappers   the same three calls on the current table, where each of them calls resolve()
+    resolve    a single resolve() on the current table, returning the segment, index and type together
+The time per variable reference is reported, and the speedup of resolve over the table before it.
+
+To use this script run 'python symboltable_benchmark.py [repetitions]'.
+'''
+
+import sys, time
+from collections import namedtuple
+from toolchain import load_tool
+
+Symbol = namedtuple('Symbol', ['type', 'kind', 'number'])
+
+
+class ScopeTable():
+    # the lookups of the SymbolTable before resolve(), each call searches the subroutine then the class
+
+    def __init__(self):
+        self._class = dict()
+        self._subroutine = dict()
+        self._counts = {'static': 0, 'field': 0, 'local': 0, 'argument': 0}
+
+    def define(self, var_name, var_type, kind):
+        scope = self._class if kind in ('static', 'field') else self._subroutine
+        scope[var_name] = Symbol(var_type, kind, self._counts[kind])
+        self._counts[kind] += 1
+
+    def kind_of(self, var_name):
+        try:
+            return self._subroutine[var_name].kind
+        except KeyError:
+            try:
+                return self._class[var_name].kind
+            except KeyError:
+                return None
+
+    def type_of(self, var_name):
+        try:
+            return self._subroutine[var_name].type
+        except KeyError:
+            try:
+                return self._class[var_name].type
+            except KeyError:
+                return None
+
+    def index_of(self, var_name):
+        try:
+            return self._subroutine[var_name].number
+        except KeyError:
+            try:
+                return self._class[var_name].number
+            except KeyError:
+                return None
+
+
+def table(SymbolTable):
+    # a SymbolTable holding 4 variables of each kind, and their names
+    symbols = SymbolTable()
+    names = []
+    for kind in ['static', 'field', 'argument', 'local']:
+        for i in range(4):
+            symbols.define(kind + str(i), 'int', kind)
+            names.append(kind + str(i))
+    return symbols, names
+
+
+def separate(symbols, names):
+    for name in names:
+        kind = symbols.kind_of(name)
+        segment = 'this' if kind == 'field' else kind
+        index = symbols.index_of(name)
+        var_type = symbols.type_of(name)
+
+
+def resolved(symbols, names):
+    for name in names:
+        symbol = symbols.resolve(name)
+        segment, index, var_type = symbol.segment, symbol.index, symbol.type
+
+
+def measure(SymbolTable, function, repetitions):
+    # nanoseconds per variable reference
+    symbols, names = table(SymbolTable)
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function(symbols, names)
+    return (time.perf_counter() - start) * 1e9 / (repetitions * len(names))
+
+
+if __name__ == '__main__':
+    repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    SymbolTable = load_tool('Compiler', 'symboltable').SymbolTable
+    before = measure(ScopeTable, separate, repetitions)
+    wrappers = measure(SymbolTable, separate, repetitions)
+    after = measure(SymbolTable, resolved, repetitions)
+    print('before, kind_of, index_of, type_of:', '%.0f' % before, 'ns per reference')
+    print('wrappers, kind_of, index_of, type_of:', '%.0f' % wrappers, 'ns per reference')
+    print('resolve:', '%.0f' % after, 'ns per reference', '(%.1fx over before)' % (before / after))
@@ -0,0 +1,60 @@
+'''
+Stack-depth benchmark for the tail calls made by the VM Translator.
+
+A Jack program whose Main.sum(n, acc) recurses n times through 'return Main.sum(n - 1, acc + 1);' is compiled
+once and translated with and without tail calls. Both builds are run on the CPU emulator for each depth,
+reporting the cycles used, the deepest the stack grew and whether it ran past the stack segment (2047).
+
+To use this script run 'python tailcall_benchmark.py [depth ...]'.
+'''
+
+import os, sys, tempfile
+from emulator import CPUEmulator
+from toolchain import compile_jack, build
+
+SOURCES = {'Sys.jack': '''class Sys {
+    function void init() {
+        do Main.main();
+        while (true) {}
+        return;
+    }
+}
+''', 'Main.jack': '''class Main {
+    static int result;
+    function int sum(int n, int acc) {
+        if (n = 0) { return acc; }
+        return Main.sum(n - 1, acc + 1);
+    }
+    function void main() {
+        let result = Main.sum(%d, 0);
+        return;
+    }
+}
+'''}
+
+STACK_END = 2047
+
+
+def run(depth, tail_calls):
+    # returns (result, cycles, max stack depth) for one build of the program
+    with tempfile.TemporaryDirectory() as directory:
+        for name, source in SOURCES.items():
+            with open(os.path.join(directory, name), 'w') as temp:
+                temp.write(source % depth if '%d' in source else source)
+        compile_jack(directory)
+        cpu = CPUEmulator(build(directory, tail_calls=tail_calls))
+    cpu.run()
+    # Main.result is the first static variable, at RAM[16]
+    return cpu.ram[16], cpu.cycles, cpu.max_sp - 256
+
+
+if __name__ == '__main__':
+    depths = [int(x) for x in sys.argv[1:]] or [10, 100, 1000, 5000]
+    print('depth'.rjust(8), 'tail calls'.rjust(12), 'cycles'.rjust(10), 'max stack'.rjust(10), '')
+    for depth in depths:
+        for tail_calls in [False, True]:
+            result, cycles, stack = run(depth, tail_calls)
+            assert result == depth, 'wrong result ' + str(result)
+            overflow = 'overflows stack' if stack + 256 > STACK_END else ''
+            print(str(depth).rjust(8), ('on' if tail_calls else 'off').rjust(12),
+                  str(cycles).rjust(10), str(stack).rjust(10), overflow)
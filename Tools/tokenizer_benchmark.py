@@ -0,0 +1,67 @@
+'''
+Time and memory benchmark for the Jack compiler's tokenizer on large generated classes.
+
+A class with the given number of subroutines, each a few dozen lines of statements and comments, is
+written to a temporary file and all of its tokens are read. The time until the first token is ready
+(when compilation can start), the time to read all tokens and the peak memory allocated while doing
+so are reported per size. As tokens are streamed the peak should not grow with the size of the class.
+
+To use this script run 'python tokenizer_benchmark.py [subroutines ...]'.
+'''
+
+import os, sys, time, tempfile, tracemalloc
+from toolchain import load_tool
+
+SUBROUTINE = '''
+    /** Subroutine %(n)d of a generated class. */
+    function int f%(n)d(int x, int y) {
+        var int i, total;
+        var Array values;
+        let i = 0; // counter
+        let total = x;
+        while (i < y) {
+            if ((i & 1) = 0) { let total = total + (x * i) - 3; }
+            else { let total = total - (y / 2) | 5; }
+            let values[i] = total;
+            let i = i + 1;
+        }
+        do Output.printString("f%(n)d done");
+        return total;
+    }
+'''
+
+
+def generate(subroutines):
+    # source of a class with the given number of subroutines
+    return 'class Big {\n' + ''.join(SUBROUTINE % {'n': n} for n in range(subroutines)) + '}\n'
+
+
+def measure(subroutines):
+    # returns (tokens, seconds to the first token, total seconds, peak bytes) for a generated class
+    tokenizer = load_tool('Compiler', 'tokenizer')
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'Big.jack')
+        with open(filename, 'w') as temp:
+            temp.write(generate(subroutines))
+        tracemalloc.start()
+        start = time.perf_counter()
+        tokens = tokenizer.JackTokenizer(filename)
+        tokens.advance()
+        first = time.perf_counter() - start
+        count = 0
+        while tokens.has_more_tokens():
+            tokens.advance()
+            count += 1
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return count, first, seconds, peak
+
+
+if __name__ == '__main__':
+    sizes = [int(x) for x in sys.argv[1:]] or [10, 100, 1000]
+    print('subroutines'.rjust(12), 'tokens'.rjust(8), 'first token s'.rjust(14), 'seconds'.rjust(9), 'peak KB'.rjust(9))
+    for size in sizes:
+        count, first, seconds, peak = measure(size)
+        print(str(size).rjust(12), str(count).rjust(8), ('%.5f' % first).rjust(14), ('%.3f' % seconds).rjust(9),
+              str(peak // 1024).rjust(9))
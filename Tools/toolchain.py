@@ -0,0 +1,76 @@
+'''
+Module giving scripts in this folder access to the Compiler, VM Translator and Assembler.
+
+Each tool is written to be run from its own folder and imports its modules by their plain names, several
+of which are shared between tools (parser, codewriter, symboltable). load_tool imports a tool's module with
+only that tool's folder on the path and then removes the plain names again, so that all three tools can be
+used from one process.
+'''
+
+import os, sys, io, importlib
+from contextlib import redirect_stdout
+from emulator import load_hack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_loaded = dict()
+
+
+def load_tool(tool, module):
+    # import module from the folder of the given tool, e.g. load_tool('Assembler', 'Assembler')
+    if (tool, module) in _loaded:
+        return _loaded[(tool, module)]
+    directory = os.path.join(ROOT, tool)
+    names = [x[:-3] for x in os.listdir(directory) if x.endswith('.py')]
+    hidden = {name: sys.modules.pop(name) for name in names if name in sys.modules}
+    sys.path.insert(0, directory)
+    try:
+        loaded = importlib.import_module(module)
+    finally:
+        sys.path.remove(directory)
+        for name in names:
+            sys.modules.pop(name, None)
+        sys.modules.update(hidden)
+    _loaded[(tool, module)] = loaded
+    return loaded
+
+
+def quiet(function, *args, **kwargs):
+    # call function without letting it print
+    with redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def compile_jack(path, **options):
+    # compile a .jack file or a directory of them, the .vm files are written next to the sources
+    quiet(load_tool('Compiler', 'JackCompiler').JackAnalyzer, path, **options)
+
+
+def compile_hack(path, **options):
+    # compile a .jack file or a directory of them straight to Hack assembly, returns the ROM as a list of words
+    path = os.path.normpath(path)
+    compile_jack(path, backend='hack', **options)
+    if os.path.isdir(path):
+        return load_hack(assemble(path + '/' + path.split('/')[-1] + '.asm'))
+    return load_hack(assemble(path.replace('.jack', '.asm')))
+
+
+def translate(path, **options):
+    # translate a .vm file or a directory of them, returns the name of the .asm file
+    path = os.path.normpath(path)
+    quiet(load_tool('Virtual_Machine', 'VMTranslator').VMTranslator, path, **options)
+    if os.path.isdir(path):
+        return path + '/' + path.split('/')[-1] + '.asm'
+    return path.replace('.vm', '.asm')
+
+
+def assemble(filename):
+    # assemble an .asm file into a .hack file next to it, returns the name of the .hack file
+    output = filename.replace('.asm', '.hack')
+    quiet(load_tool('Assembler', 'Assembler').Assembler, filename, output)
+    return output
+
+
+def build(path, **options):
+    # translate and assemble .vm code, returns the ROM as a list of words
+    return load_hack(assemble(translate(path, **options)))
@@ -0,0 +1,678 @@
+'''
+Module implementing a VM emulator, which runs .vm code directly instead of translating and assembling it.
+
+The commands of all files are read with the VM Translator's Parser and compiled once into a list of
+(operation, argument) pairs, labels and calls are resolved to indexes in that list. The stack, the
+segments and the heap live in 64K words of RAM laid out as on the Hack platform (SP, LCL, ARG, THIS and
+THAT at 0-4, temp at 5-12, statics from 16, the stack from 256, the heap from 2048, the screen from 16384
+and the keyboard at 24576), so the screen and heap can be inspected the same way as with the CPUEmulator.
+
+Functions of the Jack OS that the program does not define are built in (JackOS): Math, Memory, Array,
+String, Keyboard and Screen follow the book's API and draw into screen memory, Output collects the
+printed text instead of drawing the characters, and Sys.wait does not wait. Functions that wait for the
+keyboard, such as Keyboard.readChar, keep being called until a key has been pressed and released, so a
+program waiting for input uses up its steps like on the hardware.
+
+To use this script run 'python vmemulator.py <path> [steps]', where <path> is a .vm file or a directory of
+.vm files, a directory is started from Sys.init (or the OS's, which calls Main.main).
+'''
+
+import os, sys
+from toolchain import load_tool
+
+# operations of the compiled program
+(PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_FIXED, POP_LOCAL, POP_ARGUMENT, POP_THIS,
+ POP_THAT, POP_FIXED, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT, GOTO, IF_GOTO, CALL, FUNCTION, RETURN,
+ HALT) = range(26)
+
+ARITHMETIC = {'add': ADD, 'sub': SUB, 'neg': NEG, 'eq': EQ, 'gt': GT, 'lt': LT, 'and': AND, 'or': OR, 'not': NOT}
+PUSH = {'local': PUSH_LOCAL, 'argument': PUSH_ARGUMENT, 'this': PUSH_THIS, 'that': PUSH_THAT}
+POP = {'local': POP_LOCAL, 'argument': POP_ARGUMENT, 'this': POP_THIS, 'that': POP_THAT}
+
+SCREEN = 16384
+KEYBOARD = 24576
+HEAP = 2048
+
+
+def signed(x):
+    # a 16 bit word as a signed number
+    return x - 0x10000 if x & 0x8000 else x
+
+
+def vm_files(path):
+    # the .vm files at path, in the order the VM Translator reads them
+    path = os.path.normpath(path)
+    if os.path.isdir(path):
+        return [path + '/' + x for x in os.listdir(path) if x.endswith('.vm')]
+    return [path]
+
+
+class JackOS():
+    '''
+    The Jack OS functions the emulator provides, as methods named Class_function taking the arguments as
+    16 bit words. A method returns the result (None counts as 0 for void functions) or WAIT to be called
+    again with the same arguments on the next step.
+    '''
+
+    WAIT = object()
+
+    def __init__(self, vm):
+        self.vm = vm
+        self.ram = vm.ram
+        self.reset()
+
+    def reset(self):
+        # free heap blocks as [address, size] in address order, and the size of each allocated block
+        self._free = [[HEAP, SCREEN - HEAP]]
+        self._sizes = dict()
+        self._color = True
+        # printed text, and the cursor of the 23 x 64 character screen
+        self.text = []
+        self._row = self._column = 0
+        # Keyboard.readChar: the key pressed and not yet released, readLine: the characters read so far
+        self._key = 0
+        self._line = None
+
+    def error(self, code):
+        self.vm.error = code
+        self.vm.halted = True
+
+    # Sys
+
+    def Sys_init(self):
+        # only reached as a built in, the bootstrap then calls Main.main instead
+        return 0
+
+    def Sys_halt(self):
+        self.vm.halted = True
+
+    def Sys_error(self, code):
+        self.error(signed(code))
+
+    def Sys_wait(self, duration):
+        if signed(duration) < 0:
+            self.error(1)
+
+    # Math
+
+    def Math_init(self):
+        return 0
+
+    def Math_multiply(self, x, y):
+        return signed(x) * signed(y)
+
+    def Math_divide(self, x, y):
+        x, y = signed(x), signed(y)
+        if y == 0:
+            return self.error(3)
+        quotient = abs(x) // abs(y)
+        return quotient if (x < 0) == (y < 0) else -quotient
+
+    def Math_min(self, x, y):
+        return min(signed(x), signed(y))
+
+    def Math_max(self, x, y):
+        return max(signed(x), signed(y))
+
+    def Math_abs(self, x):
+        return abs(signed(x))
+
+    def Math_sqrt(self, x):
+        x = signed(x)
+        if x < 0:
+            return self.error(4)
+        root = int(x ** 0.5)
+        while root * root > x:
+            root -= 1
+        while (root + 1) * (root + 1) <= x:
+            root += 1
+        return root
+
+    # Memory and Array
+
+    def Memory_init(self):
+        return 0
+
+    def Memory_peek(self, address):
+        return self.ram[address]
+
+    def Memory_poke(self, address, value):
+        self.ram[address] = value
+
+    def Memory_alloc(self, size):
+        size = signed(size)
+        if size <= 0:
+            return self.error(5)
+        for block in self._free:
+            if block[1] >= size:
+                address = block[0]
+                block[0] += size
+                block[1] -= size
+                if not block[1]:
+                    self._free.remove(block)
+                self._sizes[address] = size
+                return address
+        return self.error(6)
+
+    def Memory_deAlloc(self, address):
+        size = self._sizes.pop(address, None)
+        if size is None:
+            return
+        # put the block back in address order, joined with the free blocks next to it
+        free = self._free
+        n = 0
+        while n < len(free) and free[n][0] < address:
+            n += 1
+        free.insert(n, [address, size])
+        if n + 1 < len(free) and address + size == free[n + 1][0]:
+            free[n][1] += free.pop(n + 1)[1]
+        if n > 0 and free[n - 1][0] + free[n - 1][1] == address:
+            free[n - 1][1] += free.pop(n)[1]
+
+    def Array_new(self, size):
+        if signed(size) <= 0:
+            return self.error(2)
+        return self.Memory_alloc(size)
+
+    def Array_dispose(self, this):
+        self.Memory_deAlloc(this)
+
+    # String, stored as [maximum length, length, characters...]
+
+    def String_new(self, length):
+        if signed(length) < 0:
+            return self.error(14)
+        this = self.Memory_alloc(length + 2)
+        if this is not None:
+            self.ram[this] = length
+            self.ram[this + 1] = 0
+        return this
+
+    def String_dispose(self, this):
+        self.Memory_deAlloc(this)
+
+    def String_length(self, this):
+        return self.ram[this + 1]
+
+    def String_charAt(self, this, j):
+        if j >= self.ram[this + 1]:
+            return self.error(15)
+        return self.ram[this + 2 + j]
+
+    def String_setCharAt(self, this, j, c):
+        if j >= self.ram[this + 1]:
+            return self.error(16)
+        self.ram[this + 2 + j] = c
+
+    def String_appendChar(self, this, c):
+        ram = self.ram
+        if ram[this + 1] >= ram[this]:
+            return self.error(17)
+        ram[this + 2 + ram[this + 1]] = c
+        ram[this + 1] += 1
+        return this
+
+    def String_eraseLastChar(self, this):
+        if not self.ram[this + 1]:
+            return self.error(18)
+        self.ram[this + 1] -= 1
+
+    def String_intValue(self, this):
+        chars = self.string(this)
+        sign = -1 if chars[:1] == '-' else 1
+        value = 0
+        for c in chars[1:] if sign < 0 else chars:
+            if not c.isdigit():
+                break
+            value = value * 10 + int(c)
+        return sign * value
+
+    def String_setInt(self, this, value):
+        digits = str(signed(value))
+        if len(digits) > self.ram[this]:
+            return self.error(19)
+        self.ram[this + 1] = len(digits)
+        for j, c in enumerate(digits):
+            self.ram[this + 2 + j] = ord(c)
+
+    def String_newLine(self):
+        return 128
+
+    def String_backSpace(self):
+        return 129
+
+    def String_doubleQuote(self):
+        return 34
+
+    def string(self, this):
+        # the characters of a String object as a Python string
+        return ''.join(chr(c) for c in self.ram[this + 2:this + 2 + self.ram[this + 1]])
+
+    # Output, the text is collected in self.text
+
+    def Output_init(self):
+        return 0
+
+    def Output_moveCursor(self, row, column):
+        if row > 22 or column > 63:
+            return self.error(20)
+        self._row, self._column = row, column
+        self.text.append('\n')
+
+    def Output_printChar(self, c):
+        if c == 128:
+            return self.Output_println()
+        if c == 129:
+            return self.Output_backSpace()
+        self.text.append(chr(c))
+        self._column += 1
+        if self._column == 64:
+            self.Output_println()
+
+    def Output_printString(self, s):
+        for c in self.string(s):
+            self.Output_printChar(ord(c))
+
+    def Output_printInt(self, i):
+        for c in str(signed(i)):
+            self.Output_printChar(ord(c))
+
+    def Output_println(self):
+        self.text.append('\n')
+        self._row = (self._row + 1) % 23
+        self._column = 0
+
+    def Output_backSpace(self):
+        if self.text and self.text[-1] != '\n':
+            self.text.pop()
+        self._column = max(0, self._column - 1)
+
+    # Screen, drawn into screen memory
+
+    def Screen_init(self):
+        return 0
+
+    def Screen_clearScreen(self):
+        self.ram[SCREEN:KEYBOARD] = [0] * (KEYBOARD - SCREEN)
+
+    def Screen_setColor(self, color):
+        self._color = bool(color)
+
+    def fill(self, y, x1, x2):
+        # set the pixels x1..x2 of row y to the current color
+        ram = self.ram
+        row = SCREEN + 32 * y
+        for word in range(x1 // 16, x2 // 16 + 1):
+            low = max(x1, 16 * word) - 16 * word
+            high = min(x2, 16 * word + 15) - 16 * word
+            mask = ((2 << high) - 1) & ~((1 << low) - 1)
+            if self._color:
+                ram[row + word] |= mask
+            else:
+                ram[row + word] &= ~mask & 0xFFFF
+
+    def Screen_drawPixel(self, x, y):
+        if x > 511 or y > 255:
+            return self.error(7)
+        self.fill(y, x, x)
+
+    def Screen_drawLine(self, x1, y1, x2, y2):
+        if max(x1, x2) > 511 or max(y1, y2) > 255:
+            return self.error(8)
+        if y1 == y2:
+            return self.fill(y1, min(x1, x2), max(x1, x2))
+        dx, dy = abs(x2 - x1), abs(y2 - y1)
+        sx, sy = (1 if x2 > x1 else -1), (1 if y2 > y1 else -1)
+        x, y, error = x1, y1, dx - dy
+        while True:
+            self.fill(y, x, x)
+            if x == x2 and y == y2:
+                break
+            if 2 * error > -dy:
+                error -= dy
+                x += sx
+            if 2 * error < dx:
+                error += dx
+                y += sy
+
+    def Screen_drawRectangle(self, x1, y1, x2, y2):
+        if x1 > x2 or y1 > y2 or x2 > 511 or y2 > 255:
+            return self.error(9)
+        for y in range(y1, y2 + 1):
+            self.fill(y, x1, x2)
+
+    def Screen_drawCircle(self, x, y, r):
+        if x > 511 or y > 255:
+            return self.error(12)
+        if r > 181 or x < r or y < r or x + r > 511 or y + r > 255:
+            return self.error(13)
+        for dy in range(-r, r + 1):
+            half = int((r * r - dy * dy) ** 0.5)
+            self.fill(y + dy, x - half, x + half)
+
+    # Keyboard, read from the keyboard register
+
+    def Keyboard_init(self):
+        return 0
+
+    def Keyboard_keyPressed(self):
+        return self.ram[KEYBOARD]
+
+    def Keyboard_readChar(self):
+        # wait for a key to be pressed and released, then echo and return it
+        key = self.ram[KEYBOARD]
+        if key:
+            self._key = key
+            return self.WAIT
+        if not self._key:
+            return self.WAIT
+        key, self._key = self._key, 0
+        self.Output_printChar(key)
+        return key
+
+    def Keyboard_readLine(self, message):
+        if self._line is None:
+            self.Output_printString(message)
+            self._line = []
+        key = self.Keyboard_readChar()
+        if key is self.WAIT:
+            return key
+        if key == 129:
+            if self._line:
+                self._line.pop()
+            return self.WAIT
+        if key != 128:
+            self._line.append(key)
+            return self.WAIT
+        line, self._line = self._line, None
+        this = self.String_new(len(line))
+        for c in line:
+            self.String_appendChar(this, c)
+        return this
+
+    def Keyboard_readInt(self, message):
+        this = self.Keyboard_readLine(message)
+        if this is self.WAIT:
+            return this
+        value = self.String_intValue(this)
+        self.String_dispose(this)
+        return value
+
+
+class VMEmulator():
+    '''
+    Runs .vm code on 64K words of RAM. A profiler, such as vmprofile.CallProfiler, can be given to follow
+    the calls and returns, it is only used when a function is entered or left.
+    '''
+
+    def __init__(self, files, profiler = None):
+        self.ram = [0] * 65536
+        self.profiler = profiler
+        self.steps = 0
+        self.halted = False
+        # code passed to Sys.error, or None
+        self.error = None
+        # deepest the stack has grown
+        self.max_sp = 256
+        # functions run() stops at before calling them, unless it starts there
+        self.breakpoints = set()
+        self.os = JackOS(self)
+        self.compile(files)
+        self.reset()
+
+    def compile(self, files):
+        Parser = load_tool('Virtual_Machine', 'parser').Parser
+        program = []
+        functions = dict()
+        labels = dict()
+        statics = dict()
+        # calls and gotos are resolved once every function and label is known
+        calls = []
+        jumps = []
+        for file in files:
+            name = os.path.basename(file).replace('.vm', '')
+            function = None
+            for kind, command, arg1, arg2 in Parser(file).commands():
+                if kind == 'C_PUSH' or kind == 'C_POP':
+                    index = int(arg2)
+                    if arg1 == 'constant':
+                        program.append((PUSH_CONSTANT, index & 0xFFFF))
+                        continue
+                    if arg1 in PUSH:
+                        program.append(((PUSH if kind == 'C_PUSH' else POP)[arg1], index))
+                        continue
+                    if arg1 == 'temp':
+                        address = 5 + index
+                    elif arg1 == 'pointer':
+                        address = 3 + index
+                    else:
+                        address = statics.setdefault((name, index), 16 + len(statics))
+                    program.append((PUSH_FIXED if kind == 'C_PUSH' else POP_FIXED, address))
+                elif kind in ('C_ARITHMETIC', 'C_BOOLEAN'):
+                    program.append((ARITHMETIC[command], None))
+                elif kind == 'C_LABEL':
+                    labels[(function, arg1)] = len(program)
+                elif kind in ('C_GOTO', 'C_IF'):
+                    jumps.append((len(program), function, arg1))
+                    program.append((GOTO if kind == 'C_GOTO' else IF_GOTO, None))
+                elif kind == 'C_FUNCTION':
+                    function = arg1
+                    functions[function] = len(program)
+                    program.append((FUNCTION, int(arg2)))
+                elif kind == 'C_CALL':
+                    calls.append((len(program), arg1, int(arg2)))
+                    program.append((CALL, None))
+                elif kind == 'C_RETURN':
+                    program.append((RETURN, None))
+        for n, function, label in jumps:
+            if (function, label) not in labels:
+                raise ValueError('unknown label ' + label + ' in ' + str(function))
+            program[n] = (program[n][0], labels[(function, label)])
+        # code outside of functions, as in a single file of commands, runs first and halts at its end, a
+        # program of functions starts at the bootstrap: call Sys.init (the OS's calls Main.main) and halt
+        program.append((HALT, None))
+        bootstrap = len(program)
+        calls.append((bootstrap, 'Sys.init' if 'Sys.init' in functions or 'Main.main' not in functions
+                                  else 'Main.main', 0))
+        program += [(CALL, None), (HALT, None)]
+        for n, name, args in calls:
+            if name in functions:
+                program[n] = (CALL, (functions[name], args, name))
+            else:
+                builtin = getattr(self.os, name.replace('.', '_'), None)
+                if builtin is None:
+                    raise ValueError('unknown function ' + name)
+                program[n] = (CALL, (builtin, args, name))
+        self._program = program
+        self._start = bootstrap if program[0][0] == FUNCTION else 0
+        self.functions = functions
+        self.statics = statics
+
+    def reset(self):
+        self.ram[:] = [0] * 65536
+        self.os.reset()
+        self.ram[0] = 256
+        self.ram[1] = self.ram[2] = 256
+        self.pc = self._start
+        self.steps = 0
+        self.max_sp = 256
+        # deepest the stack has grown since the current function was called, when profiling
+        self._peak = 256
+        self.halted = False
+        self.error = None
+
+    def run(self, max_steps = None):
+        # run until the program halts or max_steps VM commands have been run, returns the number of steps run
+        program, ram, profiler, wait, breakpoints = self._program, self.ram, self.profiler, JackOS.WAIT, self.breakpoints
+        pc, steps, max_sp = self.pc, self.steps, self.max_sp
+        sp, lcl, arg = ram[0], ram[1], ram[2]
+        peak = self._peak
+        start = steps
+        limit = float('inf') if max_steps is None else steps + max_steps
+        size = len(program)
+        while steps < limit:
+            if pc >= size:
+                self.halted = True
+                break
+            op, x = program[pc]
+            steps += 1
+            pc += 1
+            if op == PUSH_CONSTANT:
+                ram[sp] = x
+                sp += 1
+                if sp > peak:
+                    peak = sp
+            elif op == PUSH_LOCAL:
+                ram[sp] = ram[lcl + x]
+                sp += 1
+                if sp > peak:
+                    peak = sp
+            elif op == PUSH_ARGUMENT:
+                ram[sp] = ram[arg + x]
+                sp += 1
+                if sp > peak:
+                    peak = sp
+            elif op == POP_LOCAL:
+                sp -= 1
+                ram[lcl + x] = ram[sp]
+            elif op == ADD:
+                sp -= 1
+                ram[sp - 1] = (ram[sp - 1] + ram[sp]) & 0xFFFF
+            elif op == IF_GOTO:
+                sp -= 1
+                if ram[sp]:
+                    pc = x
+            elif op == GOTO:
+                if x == pc - 1:
+                    # a loop on itself, such as 'label END goto END', is how VM programs stop
+                    steps -= 1
+                    pc = x
+                    self.halted = True
+                    break
+                pc = x
+            elif op == PUSH_FIXED:
+                ram[sp] = ram[x]
+                sp += 1
+                if sp > peak:
+                    peak = sp
+            elif op == POP_FIXED:
+                sp -= 1
+                ram[x] = ram[sp]
+            elif op == PUSH_THIS:
+                ram[sp] = ram[(ram[3] + x) & 0xFFFF]
+                sp += 1
+                if sp > peak:
+                    peak = sp
+            elif op == PUSH_THAT:
+                ram[sp] = ram[(ram[4] + x) & 0xFFFF]
+                sp += 1
+                if sp > peak:
+                    peak = sp
+            elif op == POP_THIS:
+                sp -= 1
+                ram[(ram[3] + x) & 0xFFFF] = ram[sp]
+            elif op == POP_THAT:
+                sp -= 1
+                ram[(ram[4] + x) & 0xFFFF] = ram[sp]
+            elif op == POP_ARGUMENT:
+                sp -= 1
+                ram[arg + x] = ram[sp]
+            elif op == SUB:
+                sp -= 1
+                ram[sp - 1] = (ram[sp - 1] - ram[sp]) & 0xFFFF
+            elif op == LT:
+                sp -= 1
+                ram[sp - 1] = 0xFFFF if ram[sp - 1] ^ 0x8000 < ram[sp] ^ 0x8000 else 0
+            elif op == GT:
+                sp -= 1
+                ram[sp - 1] = 0xFFFF if ram[sp - 1] ^ 0x8000 > ram[sp] ^ 0x8000 else 0
+            elif op == EQ:
+                sp -= 1
+                ram[sp - 1] = 0xFFFF if ram[sp - 1] == ram[sp] else 0
+            elif op == NOT:
+                ram[sp - 1] ^= 0xFFFF
+            elif op == AND:
+                sp -= 1
+                ram[sp - 1] &= ram[sp]
+            elif op == OR:
+                sp -= 1
+                ram[sp - 1] |= ram[sp]
+            elif op == NEG:
+                ram[sp - 1] = -ram[sp - 1] & 0xFFFF
+            elif op == CALL:
+                target, args, name = x
+                if breakpoints and name in breakpoints and steps != start + 1:
+                    steps -= 1
+                    pc -= 1
+                    break
+                if target.__class__ is int:
+                    # push the return address and the caller's LCL, ARG, THIS and THAT
+                    ram[sp] = pc
+                    ram[sp + 1] = lcl
+                    ram[sp + 2] = arg
+                    ram[sp + 3] = ram[3]
+                    ram[sp + 4] = ram[4]
+                    sp += 5
+                    arg = sp - 5 - args
+                    lcl = sp
+                    if sp > peak:
+                        peak = sp
+                    if profiler is not None:
+                        if peak > max_sp:
+                            max_sp = peak
+                        profiler.call(name, steps, arg, peak)
+                        peak = sp
+                    pc = target
+                else:
+                    result = target(*ram[sp - args:sp])
+                    if result is wait:
+                        pc -= 1
+                        continue
+                    if profiler is not None:
+                        profiler.builtin(name)
+                    sp -= args
+                    ram[sp] = (result or 0) & 0xFFFF
+                    sp += 1
+                    if sp > peak:
+                        peak = sp
+                    if self.halted:
+                        break
+            elif op == FUNCTION:
+                for n in range(x):
+                    ram[sp + n] = 0
+                sp += x
+                if sp > peak:
+                    peak = sp
+            elif op == RETURN:
+                frame = lcl
+                pc = ram[frame - 5]
+                ram[arg] = ram[sp - 1]
+                sp = arg + 1
+                ram[4] = ram[frame - 1]
+                ram[3] = ram[frame - 2]
+                arg = ram[frame - 3]
+                lcl = ram[frame - 4]
+                if profiler is not None:
+                    peak = profiler.ret(steps, peak)
+            elif op == HALT:
+                steps -= 1
+                pc -= 1
+                self.halted = True
+                break
+        ram[0], ram[1], ram[2] = sp, lcl, arg
+        self.pc, self.steps, self.max_sp, self._peak = pc, steps, max(max_sp, peak), peak
+        return steps - start
+
+
+if __name__ == '__main__':
+    try:
+        path = sys.argv[1]
+    except IndexError:
+        path = ""
+    if path:
+        vm = VMEmulator(vm_files(path))
+        vm.run(int(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(path, 'ran for', vm.steps, 'steps', '(halted)' if vm.halted else '(stopped)')
+        print('RAM[0..15]:', vm.ram[:16])
+        if vm.os.text:
+            print('Output:', ''.join(vm.os.text))
@@ -0,0 +1,134 @@
+'''
+Profiler of VM programs run on the VMEmulator, counting the calls and VM commands of each function.
+
+The CallProfiler is given to the VMEmulator, which only calls it when a function is entered or left, so
+the commands in between run at full speed. For each function it counts the calls, the VM commands run in
+its own code (self) and in calls to it including the functions it calls (inclusive, a recursive call is
+only counted once) and the deepest the stack grew during a call, in words from the function's arguments
+up, which includes the frames of the functions it calls. Functions of the Jack OS built into the
+emulator only count calls, their commands are not VM code.
+
+To use this script run 'python vmprofile.py <path> [options]', where <path> is a .vm file or a directory
+of .vm or .jack files (.jack files are compiled first).
+
+Options:
+    --steps N          stop after N VM commands (default: run until the program halts)
+    --top N            number of functions listed (default 20)
+    --sort KEY         order of the list: self, inclusive, calls or stack (default self)
+    --json FILE        write the counts of every function as JSON
+'''
+
+import os, json, argparse
+from vmemulator import VMEmulator, vm_files
+from toolchain import compile_jack
+
+# the caller of the first function, the bootstrap
+BOOTSTRAP = '(bootstrap)'
+
+
+class CallProfiler():
+
+    def __init__(self):
+        self.calls = dict()
+        # function -> VM commands run in its own code and in outermost calls to it
+        self.self_steps = dict()
+        self.inclusive = dict()
+        # function -> most stack words used by a call, from its arguments up
+        self.stack = dict()
+        self.builtins = set()
+        # deepest nesting of calls
+        self.max_depth = 0
+        # open calls: (function, steps at the call, address of its arguments, stack peak of the caller)
+        self._frames = [(BOOTSTRAP, 0, 256, 256)]
+        # open calls of each function, inclusive steps are counted when the outermost one returns
+        self._active = dict()
+        self._mark = 0
+
+    def call(self, name, steps, base, peak):
+        caller = self._frames[-1][0]
+        self.self_steps[caller] = self.self_steps.get(caller, 0) + steps - self._mark
+        self._mark = steps
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self._active[name] = self._active.get(name, 0) + 1
+        self._frames.append((name, steps, base, peak))
+        if len(self._frames) - 1 > self.max_depth:
+            self.max_depth = len(self._frames) - 1
+
+    def ret(self, steps, peak):
+        # returns the stack peak of the caller, which includes the callee's
+        name, start, base, caller_peak = self._frames.pop()
+        self.self_steps[name] = self.self_steps.get(name, 0) + steps - self._mark
+        self._mark = steps
+        if peak - base > self.stack.get(name, 0):
+            self.stack[name] = peak - base
+        self._active[name] -= 1
+        if not self._active[name]:
+            self.inclusive[name] = self.inclusive.get(name, 0) + steps - start
+        return max(caller_peak, peak)
+
+    def builtin(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        self.builtins.add(name)
+
+    def report(self, vm):
+        # the counts of each function as a dictionary, with the calls still open when vm stopped counted
+        # up to vm's current step
+        self_steps = dict(self.self_steps)
+        inclusive = dict(self.inclusive)
+        stack = dict(self.stack)
+        steps, peak = vm.steps, vm._peak
+        top = self._frames[-1][0]
+        self_steps[top] = self_steps.get(top, 0) + steps - self._mark
+        for name, start, base, caller_peak in reversed(self._frames):
+            stack[name] = max(stack.get(name, 0), peak - base)
+            peak = max(peak, caller_peak)
+        outermost = set()
+        for name, start, base, caller_peak in self._frames:
+            if name not in outermost:
+                outermost.add(name)
+                inclusive[name] = inclusive.get(name, 0) + steps - start
+        names = set(self.calls) | set(self_steps)
+        functions = {name: {'calls': self.calls.get(name, 0), 'self': self_steps.get(name, 0),
+                            'inclusive': inclusive.get(name, 0), 'stack': stack.get(name, 0),
+                            'builtin': name in self.builtins} for name in names}
+        return {'steps': steps, 'halted': vm.halted, 'max_stack': vm.max_sp - 256, 'max_depth': self.max_depth,
+                'functions': functions}
+
+
+def load_program(path):
+    # the .vm files at path, compiling .jack files first
+    path = os.path.normpath(path)
+    if os.path.isdir(path) and any(x.endswith('.jack') for x in os.listdir(path)):
+        compile_jack(path)
+    return vm_files(path)
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Profiles the calls and VM commands of each function.')
+    arguments.add_argument('path', help='.vm file or directory of .vm or .jack files')
+    arguments.add_argument('--steps', type=int, help='stop after this many VM commands')
+    arguments.add_argument('--top', type=int, default=20, help='number of functions listed')
+    arguments.add_argument('--sort', choices=['self', 'inclusive', 'calls', 'stack'], default='self',
+                           help='order of the list')
+    arguments.add_argument('--json', metavar='FILE', help='write the counts of every function as JSON')
+    options = arguments.parse_args()
+    profiler = CallProfiler()
+    vm = VMEmulator(load_program(options.path), profiler)
+    vm.run(options.steps)
+    report = profiler.report(vm)
+    total = max(1, vm.steps)
+    print(options.path, 'ran for', vm.steps, 'VM commands', '(halted)' if vm.halted else '(stopped)',
+          '- stack', report['max_stack'], 'words, call depth', report['max_depth'], '\n')
+    print('function'.ljust(36), 'calls'.rjust(9), 'self'.rjust(11), '%'.rjust(6), 'inclusive'.rjust(11),
+          '%'.rjust(6), 'stack'.rjust(6))
+    rows = sorted(report['functions'].items(), key=lambda x: (-x[1][options.sort], x[0]))
+    for name, counts in rows[:options.top]:
+        print((name + (' *' if counts['builtin'] else ''))[:36].ljust(36), str(counts['calls']).rjust(9),
+              str(counts['self']).rjust(11), ('%.1f' % (100 * counts['self'] / total)).rjust(6),
+              str(counts['inclusive']).rjust(11), ('%.1f' % (100 * counts['inclusive'] / total)).rjust(6),
+              str(counts['stack']).rjust(6))
+    if report['functions'] and any(counts['builtin'] for counts in report['functions'].values()):
+        print('\n* built in Jack OS function, only its calls are counted')
+    if options.json:
+        with open(options.json, 'w') as temp:
+            json.dump(report, temp, indent=1, sort_keys=True)
@@ -4,11 +4,22 @@ Translates .vm code files into HACK assembly .asm files. Follows the API outline
 To use this script run:
 	- VMTranslator.py <directory>
 	- VMTranslator.py <vm file>
+
+Options:
+	--cycle-weight W    cost of one cycle relative to one word of ROM when choosing between code
+	                    sequences (default 0.4), lower values favour smaller code
+	--no-tail-calls     translate 'call f n; return' as a normal call followed by a return
+	--no-dedup          keep functions whose code is the same as another function's
+	--share-stubs       share the code of calls, returns and comparisons where that saves ROM
+	--profile [FILE]    report the time and memory of the parse, translate, write and link phases as JSON
+	                    (see Tools/phaseprofile.py for --profile-top and --cprofile)
 """
 
-import sys, os
+import sys, os, argparse
+from contextlib import nullcontext
 from parser import Parser 
 from codewriter import CodeWriter 
+from linker import Linker
 
 
 class VMTranslator():
@@ -17,7 +28,9 @@ class VMTranslator():
     A new Parser is created for each file in the directory.
     '''
 
-    def __init__(self, filename):
+    def __init__(self, filename, cycle_weight = 0.4, tail_calls = True, dedup = True, share_stubs = False,
+                 profiler = None):
+        self._profiler = profiler
         if os.path.isdir(filename):
             self._files = [filename + '/' + x for x in os.listdir(filename) if x.endswith(".vm")]
             self._isdir = True
@@ -31,43 +44,48 @@ class VMTranslator():
             self._isdir = False
             return
         self._output = []
-        self._code = CodeWriter(self._name)
+        self._code = CodeWriter(self._name, cycle_weight, tail_calls)
         if self._isdir:
             self._code.write_init()
         for file in self._files:
-            self._parser = Parser(file)
+            with self.phase('parse'):
+                self._parser = Parser(file)
+                commands = self._parser.commands()
             self._code.filename(file.replace('.vm','').split('/')[-1])
-            self.translate()
-        self._code.close()
+            with self.phase('translate'):
+                self.translate(commands)
+        with self.phase('write'):
+            self._code.close()
+        if dedup:
+            with self.phase('link'):
+                Linker(self._name, share_stubs)
 
-    def translate(self):
-        # using input from parser, translate and output
-        while self._parser.has_more_commands():
-            self._parser.advance()
-            if self._parser.command_type() in ['C_ARITHMETIC','C_BOOLEAN']:
-                self._code.write_arithmetic(self._parser.command())
-            elif self._parser.command_type() in ['C_POP','C_PUSH']:
-                self._code.write_pushpop(self._parser.command_type(),
-                                          self._parser.arg1(),
-                                          self._parser.arg2())
-            elif self._parser.command_type() == 'C_LABEL':
-                self._code.write_label(self._parser.arg1())
-            elif self._parser.command_type() == 'C_GOTO':
-                self._code.write_goto(self._parser.arg1())
-            elif self._parser.command_type() == 'C_IF':
-                self._code.write_if(self._parser.arg1())
-            elif self._parser.command_type() == 'C_FUNCTION':
-                self._code.write_function(self._parser.arg1(), self._parser.arg2())
-            elif self._parser.command_type() == 'C_CALL':
-                self._code.write_call(self._parser.arg1(), self._parser.arg2())
-            elif self._parser.command_type() == 'C_RETURN':
-                self._code.write_return()
+    def phase(self, name):
+        # times a phase of the translation when a profiler is given
+        return self._profiler.phase(name) if self._profiler is not None else nullcontext()
 
+    def translate(self, commands):
+        # the whole file is read first, so that the CodeWriter can look ahead for idioms it can fuse
+        self._code.write_commands(commands)
 
 
 if __name__ == '__main__':
-    try:
-        filename = sys.argv[1]
-    except IndexError:
-        filename = ""
-    VMTranslator(filename)
+    arguments = argparse.ArgumentParser(description='Translates .vm files into Hack assembly.')
+    arguments.add_argument('filename', nargs='?', default='', help='.vm file or directory of .vm files')
+    arguments.add_argument('--cycle-weight', type=float, default=0.4,
+                           help='cost of one cycle relative to one word of ROM')
+    arguments.add_argument('--no-tail-calls', dest='tail_calls', action='store_false',
+                           help="translate 'call f n; return' as a normal call followed by a return")
+    arguments.add_argument('--no-dedup', dest='dedup', action='store_false',
+                           help="keep functions whose code is the same as another function's")
+    arguments.add_argument('--share-stubs', action='store_true',
+                           help='share the code of calls, returns and comparisons where that saves ROM')
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Tools'))
+    import phaseprofile
+    phaseprofile.add_arguments(arguments)
+    options = arguments.parse_args()
+    profiler = phaseprofile.from_options('vmtranslator', options)
+    VMTranslator(options.filename, options.cycle_weight, options.tail_calls, options.dedup, options.share_stubs,
+                 profiler)
+    if profiler is not None:
+        profiler.finish()
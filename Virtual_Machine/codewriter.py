@@ -6,9 +6,10 @@ Generates .asm code based on the parsed VM commands, outputs to a file given as
 
 class CodeWriter():
 
-    def __init__(self, filename):
+    def __init__(self, filename, cycle_weight = 0.4, tail_calls = True, output = None):
         self._name = filename
-        self._file = open(filename, 'w')
+        # the code goes to filename, or to an open file such as an io.StringIO
+        self._file = open(filename, 'w') if output is None else output
         #print('Output file:', filename)
         self._current_function = None
         self._command = {'not': ['@SP\n','A=M-1\n','M=!M\n'],
@@ -29,10 +30,73 @@ class CodeWriter():
            'pointer': ['@3\n','D=A\n'],
            'temp': ['@5\n','D=A\n']}
         self._counter = 0
+        # cost of one cycle relative to one word of ROM, used to pick the function prologue
+        self._cycle_weight = cycle_weight
+        # translate 'call f n; return' as a tail call
+        self._tail_calls = tail_calls
+        # binary operators that fused sequences compute in D, with the second operand in A or M
+        self._fused_op = {'add': ('D=D+A\n', 'D=D+M\n'), 'sub': ('D=D-A\n', 'D=M-D\n'),
+                          'and': ('D=D&A\n', 'D=D&M\n'), 'or': ('D=D|A\n', 'D=D|M\n')}
+        # largest index reached by an 'A=M+1','A=A+1',... chain instead of the R13 detour when popping
+        self._max_chain = 6
+        # per command: (count, generic template instructions, emitted instructions)
+        self._costs = dict()
+        # number of times each idiom was fused
+        self._fused = {'inc': 0, 'binary-pop': 0, 'binary': 0, 'move': 0}
 
     def filename(self, name):
         self._name = name
 
+    def write_commands(self, commands):
+        # translate a list of (type, command, arg1, arg2) tuples as given by Parser.commands
+        i = 0
+        while i < len(commands):
+            fused = self.write_fused(commands, i)
+            if fused:
+                i += fused
+                continue
+            command_type, command, arg1, arg2 = commands[i]
+            if command_type in ['C_ARITHMETIC','C_BOOLEAN']:
+                self.write_arithmetic(command)
+            elif command_type in ['C_POP','C_PUSH']:
+                self.write_pushpop(command_type, arg1, arg2)
+            elif command_type == 'C_LABEL':
+                self.write_label(arg1)
+            elif command_type == 'C_GOTO':
+                self.write_goto(arg1)
+            elif command_type == 'C_IF':
+                self.write_if(arg1)
+            elif command_type == 'C_FUNCTION':
+                self.write_function(arg1, arg2)
+            elif (command_type == 'C_CALL' and self._tail_calls and i + 1 < len(commands)
+                    and commands[i + 1][0] == 'C_RETURN'):
+                # the return is part of the tail call
+                self.write_tail_call(arg1, arg2)
+                i += 1
+            elif command_type == 'C_CALL':
+                self.write_call(arg1, arg2)
+            elif command_type == 'C_RETURN':
+                self.write_return()
+            i += 1
+
+    def write_asm(self, lines):
+        # write Hack assembly generated elsewhere, e.g. by the Jack compiler's HackWriter
+        self._file.writelines(lines)
+
+    def tail_calls(self):
+        return self._tail_calls
+
+    def label_name(self, label):
+        # labels are scoped to the function they appear in
+        if self._current_function is None:
+            return label
+        return self._current_function + '$' + label
+
+    def unique_label(self, prefix):
+        # a label no other command uses
+        self._counter += 1
+        return prefix + str(self._counter - 1)
+
     def write_arithmetic(self, command):
         self._file.writelines(['// ' + command + '\n'])
         if command in ['eq', 'gt', 'lt']:
@@ -58,70 +122,163 @@ class CodeWriter():
     def write_pushpop(self, command, segment, index):
         if command == 'C_PUSH':
             self._file.writelines(['//' + ' push ' + segment + ' ' + index + '\n'])
+        elif command == 'C_POP':
+            self._file.writelines(['//' + ' pop ' + segment + ' ' + index + '\n'])
+        code = self.pushpop(command, segment, index)
+        # compare against the generic template for the same command
+        key = command[2:].lower() + ' ' + segment
+        count, generic, selected = self._costs.get(key, (0, 0, 0))
+        self._costs[key] = (count + 1, generic + self.cost(self.generic_pushpop(command, segment, index)),
+                            selected + self.cost(code))
+        self._file.writelines(code)
+
+    def pushpop(self, command, segment, index):
+        # push/pop specialised by segment and index
+        if command == 'C_PUSH' and segment == 'constant' and index in ['0', '1']:
+            return ['@SP\n','A=M\n','M=' + index + '\n','@SP\n','M=M+1\n']
+        elif command == 'C_PUSH':
+            return self.load_d(segment, index) + self._command['PUSH_D']
+        elif self.direct(segment, index) is not None or int(index) <= self._max_chain:
+            # pop into an address that can be reached without clobbering D, so R13 is not needed
+            return self._command['POP_D'] + self.address_a(segment, index, self._max_chain) + ['M=D\n']
+        return self.generic_pushpop(command, segment, index)
+
+    def generic_pushpop(self, command, segment, index):
+        # the general push/pop templates, computing base + index for every segment
+        code = []
+        if command == 'C_PUSH':
             if segment == 'constant':
-                self._file.writelines(['@'+index+'\n','D=A\n'])
-                self._file.writelines(self._command['PUSH_D'])
+                code += ['@'+index+'\n','D=A\n']
+                code += self._command['PUSH_D']
             elif segment in ['local','argument','this','that']:
-				#Set D to base
-                self._file.writelines(self._command[segment])
-				#Store contents of base + index in D
-                self._file.writelines(['@'+index+'\n','A=D+A\n','D=M\n'])
-                self._file.writelines(self._command['PUSH_D'])
+                #Set D to base
+                code += self._command[segment]
+                #Store contents of base + index in D
+                code += ['@'+index+'\n','A=D+A\n','D=M\n']
+                code += self._command['PUSH_D']
             elif segment in ['pointer', 'temp']:
                 #Set D to base
-                self._file.writelines(self._command[segment])
+                code += self._command[segment]
                 #Store contents of base + index in D
-                self._file.writelines(['@'+index+'\n','A=D+A\n','D=M\n'])
-                self._file.writelines(self._command['PUSH_D'])
-            else: 
+                code += ['@'+index+'\n','A=D+A\n','D=M\n']
+                code += self._command['PUSH_D']
+            else:
                 # static
-                self._file.writelines(['@' + self._name + '.'+ index +'\n','D=M\n'])
-                self._file.writelines(self._command['PUSH_D'])
+                code += ['@' + self._name + '.'+ index +'\n','D=M\n']
+                code += self._command['PUSH_D']
         elif command == 'C_POP':
-            self._file.writelines(['//' + ' pop ' + segment + ' ' + index + '\n'])
             if segment in ['local','argument','this','that','pointer','temp']:
                 #Set D to base
-                self._file.writelines(self._command[segment])
-				#Set D = base + index
-                self._file.writelines(['@'+index+'\n','D=D+A\n'])
-				#Use RAM[13] as storage for base+index
-                self._file.writelines(['@R13\n','M=D\n'])
-				#Pop actual top of stack
-                self._file.writelines(self._command['POP_D'])
-				#Retrieve base+index from the "stack"
-                self._file.writelines(['@R13\n','A=M\n','M=D\n'])
+                code += self._command[segment]
+                #Set D = base + index
+                code += ['@'+index+'\n','D=D+A\n']
+                #Use RAM[13] as storage for base+index
+                code += ['@R13\n','M=D\n']
+                #Pop actual top of stack
+                code += self._command['POP_D']
+                #Retrieve base+index from the "stack"
+                code += ['@R13\n','A=M\n','M=D\n']
             elif segment == 'static':
-                self._file.writelines(self._command['POP_D'])
-                self._file.writelines(['@' + self._name + '.'+ index +'\n','M=D\n'])
+                code += self._command['POP_D']
+                code += ['@' + self._name + '.'+ index +'\n','M=D\n']
+        return code
 
-    def write_label(self, label):
-        if self._current_function is None:
-            self._file.writelines(['('+label+')\n'])
+    def cost(self, code):
+        # number of Hack instructions, labels and comments take no ROM
+        return sum(1 for line in code if not line.startswith('(') and not line.startswith('//'))
+
+    # superinstructions, a window of parsed commands is translated as one unit
+
+    def direct(self, segment, index):
+        # symbol for segments whose address is known at translation time, otherwise None
+        if segment == 'static':
+            return self._name + '.' + index
+        elif segment == 'pointer':
+            return str(3 + int(index))
+        elif segment == 'temp':
+            return str(5 + int(index))
+        return None
+
+    def address_a(self, segment, index, chain = 3):
+        # set A to the address of segment index, D is only clobbered when index > chain
+        if self.direct(segment, index) is not None:
+            return ['@' + self.direct(segment, index) + '\n']
+        elif int(index) <= chain:
+            # base + index by incrementing A, '@LCL','A=M+1','A=A+1' for local 2
+            return ([self._command[segment][0], 'A=M\n' if index == '0' else 'A=M+1\n']
+                    + ['A=A+1\n'] * (int(index) - 1))
+        return self._command[segment] + ['@'+index+'\n','A=D+A\n']
+
+    def address_d(self, segment, index):
+        # set D to the address of segment index
+        return self._command[segment] + ['@'+index+'\n','D=D+A\n']
+
+    def load_d(self, segment, index):
+        # set D to the value of segment index
+        if segment == 'constant':
+            return ['@'+index+'\n','D=A\n']
+        return self.address_a(segment, index) + ['D=M\n']
+
+    def store_d(self, segment, index, load):
+        # run load, which sets D, then write D to segment index
+        if self.direct(segment, index) is not None or int(index) <= self._max_chain:
+            return load + self.address_a(segment, index, self._max_chain) + ['M=D\n']
+        # the address is computed first and kept in R13
+        return self.address_d(segment, index) + ['@R13\n','M=D\n'] + load + ['@R13\n','A=M\n','M=D\n']
+
+    def binary_d(self, first, second, op):
+        # set D to first op second, both operands are (segment, index)
+        if second[0] == 'constant':
+            return self.load_d(*first) + ['@'+second[1]+'\n', self._fused_op[op][0]]
+        # R13 may already hold the address of the destination, so the first operand is kept in R14
+        return self.load_d(*first) + ['@R14\n','M=D\n'] + self.load_d(*second) + ['@R14\n', self._fused_op[op][1]]
+
+    def write_fused(self, commands, i):
+        # translate an idiom starting at commands[i], returns the number of commands used (0 if none)
+        window = [command[1:] for command in commands[i:i+4]]
+        window += [(None, None, None)] * (4 - len(window))
+        first, second, third, fourth = window
+        if (first[0] == 'push' and first[1] != 'constant' and second[:2] == ('push','constant')
+                and second[2] == '1' and third[0] in ['add','sub'] and fourth == ('pop',) + first[1:]):
+            # push X; push constant 1; add|sub; pop X
+            code = self.address_a(*first[1:]) + ['M=M+1\n' if third[0] == 'add' else 'M=M-1\n']
+            idiom, size = 'inc', 4
+        elif (first[0] == 'push' and second[0] == 'push' and third[0] in self._fused_op
+                and fourth[0] == 'pop' and fourth[1] != 'constant'):
+            # push X; push Y; op; pop Z
+            code = self.store_d(fourth[1], fourth[2], self.binary_d(first[1:], second[1:], third[0]))
+            idiom, size = 'binary-pop', 4
+        elif first[0] == 'push' and second[0] == 'push' and third[0] in self._fused_op:
+            # push X; push Y; op
+            code = self.binary_d(first[1:], second[1:], third[0]) + self._command['PUSH_D']
+            idiom, size = 'binary', 3
+        elif first[0] == 'push' and second[0] == 'pop' and second[1] != 'constant':
+            # push X; pop Y
+            code = self.store_d(second[1], second[2], self.load_d(*first[1:]))
+            idiom, size = 'move', 2
         else:
-            self._file.writelines(['('+self._current_function + '$' + label + ')\n'])
-        pass
+            return 0
+        self._file.writelines(['// ' + '; '.join(' '.join(x for x in command if x) for command in window[:size]) + '\n'])
+        self._file.writelines(code)
+        self._fused[idiom] += 1
+        return size
+
+    def write_label(self, label):
+        self._file.writelines(['('+self.label_name(label)+')\n'])
 
     def write_goto(self, label):
         self._file.writelines(['//' + ' goto ' + label + '\n'])
-        if self._current_function is None:
-            self._file.writelines(['@'+label+'\n'])
-        else:
-            self._file.writelines(['@' + self._current_function + '$' + label + '\n'])
+        self._file.writelines(['@'+self.label_name(label)+'\n'])
         self._file.writelines(['0;JMP\n'])
-        pass
 
     def write_if(self, label):
         self._file.writelines(['//' + ' if-goto ' + label + '\n'])
         self._file.writelines(self._command['POP_D'])
-        if self._current_function is None:
-            self._file.writelines(['@'+label+'\n'])
-            self._file.writelines(['D;JNE\n'])
-        else:
-            self._file.writelines(['@' + self._current_function + '$' + label+'\n'])
-            self._file.writelines(['D;JNE\n'])
-        pass
+        self._file.writelines(['@'+self.label_name(label)+'\n'])
+        self._file.writelines(['D;JNE\n'])
 
     def write_call(self, name, nargs):
+        self._file.writelines(['//' + ' call ' + name + ' ' + nargs + '\n'])
         # Generate unique return address based off of counter
         self._file.writelines(['@CALL'+str(self._counter)+'\n','D=A\n'])
         # push saved lcl, arg, this, that to function frame on stack
@@ -142,7 +299,49 @@ class CodeWriter():
         self._file.writelines(['(CALL'+str(self._counter)+')\n'])
         self._counter += 1
 
+    def write_tail_call(self, name, nargs):
+        # 'call name nargs; return': the callee takes over the current frame and returns straight to our caller
+        self._file.writelines(['//' + ' tail call ' + name + ' ' + nargs + '\n'])
+        general = 'TAILCALL' + str(self._counter)
+        self._counter += 1
+        # when we were called with nargs arguments as well, our frame already sits at ARG+nargs
+        self._file.writelines(['@LCL\n','D=M\n','@ARG\n','D=D-M\n','@'+str(int(nargs) + 5)+'\n','D=D-A\n',
+                               '@'+general+'\n','D;JNE\n'])
+        # so only the arguments move down to ARG, SP goes back to LCL
+        self._file.writelines(['@'+nargs+'\n','D=A\n','@SP\n','D=M-D\n','@R13\n','M=D\n'])
+        self._file.writelines(['@ARG\n','D=M\n','@R14\n','M=D\n'])
+        self._file.writelines(self.copy_words(int(nargs)))
+        self._file.writelines(['@LCL\n','D=M\n','@SP\n','M=D\n','@'+name+'\n','0;JMP\n'])
+        # otherwise copy our frame (return address, LCL, ARG, THIS, THAT) from LCL-5 to just above the arguments
+        self._file.writelines(['('+general+')\n','@LCL\n','D=M\n','@5\n','D=D-A\n','@R13\n','M=D\n'])
+        self._file.writelines(['@SP\n','D=M\n','@R14\n','M=D\n'])
+        self._file.writelines(self.copy_words(5))
+        # move the arguments and the copied frame down to ARG, where the callee's frame starts
+        self._file.writelines(['@'+nargs+'\n','D=A\n','@SP\n','D=M-D\n','@R13\n','M=D\n'])
+        self._file.writelines(['@ARG\n','D=M\n','@R14\n','M=D\n'])
+        self._file.writelines(self.copy_words(int(nargs) + 5))
+        # R14 is now ARG+nargs+5, the callee's SP and LCL
+        self._file.writelines(['@R14\n','D=M\n','@SP\n','M=D\n','@LCL\n','M=D\n'])
+        self._file.writelines(['@'+name+'\n','0;JMP\n'])
+
+    def copy_words(self, count):
+        # copy count words from the address in R13 to the address in R14, moving upwards, either unrolled
+        # or as a loop counting down in R15, whichever costs less
+        word = ['@R13\n','AM=M+1\n','A=A-1\n','D=M\n','@R14\n','AM=M+1\n','A=A-1\n','M=D\n']
+        if count == 0:
+            return []
+        label = 'COPY' + str(self._counter)
+        loop = (['@'+str(count)+'\n','D=A\n','@R15\n','M=D\n','('+label+')\n'] + word
+                + ['@R15\n','MD=M-1\n','@'+label+'\n','D;JGT\n'])
+        unrolled_cost = self.cost(word) * count * (1 + self._cycle_weight)
+        loop_cost = self.cost(loop) + self._cycle_weight * (4 + 12 * count)
+        if unrolled_cost <= loop_cost:
+            return word * count
+        self._counter += 1
+        return loop
+
     def write_return(self):
+        self._file.writelines(['//' + ' return\n'])
         # Use R14 to store FRAME as defined on p.163
         self._file.writelines(['@LCL\n','D=M\n','@R14\n','M=D\n','@5\n'])
         # Use R15 to store the RET, note that D is still set to FRAME.
@@ -163,13 +362,38 @@ class CodeWriter():
         self._file.writelines(['//' + ' function ' + name + ' ' + nlocals + '\n'])
         self._file.writelines(['('+ name + ')\n'])
         self._current_function = name
-        for _ in range(int(nlocals)):
-            self.write_pushpop('C_PUSH', 'constant', '0')
+        self._file.writelines(self.zero_locals(int(nlocals)))
+
+    def zero_locals(self, nlocals):
+        # push nlocals zeros, either unrolled or as a loop, whichever costs less
+        if nlocals == 0:
+            return []
+        # unrolled: write M=0 up the stack, then move SP once
+        unrolled = ['@SP\n','A=M\n','M=0\n'] + ['A=A+1\n','M=0\n'] * (nlocals - 1)
+        if nlocals <= 3:
+            unrolled += ['@SP\n'] + ['M=M+1\n'] * nlocals
+        else:
+            unrolled += ['@'+str(nlocals)+'\n','D=A\n','@SP\n','M=D+M\n']
+        # loop: D counts down the locals left to push
+        label = 'LOCALS' + str(self._counter)
+        loop = ['@'+str(nlocals)+'\n','D=A\n','('+label+')\n',
+                '@SP\n','AM=M+1\n','A=A-1\n','M=0\n','@'+label+'\n','D=D-1;JGT\n']
+        # the unrolled code runs each instruction once, the loop body runs nlocals times
+        unrolled_cost = self.cost(unrolled) * (1 + self._cycle_weight)
+        loop_cost = self.cost(loop) + self._cycle_weight * (2 + 6 * nlocals)
+        if unrolled_cost <= loop_cost:
+            return unrolled
+        self._counter += 1
+        return loop
 
     def write_init(self):
         self._file.writelines(['@256\n','D=A\n','@SP\n','M=D\n'])
         self.write_call('Sys.init', '0')
 
     def close(self):
+        for key, (count, generic, selected) in sorted(self._costs.items()):
+            print(key + ':', count, 'commands,', generic, '->', selected, 'instructions')
+        print('Fused', sum(self._fused.values()), 'VM command sequences:',
+              ', '.join(idiom + ' ' + str(count) for idiom, count in self._fused.items()))
         self._file.writelines(['(END)\n', '@END\n', '0;JMP'])
         self._file.close()
@@ -0,0 +1,211 @@
+'''
+Module implementing the Linker, a pass over the whole .asm file written by the VM Translator.
+
+Code is compared after renaming the labels it defines to their order of appearance, so two copies that
+only differ in label numbers compare equal. Functions with the same code (e.g. getters of different
+classes) are kept once and calls to the other copies are redirected to it, which is repeated until no
+more functions merge. With share_stubs the code written for calls, returns and comparisons is also
+shared: repeated copies become a jump to one copy, which costs a few cycles each time, so this is only
+done for groups of copies where it saves ROM.
+
+To use this script run 'python linker.py <asm file> [--share-stubs]', the file is rewritten in place.
+'''
+
+import argparse
+
+# VM commands whose code can be shared between the places they are used
+STUBS = ['call', 'return', 'eq', 'gt', 'lt']
+
+
+def instructions(lines):
+    # the lines that take ROM
+    return [line for line in lines if not line.startswith('//') and not line.startswith('(')]
+
+
+def is_jump(line):
+    # unconditional jumps, '0;JMP' or the '0;JEQ' written for return
+    return line in ['0;JMP', '0;JEQ', '0;JGE', '0;JLE']
+
+
+class Linker():
+    '''
+    Reads a .asm file, merges duplicated code and writes it back, reporting the ROM saved.
+    '''
+
+    def __init__(self, filename, share_stubs = False):
+        self._filename = filename
+        with open(filename, 'r') as temp:
+            self._lines = [line.strip() for line in temp if line.strip()]
+        before = len(instructions(self._lines))
+        self._merged = 0
+        self._shared = 0
+        self._counter = 0
+        self.merge_functions()
+        if share_stubs:
+            self.share_stubs()
+        with open(filename, 'w') as temp:
+            temp.writelines(line + '\n' for line in self._lines)
+        after = len(instructions(self._lines))
+        print(filename + ':', 'merged', self._merged, 'duplicate functions,', 'shared', self._shared,
+              'stubs, ROM', before, '->', after, 'instructions (' + str(2 * (before - after)), 'bytes saved)')
+
+    def canonical(self, lines):
+        # the code of lines with the labels they define numbered in order of appearance, and those labels
+        defined = set(line[1:-1] for line in lines if line.startswith('('))
+        names = dict()
+        code = []
+        for line in lines:
+            if line.startswith('//'):
+                continue
+            name = line[1:-1] if line.startswith('(') else line[1:] if line.startswith('@') else None
+            if name in defined:
+                names.setdefault(name, len(names))
+                code.append(line[0] + '#' + str(names[name]) + line[len(name) + 1:])
+            else:
+                code.append(line)
+        return tuple(code), list(names)
+
+    def functions(self):
+        # the code before the first function, one list of lines per function and the end loop
+        units = [[]]
+        for line in self._lines:
+            if line.startswith('// function ') or line == '(END)':
+                units.append([])
+            units[-1].append(line)
+        return units
+
+    def merge_functions(self):
+        while True:
+            units = self.functions()
+            kept = dict()
+            aliases = dict()
+            lines = []
+            # last instruction kept so far
+            last = None
+            for i, unit in enumerate(units):
+                code, names = self.canonical(unit)
+                # a function can only go if nothing runs into it and it does not run into the next one
+                removable = 0 < i < len(units) - 1 and code and is_jump(code[-1]) and is_jump(last)
+                if removable and code in kept:
+                    aliases.update(zip(names, kept[code]))
+                    lines.append(unit[0] + ' (same code as ' + kept[code][0] + ')')
+                    self._merged += 1
+                else:
+                    kept.setdefault(code, names)
+                    lines += unit
+                    last = instructions(unit)[-1] if instructions(unit) else last
+            self._lines = [self.rename(line, aliases) for line in lines]
+            if not aliases:
+                return
+
+    def rename(self, line, aliases):
+        if line.startswith('@') and line[1:] in aliases:
+            return '@' + aliases[line[1:]]
+        return line
+
+    # stubs
+
+    def stub_blocks(self):
+        # (start, end) of the code written for each call, return and comparison, from its comment up to
+        # the next comment or a label it does not use
+        blocks = []
+        i = 0
+        while i < len(self._lines):
+            line = self._lines[i]
+            if not line.startswith('//') or (line[2:].split() or [None])[0] not in STUBS:
+                i += 1
+                continue
+            start = i
+            used = set()
+            i += 1
+            while i < len(self._lines) and not self._lines[i].startswith('//'):
+                line = self._lines[i]
+                if line.startswith('(') and line[1:-1] not in used:
+                    break
+                if line.startswith('@'):
+                    used.add(line[1:])
+                i += 1
+                if line == '(' + self._lines[start + 1][1:] + ')':
+                    # the return address of a call ends it
+                    break
+            blocks.append((start, i))
+        return blocks
+
+    def shape(self, block, names):
+        # how copies of block can be shared, None if they cannot
+        code = block[1:]
+        if not code:
+            return None
+        if not names and is_jump(code[-1]):
+            # e.g. return: the first copy stays, the others jump to it
+            return 'jump'
+        if (len(code) > 3 and names == [code[0][1:]] and code[1] == 'D=A' and code[-1] == '(' + names[0] + ')'
+                and is_jump(code[-2])):
+            # call: D holds the return address, the stub pushes the frame and jumps to the function
+            return 'call'
+        jumps_out = any(';' in line and (i == 0 or code[i - 1][1:] not in names) for i, line in enumerate(code))
+        if not jumps_out and not any('R15' in line for line in code):
+            # e.g. comparisons: runs into the next command, so the stub returns through R15
+            return 'wrap'
+        return None
+
+    def saving(self, shape, copies, size):
+        # ROM saved by sharing copies of a block of size instructions
+        if shape == 'jump':
+            return (copies - 1) * (size - 2)
+        elif shape == 'call':
+            return copies * size - 4 * copies - (size - 2)
+        return copies * size - 4 * copies - (size + 5)
+
+    def share_stubs(self):
+        groups = dict()
+        for start, end in self.stub_blocks():
+            code, names = self.canonical(self._lines[start:end])
+            groups.setdefault(code, []).append((start, end, names))
+        replaced = dict()
+        stubs = []
+        for code, sites in groups.items():
+            first = self._lines[sites[0][0]:sites[0][1]]
+            shape = self.shape(first, sites[0][2])
+            if shape is None or len(sites) < 2 or self.saving(shape, len(sites), len(instructions(first))) <= 0:
+                continue
+            stub = 'LINK$STUB' + str(self._counter)
+            self._counter += 1
+            if shape == 'jump':
+                replaced[sites[0][0]] = (sites[0][1], [first[0], '(' + stub + ')'] + first[1:])
+                sites = sites[1:]
+            elif shape == 'call':
+                stubs += ['(' + stub + ')'] + first[3:-1]
+            else:
+                stubs += ['(' + stub + ')', '@R15', 'M=D'] + first[1:] + ['@R15', 'A=M', '0;JMP']
+            for start, end, names in sites:
+                if shape == 'jump':
+                    code = ['@' + stub, '0;JMP']
+                elif shape == 'call':
+                    code = ['@' + names[0], 'D=A', '@' + stub, '0;JMP', '(' + names[0] + ')']
+                else:
+                    back = 'LINK$RET' + str(self._counter)
+                    self._counter += 1
+                    code = ['@' + back, 'D=A', '@' + stub, '0;JMP', '(' + back + ')']
+                replaced[start] = (end, [self._lines[start]] + code)
+                self._shared += 1
+        lines = []
+        i = 0
+        while i < len(self._lines):
+            if i in replaced:
+                i, code = replaced[i]
+                lines += code
+            else:
+                lines.append(self._lines[i])
+                i += 1
+        # the stubs go after the end loop, where nothing runs into them
+        self._lines = lines + stubs
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Merges duplicated code in a Hack .asm file.')
+    arguments.add_argument('filename', help='.asm file written by the VM Translator')
+    arguments.add_argument('--share-stubs', action='store_true',
+                           help='share the code of calls, returns and comparisons where that saves ROM')
+    options = arguments.parse_args()
+    Linker(options.filename, options.share_stubs)
@@ -0,0 +1,409 @@
+"""
+Optimizes .vm code before it is handed to the VM Translator, the output is written back to the input files.
+
+To use this script run:
+	- optimizer.py <directory>
+	- optimizer.py <vm file>
+
+Options:
+	--inline N    inline functions of at most N commands at their call sites (default 8, 0 turns inlining off)
+"""
+
+import sys, os, io, argparse, tempfile
+from contextlib import redirect_stdout
+from parser import Parser
+from VMTranslator import VMTranslator
+
+
+class BasicBlock():
+    '''
+    A straight-line run of VM commands. Control can only enter through the leading labels and can only
+    leave through the exit command (goto, if-goto or return) or by falling through to the next block.
+    '''
+
+    def __init__(self):
+        self.labels = []
+        self.body = []
+        self.exit = None
+
+    def commands(self):
+        temp = [('label', label, None) for label in self.labels] + self.body
+        if self.exit is not None:
+            temp.append(self.exit)
+        return temp
+
+    def falls_through(self):
+        return self.exit is None or self.exit[0] == 'if-goto'
+
+
+class VMOptimizer():
+    '''
+    Loads each .vm file with the Parser, splits every function into basic blocks and applies rewrite
+    rules until none of them change the code:
+        - Peephole: 'push X; pop X' removal and constant folding inside each block
+        - Jump threading: jumps to a label that only jumps on are sent to the final target
+        - Reachability: blocks that can never be entered are dropped, as are unused labels
+    Before that, small functions are inlined across all of the files given, see inline. Functions no
+    longer called are only dropped when a directory is given, as other files may call a single file's.
+    '''
+
+    def __init__(self, filename, inline = 8):
+        # a directory is a whole program, other files may call the functions of a single file
+        self._whole_program = os.path.isdir(filename)
+        if self._whole_program:
+            self._files = [filename + '/' + x for x in os.listdir(filename) if x.endswith(".vm")]
+        elif os.path.isfile(filename) and filename.endswith('.vm'):
+            self._files = [filename]
+        else:
+            self._files = list()
+        self._binary = {'add': lambda x, y: x + y, 'sub': lambda x, y: x - y,
+                        'and': lambda x, y: x & y, 'or': lambda x, y: x | y,
+                        'eq': lambda x, y: -1 if x == y else 0,
+                        'gt': lambda x, y: -1 if x > y else 0,
+                        'lt': lambda x, y: -1 if x < y else 0}
+        self._unary = {'neg': lambda x: -x, 'not': lambda x: ~x}
+        # temp 0 and 1 are used by the compiler, arguments of inlined functions are kept in temp 2-7
+        self._inline_temp = 2
+        # signatures of the Jack classes the .vm files were compiled from, if they are next to them
+        self._index = self.load_index(filename)
+        programs = {file: self.load(file) for file in self._files}
+        original = dict(programs)
+        if inline:
+            self.inline(programs, inline)
+        for file in self._files:
+            optimized = self.optimize(programs[file])
+            self.write(file, optimized)
+            print(file.split('/')[-1] + ':', len(original[file]), '->', len(optimized),
+                  'VM commands (' + str(len(optimized) - len(original[file])) + ')')
+            programs[file] = optimized
+        if inline and self._files:
+            print('ROM:', self.rom_size(original), '->', self.rom_size(programs), 'instructions')
+
+    def load_index(self, filename):
+        # the Compiler's ClassIndex of the .jack files in the directory, None if there are none
+        directory = filename if os.path.isdir(filename) else os.path.dirname(filename) or '.'
+        if not os.path.isdir(directory) or not any(x.endswith('.jack') for x in os.listdir(directory)):
+            return None
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Compiler'))
+        from classindex import ClassIndex
+        return ClassIndex(directory)
+
+    def load(self, filename):
+        # parse the file into a list of (command, arg1, arg2) tuples
+        parser = Parser(filename)
+        commands = []
+        while parser.has_more_commands():
+            parser.advance()
+            if parser.command_type() is not None:
+                commands.append((parser.command(), parser.arg1(), parser.arg2()))
+        return commands
+
+    def write(self, filename, commands):
+        with open(filename, 'w') as temp:
+            temp.writelines([' '.join(x for x in command if x is not None) + '\n' for command in commands])
+
+    # inlining
+
+    def inline(self, programs, threshold):
+        # replace calls to small leaf functions by the function body, programs maps filename to commands
+        functions = dict()
+        for file, commands in programs.items():
+            for function in self.split_functions(commands):
+                if function[0][0] == 'function' and self.inlinable(function, threshold):
+                    functions[function[0][1]] = (file, function)
+        inlined = dict()
+        for file, commands in programs.items():
+            output = []
+            skip = False
+            for i, command in enumerate(commands):
+                if skip:
+                    skip = False
+                    continue
+                callee = functions.get(command[1]) if command[0] == 'call' else None
+                if callee is None or (callee[0] != file and self.uses_static(callee[1])):
+                    # static variables belong to the file of the callee
+                    output.append(command)
+                    continue
+                if self._index is not None and self._index.nargs(command[1]) not in [None, int(command[2])]:
+                    # the call does not match the callee's signature
+                    output.append(command)
+                    continue
+                output += self.inline_call(callee[1], int(command[2]))
+                if self.discards_result(command[1], commands[i + 1:i + 2], output):
+                    # 'do f()' of a void function: its 'push constant 0' and the caller's 'pop temp 0' go
+                    output.pop()
+                    skip = True
+                inlined[command[1]] = (inlined.get(command[1], (0,))[0] + 1, command[2])
+            programs[file] = output
+        if self._whole_program:
+            # functions that are no longer called anywhere in the program are dropped
+            called = set(command[1] for commands in programs.values() for command in commands
+                         if command[0] == 'call')
+            for file, commands in programs.items():
+                functions_left = [x for x in self.split_functions(commands)
+                                  if x[0][0] != 'function' or x[0][1] not in inlined or x[0][1] in called]
+                programs[file] = [command for function in functions_left for command in function]
+        for name, (count, nargs) in sorted(inlined.items()):
+            file, function = functions[name]
+            before = self.hack_cost([('call', name, nargs)]) + self.hack_cost(function[1:])
+            after = self.hack_cost(self.inline_call(function, int(nargs)))
+            print('inlined', name, 'at', count, 'call sites,', before, '->', after, 'cycles per call')
+
+    def inlinable(self, function, threshold):
+        # straight-line functions without locals or calls, ending in their only return
+        body = function[1:]
+        if function[0][2] != '0' or len(body) - 1 > threshold or body[-1][0] != 'return':
+            return False
+        for command in body[:-1]:
+            if command[0] in ['label', 'goto', 'if-goto', 'call', 'function', 'return']:
+                return False
+            if command[1] == 'temp' or (command[1] == 'argument' and int(command[2]) + self._inline_temp > 7):
+                return False
+        return True
+
+    def discards_result(self, name, following, output):
+        # the inlined code of a void function ends by pushing its return value 0, which the caller drops
+        if self._index is None or following != [('pop', 'temp', '0')] or output[-1] != ('push', 'constant', '0'):
+            return False
+        class_name, _, subroutine = name.partition('.')
+        signature = self._index.lookup(class_name, subroutine)
+        return signature is not None and signature.type == 'void'
+
+    def uses_static(self, function):
+        return any(command[1] == 'static' for command in function)
+
+    def inline_call(self, function, nargs):
+        # the arguments are popped into temp, pointers the body changes are saved on the stack
+        output = [('pop', 'temp', str(self._inline_temp + i)) for i in reversed(range(nargs))]
+        saved = sorted(set(x[2] for x in function[1:] if x[:2] == ('pop', 'pointer')))
+        output += [('push', 'pointer', x) for x in saved]
+        for command in function[1:-1]:
+            if command[1] == 'argument':
+                command = (command[0], 'temp', str(self._inline_temp + int(command[2])))
+            output.append(command)
+        if saved:
+            # move the return value above the saved pointers
+            output.append(('pop', 'temp', str(self._inline_temp)))
+            output += [('pop', 'pointer', x) for x in reversed(saved)]
+            output.append(('push', 'temp', str(self._inline_temp)))
+        return output
+
+    def hack_cost(self, commands):
+        # Hack instructions written by the VM Translator for commands, less the final (END) loop
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'Cost.vm')
+            self.write(filename, commands)
+            with redirect_stdout(io.StringIO()):
+                VMTranslator(filename)
+            return self.count_instructions(filename.replace('.vm', '.asm')) - 2
+
+    def rom_size(self, programs):
+        # Hack instructions for a whole program, including the bootstrap code
+        with tempfile.TemporaryDirectory() as directory:
+            for file, commands in programs.items():
+                self.write(os.path.join(directory, file.split('/')[-1]), commands)
+            with redirect_stdout(io.StringIO()):
+                VMTranslator(directory)
+            return self.count_instructions(directory + '/' + directory.split('/')[-1] + '.asm')
+
+    def count_instructions(self, filename):
+        with open(filename, 'r') as temp:
+            return sum(1 for line in temp if line.strip() and line[0] not in '(/')
+
+    def optimize(self, commands):
+        output = []
+        for function in self.split_functions(commands):
+            if function[0][0] != 'function':
+                # code outside of any function is left alone
+                output += function
+                continue
+            blocks = self.basic_blocks(function[1:])
+            changed = True
+            while changed:
+                changed = False
+                for block in blocks:
+                    changed |= self.peephole(block)
+                changed |= self.thread_jumps(blocks)
+                changed |= self.remove_unreachable(blocks)
+                changed |= self.remove_fallthrough_gotos(blocks)
+                changed |= self.remove_unused_labels(blocks)
+                merged = self.merge_blocks(blocks)
+                changed |= len(merged) != len(blocks)
+                blocks = merged
+            output.append(function[0])
+            for block in blocks:
+                output += block.commands()
+        return output
+
+    def split_functions(self, commands):
+        functions = []
+        for command in commands:
+            if command[0] == 'function' or not functions:
+                functions.append([])
+            functions[-1].append(command)
+        return functions
+
+    def basic_blocks(self, commands):
+        blocks = [BasicBlock()]
+        for command in commands:
+            if command[0] == 'label':
+                if blocks[-1].body or blocks[-1].exit:
+                    blocks.append(BasicBlock())
+                blocks[-1].labels.append(command[1])
+            elif command[0] in ['goto', 'if-goto', 'return']:
+                blocks[-1].exit = command
+                blocks.append(BasicBlock())
+            else:
+                blocks[-1].body.append(command)
+        return blocks
+
+    def merge_blocks(self, blocks):
+        # drops empty blocks and joins a block without labels onto the block falling into it
+        merged = []
+        for block in blocks:
+            if not (block.labels or block.body or block.exit):
+                continue
+            if merged and not block.labels and merged[-1].exit is None:
+                merged[-1].body += block.body
+                merged[-1].exit = block.exit
+            else:
+                merged.append(block)
+        return merged
+
+    # constants are tracked as 16-bit signed values
+
+    def to_word(self, value):
+        value &= 0xFFFF
+        return value - 0x10000 if value > 32767 else value
+
+    def constant_at(self, commands, i):
+        # returns (value, length) if a constant is pushed starting at commands[i]
+        if commands[i][:2] != ('push', 'constant'):
+            return None
+        value = int(commands[i][2])
+        if i + 1 < len(commands) and commands[i + 1][0] in self._unary:
+            return self.to_word(self._unary[commands[i + 1][0]](value)), 2
+        return value, 1
+
+    def push_constant(self, value):
+        # shortest sequence pushing value, the VM only allows non-negative constants
+        value = self.to_word(value)
+        if value >= 0:
+            return [('push', 'constant', str(value))]
+        elif value == -32768:
+            return [('push', 'constant', '32767'), ('not', None, None)]
+        return [('push', 'constant', str(-value)), ('neg', None, None)]
+
+    def peephole(self, block):
+        changed = False
+        commands = block.body
+        i = 0
+        while i < len(commands):
+            first = self.constant_at(commands, i)
+            if (i + 1 < len(commands) and commands[i][0] == 'push' and commands[i][1] != 'constant'
+                    and commands[i + 1] == ('pop',) + commands[i][1:]):
+                # push X; pop X
+                del commands[i:i + 2]
+            elif i + 1 < len(commands) and commands[i][0] in ['not', 'neg'] and commands[i + 1][0] == commands[i][0]:
+                # not; not or neg; neg
+                del commands[i:i + 2]
+            elif first is not None and i + first[1] < len(commands) and commands[i + first[1]][0] in self._unary:
+                # constant; unary op
+                value = self.to_word(self._unary[commands[i + first[1]][0]](first[0]))
+                replacement = self.push_constant(value)
+                if len(replacement) >= first[1] + 1:
+                    i += 1
+                    continue
+                commands[i:i + first[1] + 1] = replacement
+            elif first is not None and i + first[1] < len(commands) and self.constant_at(commands, i + first[1]):
+                second = self.constant_at(commands, i + first[1])
+                end = i + first[1] + second[1]
+                if end < len(commands) and commands[end][0] in self._binary:
+                    # constant; constant; binary op
+                    value = self._binary[commands[end][0]](first[0], second[0])
+                    commands[i:end + 1] = self.push_constant(value)
+                else:
+                    i += 1
+                    continue
+            elif first is not None and i + first[1] == len(commands) and block.exit and block.exit[0] == 'if-goto':
+                # constant; if-goto becomes either goto or nothing
+                del commands[i:]
+                block.exit = ('goto', block.exit[1], None) if first[0] != 0 else None
+            else:
+                i += 1
+                continue
+            changed = True
+            i = max(i - 2, 0)
+        return changed
+
+    def label_blocks(self, blocks):
+        return {label: block for block in blocks for label in block.labels}
+
+    def thread_jumps(self, blocks):
+        # a jump to a block that is nothing but a goto can jump straight to its target
+        changed = False
+        targets = self.label_blocks(blocks)
+        for block in blocks:
+            if block.exit is None or block.exit[0] == 'return':
+                continue
+            label = block.exit[1]
+            seen = set()
+            while (label not in seen and not targets[label].body and targets[label].exit
+                   and targets[label].exit[0] == 'goto'):
+                seen.add(label)
+                label = targets[label].exit[1]
+            if label != block.exit[1]:
+                block.exit = (block.exit[0], label, None)
+                changed = True
+        return changed
+
+    def remove_unreachable(self, blocks):
+        targets = self.label_blocks(blocks)
+        position = {id(block): i for i, block in enumerate(blocks)}
+        reachable = set()
+        todo = [0]
+        while todo:
+            i = todo.pop()
+            if i >= len(blocks) or i in reachable:
+                continue
+            reachable.add(i)
+            block = blocks[i]
+            if block.falls_through():
+                todo.append(i + 1)
+            if block.exit is not None and block.exit[0] != 'return':
+                todo.append(position[id(targets[block.exit[1]])])
+        changed = False
+        for i, block in enumerate(blocks):
+            if i not in reachable and (block.labels or block.body or block.exit):
+                block.labels, block.body, block.exit = [], [], None
+                changed = True
+        return changed
+
+    def remove_fallthrough_gotos(self, blocks):
+        # goto L; label L
+        changed = False
+        blocks = [x for x in blocks if x.labels or x.body or x.exit]
+        for block, following in zip(blocks, blocks[1:]):
+            if block.exit and block.exit[0] == 'goto' and block.exit[1] in following.labels:
+                block.exit = None
+                changed = True
+        return changed
+
+    def remove_unused_labels(self, blocks):
+        used = set(block.exit[1] for block in blocks if block.exit and block.exit[0] != 'return')
+        changed = False
+        for block in blocks:
+            labels = [x for x in block.labels if x in used]
+            if labels != block.labels:
+                block.labels = labels
+                changed = True
+        return changed
+
+
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser(description='Optimizes .vm files in place.')
+    arguments.add_argument('filename', nargs='?', default='', help='.vm file or directory of .vm files')
+    arguments.add_argument('--inline', type=int, default=8, metavar='N',
+                           help='inline functions of at most N commands, 0 turns inlining off')
+    options = arguments.parse_args()
+    VMOptimizer(options.filename, options.inline)
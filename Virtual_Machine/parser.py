@@ -59,6 +59,15 @@ class Parser():
             except IndexError:
                 self._arg2 = None
 
+    def commands(self):
+        # the remaining commands as a list of (type, command, arg1, arg2) tuples
+        temp = []
+        while self.has_more_commands():
+            self.advance()
+            if self._type is not None:
+                temp.append((self._type, self._call, self._arg1, self._arg2))
+        return temp
+
     def command_type(self):
         return self._type
 